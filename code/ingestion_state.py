@@ -0,0 +1,139 @@
+"""
+Persisted state of the incremental update of the meetings data (see vlaams_parlement_API_update_data.py).
+
+For each commission, the state holds:
+    * the ids of all meetings (idVerg) that are already ingested
+    * a high-water mark: the date of the most recent ingested meeting
+
+The update script only searches for meetings from the high-water mark of each commission onwards,
+only fetches the details of meeting ids that are not ingested yet, and appends them to the data.
+So the cost of an update depends on the amount of new meetings, not on the size of the history.
+
+Stored as json: {"commissions": {"<commissie.id>": {"watermark": "YYYY-MM-DD", "meeting_ids": [...]}}}
+"""
+import json
+import os
+import tempfile
+from datetime import date
+
+import pandas as pd
+
+
+default_state_path = "../data/ingestion_state.json"
+
+
+def meeting_id_from_index(index_label: str) -> int:
+    """
+    Obtain meeting id out of index of meetings dataframe (e.g. 'Vergadering 1622819' -> 1622819)
+    """
+    return int(index_label.rsplit(" ", 1)[-1])
+
+
+def state_from_meetings(meetings_all_commissions_df, commissions_overview_df):
+    """
+    Build state out of existing meetings dataframe (e.g. when no state file exists yet)
+    """
+    # Map commission titles to ids (meetings dataframe only contains the title)
+    title_to_id = dict(zip(commissions_overview_df["commissie.titel"], commissions_overview_df["commissie.id"]))
+
+    state = {"commissions": {}}
+    for commission_title, meetings_spec_comm_df in meetings_all_commissions_df.groupby("commissie.titel", sort=False):
+        commission_id = title_to_id.get(commission_title)
+        if commission_id is None:
+            # Commission no longer exists (e.g. previous legislature): no more meetings to expect
+            continue
+        state["commissions"][str(commission_id)] = {
+            "watermark": max(meetings_spec_comm_df["Datum vergadering"]).isoformat(),
+            "meeting_ids": sorted({meeting_id_from_index(label) for label in meetings_spec_comm_df.index}),
+        }
+    return state
+
+
+def state_matches_meetings(state, meetings_all_commissions_df, commissions_overview_df):
+    """
+    Check whether state was written along the meetings dataframe (and not e.g. by an extraction whose output was not
+    put in place): for each commission of state, the amount of meeting ids and the high-water mark must equal the
+    amount of distinct meetings and the date of the most recent meeting of that commission in the dataframe
+    """
+    title_to_id = dict(zip(commissions_overview_df["commissie.titel"], commissions_overview_df["commissie.id"]))
+    commission_ids = meetings_all_commissions_df["commissie.titel"].map(title_to_id)
+    is_known = commission_ids.notna().to_numpy()
+    grouped = pd.DataFrame({"commission_id": commission_ids[is_known].astype("int64").astype(str).to_numpy(),
+                            "meeting": meetings_all_commissions_df.index[is_known],
+                            "date": meetings_all_commissions_df["Datum vergadering"].to_numpy()[is_known]}).groupby("commission_id")
+    amounts = grouped["meeting"].nunique()
+    watermarks = grouped["date"].max()
+    for commission_id, commission_state in state["commissions"].items():
+        if len(commission_state["meeting_ids"]) != amounts.get(commission_id, 0):
+            return False
+        watermark = watermarks.get(commission_id)
+        if (watermark.isoformat() if watermark is not None else None) != commission_state["watermark"]:
+            return False
+    # Commissions with meetings in the dataframe but not in state would be ingested again
+    return set(amounts.index).issubset(state["commissions"])
+
+
+def load_state(path=default_state_path, meetings_all_commissions_df=None, commissions_overview_df=None):
+    """
+    Load state from path. If not available, or if it does not match the current meetings dataframe (if provided, see
+    state_matches_meetings()), build it from that dataframe.
+    """
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            state = json.load(file)
+        if meetings_all_commissions_df is None or state_matches_meetings(state, meetings_all_commissions_df, commissions_overview_df):
+            return state
+        print(f"Ingestion state at {path} does not match the current meetings: building it from current meetings.")
+        return state_from_meetings(meetings_all_commissions_df, commissions_overview_df)
+    if meetings_all_commissions_df is not None:
+        print(f"No ingestion state found at {path}: building it from current meetings.")
+        return state_from_meetings(meetings_all_commissions_df, commissions_overview_df)
+    return {"commissions": {}}
+
+
+def save_state(state, path=default_state_path):
+    """
+    Save state atomically (write to temporary file and rename), so an interrupted run never leaves a corrupt state
+    """
+    directory = os.path.dirname(path) or "."
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+        json.dump(state, file, indent=1)
+    os.replace(temp_path, path)
+
+
+def get_watermark(state, commission_id):
+    """
+    Return date of most recent ingested meeting of commission (None if nothing ingested yet)
+    """
+    commission_state = state["commissions"].get(str(commission_id))
+    if commission_state is None or commission_state["watermark"] is None:
+        return None
+    return date.fromisoformat(commission_state["watermark"])
+
+
+def get_ingested_ids(state, commission_id) -> set:
+    commission_state = state["commissions"].get(str(commission_id))
+    return set(commission_state["meeting_ids"]) if commission_state else set()
+
+
+def new_meeting_ids(state, commission_id, meeting_ids) -> list:
+    """
+    Obtain meeting ids (e.g. found by the search of the update) that are not ingested yet for commission,
+    each only once and in their original order
+    """
+    ingested_ids = get_ingested_ids(state, commission_id)
+    return [meeting_id for meeting_id in dict.fromkeys(meeting_ids) if meeting_id not in ingested_ids]
+
+
+def register_meetings(state, commission_id, meeting_ids, meeting_dates):
+    """
+    Add newly ingested meetings of commission to state, and move its high-water mark
+    """
+    commission_state = state["commissions"].setdefault(str(commission_id), {"watermark": None, "meeting_ids": []})
+    commission_state["meeting_ids"] = sorted(set(commission_state["meeting_ids"]).union(meeting_ids))
+    dates = [d.isoformat() for d in meeting_dates]
+    if commission_state["watermark"] is not None:
+        dates.append(commission_state["watermark"])
+    if dates:
+        commission_state["watermark"] = max(dates)
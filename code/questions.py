@@ -16,7 +16,8 @@ import pickle
 
 from collections import defaultdict
 
-import requests
+import vlpar_api # shared API client (connection pooling, timeouts, retries and rate limiting)
+vlpar_api.configure_from_command_line() # use on-disk cache of responses (see --replay and --no-cache)
 
 from datetime import datetime
 import locale # to allow date parsing for dates in Dutch
@@ -27,6 +28,10 @@ import matplotlib.pyplot as plt
 
 import copy
 
+import sys
+sys.path.append('../dash') # to reuse modules of dash application (e.g. member_registry)
+import member_registry # lookups of members by name or id
+
 
 # In[2]:
 
@@ -42,6 +47,8 @@ InteractiveShell.ast_node_interactivity = "all"
 # Read in list of members and their parties to later on do mapping
 with open('../data/parlementsleden.pkl', 'rb') as file:
     parlementsleden_all_dict = pickle.load(file)
+# Registry of these members, to look up members by name in constant time
+parlementsleden_registry = member_registry.MemberRegistry(parlementsleden_all_dict)
 
 
 # Interesting fields for questions:
@@ -65,18 +72,11 @@ with open('../data/parlementsleden.pkl', 'rb') as file:
 
 def get_request(url_query:str):
     """
-    Parse data from search query using url
+    Parse data from search query using url. 
+    Uses the shared API client, which retries failed requests and raises VlparAPIError if the request keeps failing.
     """
     # Make the GET request, specifing you want to use json as header, instead of xml
-    response = requests.get(url_query, headers = {"Accept": "application/json"})
-
-    # Check if the request was successful (status code 200)
-    if response.status_code == 200:
-        data = response.json()  # Parse JSON response
-    else:
-        print(f"Failed to fetch data. Status code: {response.status_code}")
-
-    return data
+    return vlpar_api.get_json(url_query, headers = {"Accept": "application/json"})
 
 
 # In[5]:
@@ -196,17 +196,14 @@ details_questions_term_df['vraagsteller'] = details_questions_term_df['vraagstel
 
 # Function to map member to party
 def map_member_to_party(member):
-    for key, value in parlementsleden_all_dict.items():
-        if value[0] == member:
-            return value[1]
-    return None  # Handle the case where member is not found
+    return parlementsleden_registry.party_of(member)  # None if member is not found
 
 
 # In[11]:
 
 
-# Map member to party
-details_questions_term_df['vraagsteller_partij'] = details_questions_term_df['vraagsteller'].map(map_member_to_party)
+# Map member to party (all members looked up at once, None if not found)
+details_questions_term_df['vraagsteller_partij'] = parlementsleden_registry.map_parties(details_questions_term_df['vraagsteller']).to_numpy()
 
 
 # In[15]:
@@ -32,8 +32,6 @@ import pickle
 
 from collections import defaultdict
 
-import requests
-
 from datetime import datetime
 import locale # to allow date parsing for dates in Dutch
 
@@ -43,6 +41,15 @@ import matplotlib.pyplot as plt
 
 import copy
 
+import sys
+sys.path.append('../dash') # to reuse modules of dash application (e.g. attendance_facts)
+import attendance_facts # long format fact table of attendance
+import attendance_cube # monthly pre-aggregated counts of attendance
+import columnar_data # Parquet version of the data (read by the dash application)
+import ingestion_state # persisted meeting ids and per-commission high-water marks for incremental updates
+import member_registry # members of parliament by id and by name
+import membership_intervals # periods in which members were permanent member of each commission
+
 
 # In[3]:
 
@@ -62,8 +69,13 @@ today_str
 # In[5]:
 
 
-# Set base_url of api
-base_url = "https://ws.vlpar.be/e/opendata"
+# Use shared API client (connection pooling, timeouts, retries and rate limiting) for all API calls
+import vlpar_api
+from vlpar_api import (get_endpoint, extract_previous_meeting_ids_zoek, 
+                       fetch_meeting_details_concurrently, max_workers_meeting_details)
+
+# Use on-disk cache of API responses. Run with '--replay' to only use cached responses (no network), or '--no-cache' to disable.
+vlpar_api.configure_from_command_line()
 
 
 # The webpage of the API shows some interesting fields:
@@ -81,20 +93,6 @@ base_url = "https://ws.vlpar.be/e/opendata"
 # In[6]:
 
 
-def get_endpoint(endpoint: str):
-    """
-    Return data available at inserted endpoint
-    """
-    # Make the GET request
-    response = requests.get(f"{base_url}{endpoint}")
-
-    # Check if the request was successful (status code 200)
-    if response.status_code == 200:
-        data = response.json()  # Parse JSON response
-    else:
-        print(f"Failed to fetch data. Status code: {response.status_code}")
-
-    return data
 
 
 # ## Members and parties
@@ -416,6 +414,27 @@ end_str = end.strftime("%Y-%m-%d")
 end_str
 
 
+# Permanent members are tagged by the composition of the commissions on the date of each meeting, instead of by the current composition (see `membership_intervals.py`). The composition observed today is added to the membership intervals stored so far (or, if none are stored yet, to the intervals built out of the earlier dated overviews). Earlier meetings are judged against the earliest composition known. 
+
+# In[25b]:
+
+
+# Registry to look up the ids of the permanent members (by name), completed with the members seen in the attendance so far (if any)
+registry_members = member_registry.MemberRegistry(parlementsleden_all_dict, fracties_dict)
+try:
+    _, attendance_members_df_current = attendance_facts.load_attendance_facts(data_dir='../data')
+except FileNotFoundError:
+    attendance_members_df_current = None
+
+membership_intervals_df = membership_intervals.load_membership_intervals(data_dir='../data')
+if membership_intervals_df is None:
+    membership_intervals_df = membership_intervals.build_membership_intervals(
+        membership_intervals.read_composition_snapshots(data_dir='../data'), registry_members, attendance_members_df_current)
+membership_intervals_df = membership_intervals.update_membership_intervals(
+    membership_intervals_df, commissions_overview_df, end, registry_members, attendance_members_df_current)
+membership_intervals_index = membership_intervals.MembershipIntervals(membership_intervals_df)
+
+
 # In[26]:
 
 
@@ -426,56 +445,11 @@ end_str
 # # ========================= DEVELOPMENT ==============================================
 
 
-# Then we obtain all previous meetings for a specific commission, for a certain time frame. First, we create a helper function to extract the meeting id's of all relevant meetings (`extract_previous_meeting_ids_zoek()`). Then we use another helper function to use those meeting id's to extract the attendance information on all those meetings (`extract_meeting_details()`). 
+# Then we obtain all previous meetings for a specific commission, for a certain time frame. First, we create a helper function to extract the meeting id's of all relevant meetings (`extract_previous_meeting_ids_zoek()`, see `vlpar_api.py`). Then we use another helper function to use those meeting id's to extract the attendance information on all those meetings (`extract_meeting_details()`), requested in parallel for all meetings through `fetch_meeting_details_concurrently()`. 
 
 # In[27]:
 
 
-def extract_previous_meeting_ids_zoek(start_date, end_date, commission_id):
-    # Convert dates to the required format (ddmmyyyy)
-    start_date_str = start_date.strftime("%d%m%Y")
-    end_date_str = end_date.strftime("%d%m%Y")
-
-    # API endpoint and parameters
-    endpoint = '/verg/zoek/datums'
-    params = {
-        'type': 'comm',  # Choosing plenaire meetings
-        'datumVan': start_date_str,
-        'datumTot': end_date_str,
-        'idComm': commission_id  # Specific commission ID
-    }
-
-    response = requests.get(base_url + endpoint, params=params)
-
-    if response.status_code == 200:
-        # Process the response data (e.g., extract meetings)
-        meetings = response.json()  # Assuming the response is in JSON format
-        
-        # Obtain meeting ids of all relevant meetings
-        meeting_ids = [item['vergadering']['id'] for item in meetings['items']]
-        
-        return meeting_ids
-    else:
-        print(f"Failed to fetch meetings. Status code: {response.status_code}")
-        return None
-
-
-# In[28]:
-
-
-def extract_meeting_details(idVerg:int):
-    # API endpoint and parameters
-    endpoint = f'/verg/{idVerg}'
-    params = {
-        'idVerg': idVerg  # Specific meeting ID
-    }
-
-    response = requests.get(base_url + endpoint, params=params)
-
-    if response.status_code == 200:
-        # Process the response data (e.g., extract meeting details)
-        meeting_details = response.json()  # Assuming the response is in JSON format
-        return meeting_details
 
 
 # Then we apply both functions to obtain all attendance information for all relevant meetings for all commissions, and store them in a dict.  
@@ -486,29 +460,38 @@ def extract_meeting_details(idVerg:int):
 # Create empty column to store total of meetings for commission in relevant timeframe
 commissions_overview_df["aantal vergaderingen"] = ''
 
+# First obtain for each commission the meeting ids of the relevant previous meetings
+previous_meetings_ids_dict = {}
+for commission_id in commissions_overview_df["commissie.id"]:
+    previous_meetings_ids_dict[commission_id] = extract_previous_meeting_ids_zoek(start, end, commission_id)
+
+# Then fetch the details of all those meetings (over all commissions) in parallel 
+all_previous_meetings_ids = [idVerg for meeting_ids in previous_meetings_ids_dict.values() if meeting_ids for idVerg in meeting_ids]
+print(f"Fetching details of {len(set(all_previous_meetings_ids))} meetings using {max_workers_meeting_details} workers.")
+meeting_details_dict = fetch_meeting_details_concurrently(all_previous_meetings_ids)
+
 # Create empty dict to store attendance information for all relevant meetings for all commissions 
 overall_attendance_dict = {}
 
 # Iterate over each commission
 for index_overview, row_overview in commissions_overview_df.iterrows():
-    # Obtain commission_id, commission_title and vaste leden
+    # Obtain commission_id and commission_title
     commission_id = row_overview["commissie.id"]
     commission_title = row_overview["commissie.titel"]
-    vaste_leden_spec_comm = row_overview["vaste leden"]
     
     #Show progress
     print("-" * 50)
     print(f"Processing: {commission_id}, {commission_title}")
     
-    # For each commisison: obtain the meeting ids of the relevant previous meetings
-    previous_meetings_ids = extract_previous_meeting_ids_zoek(start, end, commission_id)
+    # For each commisison: obtain the meeting ids of the relevant previous meetings (fetched above)
+    previous_meetings_ids = previous_meetings_ids_dict[commission_id]
     
     # Create empty dict to store information about the meetings of those meeting ids in
     aanwezigheid_vergaderingen_spec_comm_dict = {}
     
-    # For each of the meeting ids: extract the meeting details, and store in dict  
+    # For each of the meeting ids: look up the (already fetched) meeting details, and store in dict  
     for idVerg in previous_meetings_ids:
-        meeting_details = extract_meeting_details(idVerg)
+        meeting_details = meeting_details_dict[idVerg]
         
         # Extract date of meeting (us 'datumagendering' and not e.g. 'datumbegin': if meeting cancelled: othterwise key error)
         #meeting_date = meeting_details['vergadering']['commissie'][0]['datumvan']
@@ -551,27 +534,12 @@ for index_overview, row_overview in commissions_overview_df.iterrows():
     spec_comm_df = pd.DataFrame.from_dict(aanwezigheid_vergaderingen_spec_comm_dict,
                                           orient='index') # use index orientation to get meetings as rows
     
-    # Create new empty columns to contain only attendance status for permanent members
-    spec_comm_df["AANWEZIG_vast"], spec_comm_df["AFWEZIG_vast"], spec_comm_df["VERONTSCHULDIGD_vast"] = "", "", ""
-
-    # Iterate over each meeting of specific commission and assign the permanent members to the relevant attendance status in new columns
-    # Use try-except to handle commissions where no column 'Afwezig' is registered
-    for index_spec_comm, row_spec_comm in spec_comm_df.iterrows():
-        try:
-            spec_comm_df.at[index_spec_comm, "AANWEZIG_vast"] = [member for member in row_spec_comm["AANWEZIG"] if member["Naam"] in vaste_leden_spec_comm] if isinstance(row_spec_comm["AANWEZIG"], list) else []
-        except: 
-            spec_comm_df.at[index_spec_comm, "AANWEZIG_vast"] = None
-            print(f"No column 'AANWEZIG' for {index_overview} {index_spec_comm}.")
-        try: 
-            spec_comm_df.at[index_spec_comm, "AFWEZIG_vast"] = [member for member in row_spec_comm["AFWEZIG"] if member["Naam"] in vaste_leden_spec_comm] if isinstance(row_spec_comm["AFWEZIG"], list) else []
-        except: 
-            spec_comm_df.at[index_spec_comm, "AFWEZIG_vast"] = None
-            print(f"No column 'AANWEZIG' for {index_overview} {index_spec_comm}.")
-        try: 
-            spec_comm_df.at[index_spec_comm, "VERONTSCHULDIGD_vast"] = [member for member in row_spec_comm["VERONTSCHULDIGD"] if member["Naam"] in vaste_leden_spec_comm] if isinstance(row_spec_comm["VERONTSCHULDIGD"], list) else []
-        except: 
-            spec_comm_df.at[index_spec_comm, "VERONTSCHULDIGD_vast"] = None
-            print(f"No column 'AANWEZIG' for {index_overview} {index_spec_comm}.")
+    # Assign the permanent members to the relevant attendance status in new columns: the members that were a permanent member
+    # of the commission on the date of the meeting (see `membership_intervals.py`). Statuses without column (e.g. no 'AFWEZIG' registered) obtain None.
+    if not spec_comm_df.empty:
+        for column_name, permanent_members in membership_intervals.tag_permanent_attendance(
+                spec_comm_df, commission_id, membership_intervals_index).items():
+            spec_comm_df[column_name] = permanent_members
         
     
     # Add commission name to each row, for easier filtering later on
@@ -694,6 +662,18 @@ for col in columns_to_modify:
 meetings_all_commissions_short_df
 
 
+# Then we also store the attendance as long format fact table (one row per member per meeting) with a dimension table of the members, see `attendance_facts.py`.
+
+# In[35b]:
+
+
+attendance_facts_df, attendance_members_df = attendance_facts.build_attendance_facts(meetings_all_commissions_df, commissions_overview_df)
+attendance_facts.save_attendance_facts(attendance_facts_df, attendance_members_df, data_dir='../data', file_suffix=f'_{today_str}')
+
+# Together with the counts per commission, member, status and month (see `attendance_cube.py`), to answer long date ranges faster
+attendance_cube.save_attendance_cube(attendance_cube.build_attendance_cube(attendance_facts_df), data_dir='../data', file_suffix=f'_{today_str}')
+
+
 # In[36]:
 
 
@@ -757,4 +737,29 @@ commissions_overview_df.to_csv(path_or_buf = f'../data/commissions_overview_df_{
                                index = False)
 
 
+# As well as the membership intervals (including the composition observed today), see `membership_intervals.py`
+
+# In[35c]:
+
+
+membership_intervals.save_membership_intervals(membership_intervals_df, data_dir='../data', file_suffix=f'_{today_str}')
+
+
+# Finally, also store a Parquet version of the data with proper dtypes (see `columnar_data.py`). 
+# The dash application reads these (only the columns it needs) instead of the pickles.
+
+# In[40]:
+
+
+columnar_data.save_columnar_data(meetings_all_commissions_df, commissions_overview_df, 
+                                 attendance_facts_df, attendance_members_df, 
+                                 data_dir='../data', file_suffix=f'_{today_str}')
+
+
+# The ingestion state of the update script (see `ingestion_state.py`) is rebuilt out of the meetings extracted here, so the next update continues from these meetings (and not from the high-water marks and meeting ids of an earlier extraction). Like the other outputs, it is stored with the date as suffix: put it in place together with them.
+
+# In[41]:
+
 
+ingestion_state.save_state(ingestion_state.state_from_meetings(meetings_all_commissions_df, commissions_overview_df),
+                           path=f'../data/ingestion_state_{today_str}.json')
@@ -19,8 +19,6 @@ import pickle
 
 from collections import defaultdict
 
-import requests
-
 from datetime import datetime, timedelta
 import locale # to allow date parsing for dates in Dutch
 
@@ -30,8 +28,18 @@ from collections import Counter
 
 import copy
 
+import sys
+sys.path.append('../dash') # to reuse modules of dash application (e.g. attendance_facts)
+import attendance_facts # long format fact table of attendance
+import attendance_cube # monthly pre-aggregated counts of attendance
+import columnar_data # Parquet version of the data (read by the dash application)
+import member_registry # members of parliament by id and by name
+import membership_intervals # periods in which members were permanent member of each commission
+
 import os
 
+import ingestion_state # persisted meeting ids and per-commission high-water marks for incremental updates
+
 
 
 
@@ -39,8 +47,13 @@ import os
 # In[5]:
 
 
-# Set base_url of api
-base_url = "https://ws.vlpar.be/e/opendata"
+# Use shared API client (connection pooling, timeouts, retries and rate limiting) for all API calls
+import vlpar_api
+from vlpar_api import (get_endpoint, extract_previous_meeting_ids_zoek, 
+                       fetch_meeting_details_concurrently, max_workers_meeting_details)
+
+# Use on-disk cache of API responses. Run with '--replay' to only use cached responses (no network), or '--no-cache' to disable.
+vlpar_api.configure_from_command_line()
 
 
 
@@ -50,20 +63,6 @@ base_url = "https://ws.vlpar.be/e/opendata"
 # In[7]:
 
 
-def get_endpoint(endpoint: str):
-    """
-    Return data available at inserted endpoint
-    """
-    # Make the GET request
-    response = requests.get(f"{base_url}{endpoint}")
-
-    # Check if the request was successful (status code 200)
-    if response.status_code == 200:
-        data = response.json()  # Parse JSON response
-    else:
-        print(f"Failed to fetch data. Status code: {response.status_code}")
-
-    return data
 
 
 # ## Members and parties
@@ -327,7 +326,7 @@ commissions_overview_df.reset_index(drop = True, inplace = True)
 
 # ## Vergaderingen commissies
 
-# To update the data, we need to ascertain which was the latest meeting currently registered. To do this, we load the current datafile, obtain the date of the last meeting. TheN we obtain all meetings from the day before this last meeting up until today. We start from the day before to be on the safe side, while later on removing duplicates. 
+# To update the data, we need to ascertain which meetings are already registered. For this, we keep an ingestion state (see `ingestion_state.py`) with, for each commission, the ids of all ingested meetings and a high-water mark (i.e. the date of its most recent ingested meeting). If no state is available yet, it is built out of the current datafile. Then we obtain for each commission all meetings from its high-water mark up until today, and only keep the meetings whose id was not ingested yet (each id once). Hence, we no longer need to remove duplicates over the entire dataset afterwards: the cost of this check scales with the amount of new meetings. The state is only rebuilt when it does not match the current datafile (i.e. a different amount of meetings or high-water mark for some commission). 
 
 # In[26]:
 
@@ -336,14 +335,16 @@ commissions_overview_df.reset_index(drop = True, inplace = True)
 meetings_all_commissions_df_current = pd.read_pickle(f'../data/meetings_all_commissions_df.pkl')
 
 # Inspect results
-print("Amount of new meetings currently:", meetings_all_commissions_df_current.shape[0])
+print("Amount of meetings currently:", meetings_all_commissions_df_current.shape[0])
 
-# Obtain date of last meeting
-date_last_meeting = meetings_all_commissions_df_current["Datum vergadering"].max()
+# Load ingestion state (or build it out of the current meetings, if missing or holding meetings that are not in them)
+state = ingestion_state.load_state(meetings_all_commissions_df=meetings_all_commissions_df_current,
+                                   commissions_overview_df=commissions_overview_df)
 
-# Set start date one day earlier
-start = date_last_meeting - timedelta(days=1)
-print(f'Starting point of monitoring: {start}.')
+# Commissions without high-water mark (e.g. new commissions) start from the day before the last meeting, as before
+date_last_meeting = meetings_all_commissions_df_current["Datum vergadering"].max()
+start_default = date_last_meeting - timedelta(days=1)
+print(f'Starting point of monitoring for commissions without high-water mark: {start_default}.')
 
 
 
@@ -364,57 +365,44 @@ end = datetime.now().date()
 print(f'End point of monitoring: {end}.')
 
 
+# Permanent members are tagged by the composition of the commissions on the date of each meeting, instead of by the current composition (see `membership_intervals.py`). For this, the composition observed today is added to the stored membership intervals (built out of the dated overviews if not stored yet): members that joined a commission since the previous update are permanent members from today on, members that left are no longer permanent members from today on. The permanent members of a commission that appeared since the previous update are permanent members of all its meetings. 
 
-# Then we obtain all previous meetings for a specific commission, for a certain time frame. First, we create a helper function to extract the meeting id's of all relevant meetings (`extract_previous_meeting_ids_zoek()`). Then we use another helper function to use those meeting id's to extract the attendance information on all those meetings (`extract_meeting_details()`). 
+# In[31]:
 
-# In[33]:
 
+# Registry to look up the ids of the permanent members (by name), completed with the members seen in the attendance
+registry_members = member_registry.MemberRegistry(parlementsleden_all_dict, fracties_dict)
+_, attendance_members_df_current = attendance_facts.load_attendance_facts(data_dir='../data')
 
-def extract_previous_meeting_ids_zoek(start_date, end_date, commission_id):
-    # Convert dates to the required format (ddmmyyyy)
-    start_date_str = start_date.strftime("%d%m%Y")
-    end_date_str = end_date.strftime("%d%m%Y")
+membership_intervals_df = membership_intervals.load_membership_intervals(data_dir='../data')
+# The meetings ingested before the intervals were stored are tagged by the composition at the time of their ingestion
+retag_history = membership_intervals_df is None
+if membership_intervals_df is None:
+    membership_intervals_df = membership_intervals.build_membership_intervals(
+        membership_intervals.read_composition_snapshots(data_dir='../data'), registry_members, attendance_members_df_current)
+membership_intervals_df = membership_intervals.update_membership_intervals(
+    membership_intervals_df, commissions_overview_df, end, registry_members, attendance_members_df_current)
+membership_intervals_index = membership_intervals.MembershipIntervals(membership_intervals_df)
+print(f'Membership intervals: {len(membership_intervals_df)} ({membership_intervals_df["valid_to"].isna().sum()} current).')
 
-    # API endpoint and parameters
-    endpoint = '/verg/zoek/datums'
-    params = {
-        'type': 'comm',  # Choosing plenaire meetings
-        'datumVan': start_date_str,
-        'datumTot': end_date_str,
-        'idComm': commission_id  # Specific commission ID
-    }
 
-    response = requests.get(base_url + endpoint, params=params)
+# Once (i.e. when the intervals were not stored yet), the permanent members of all current meetings (the whole history) are tagged again by the intervals, so the attended meetings of the permanent members follow the same definition of membership as the amount of relevant meetings in the dash application. The fact table, the monthly cube, the short version of the meetings and the Parquet files are then rebuilt out of the whole history (see below), instead of only appending the new meetings.
+
+# In[31a]:
 
-    if response.status_code == 200:
-        # Process the response data (e.g., extract meetings)
-        meetings = response.json()  # Assuming the response is in JSON format
-        
-        # Obtain meeting ids of all relevant meetings
-        meeting_ids = [item['vergadering']['id'] for item in meetings['items']]
-        
-        return meeting_ids
-    else:
-        print(f"Failed to fetch meetings. Status code: {response.status_code}")
-        return None
 
+if retag_history:
+    meetings_all_commissions_df_current = membership_intervals.retag_permanent_attendance(
+        meetings_all_commissions_df_current, commissions_overview_df, membership_intervals_index)
+    print(f'Permanent members of {meetings_all_commissions_df_current.shape[0]} current meetings tagged again by the membership intervals.')
 
-# In[34]:
 
 
-def extract_meeting_details(idVerg:int):
-    # API endpoint and parameters
-    endpoint = f'/verg/{idVerg}'
-    params = {
-        'idVerg': idVerg  # Specific meeting ID
-    }
+# Then we obtain all previous meetings for a specific commission, for a certain time frame. First, we create a helper function to extract the meeting id's of all relevant meetings (`extract_previous_meeting_ids_zoek()`, see `vlpar_api.py`). Then we use another helper function to use those meeting id's to extract the attendance information on all those meetings (`extract_meeting_details()`), requested in parallel for all meetings through `fetch_meeting_details_concurrently()`. 
+
+# In[33]:
 
-    response = requests.get(base_url + endpoint, params=params)
 
-    if response.status_code == 200:
-        # Process the response data (e.g., extract meeting details)
-        meeting_details = response.json()  # Assuming the response is in JSON format
-        return meeting_details
 
 
 # Then we apply both functions to obtain all attendance information for all relevant meetings for all commissions, and store them in a dict.  
@@ -425,29 +413,42 @@ def extract_meeting_details(idVerg:int):
 # Create empty column to store total of meetings for commission in relevant timeframe
 commissions_overview_df["aantal vergaderingen"] = ''
 
+# First obtain for each commission the meeting ids of the meetings since its high-water mark, 
+# only maintaining those that were not ingested yet
+previous_meetings_ids_dict = {}
+for commission_id in commissions_overview_df["commissie.id"]:
+    # Start at the high-water mark itself (not the day after): multiple meetings can take place on the same day
+    start = ingestion_state.get_watermark(state, commission_id) or start_default
+    previous_meetings_ids_dict[commission_id] = ingestion_state.new_meeting_ids(
+        state, commission_id, extract_previous_meeting_ids_zoek(start, end, commission_id))
+
+# Then fetch the details of all those meetings (over all commissions) in parallel 
+all_previous_meetings_ids = [idVerg for meeting_ids in previous_meetings_ids_dict.values() if meeting_ids for idVerg in meeting_ids]
+print(f"Fetching details of {len(set(all_previous_meetings_ids))} meetings using {max_workers_meeting_details} workers.")
+meeting_details_dict = fetch_meeting_details_concurrently(all_previous_meetings_ids)
+
 # Create empty dict to store attendance information for all relevant meetings for all commissions 
 overall_attendance_dict = {}
 
 # Iterate over each commission
 for index_overview, row_overview in commissions_overview_df.iterrows():
-    # Obtain commission_id, commission_title and vaste leden
+    # Obtain commission_id and commission_title
     commission_id = row_overview["commissie.id"]
     commission_title = row_overview["commissie.titel"]
-    vaste_leden_spec_comm = row_overview["vaste leden"]
     
     #Show progress
     print("-" * 50)
     print(f"Processing: {commission_id}, {commission_title}")
     
-    # For each commisison: obtain the meeting ids of the relevant previous meetings
-    previous_meetings_ids = extract_previous_meeting_ids_zoek(start, end, commission_id)
+    # For each commisison: obtain the meeting ids of the relevant previous meetings (fetched above)
+    previous_meetings_ids = previous_meetings_ids_dict[commission_id]
     
     # Create empty dict to store information about the meetings of those meeting ids in
     aanwezigheid_vergaderingen_spec_comm_dict = {}
     
-    # For each of the meeting ids: extract the meeting details, and store in dict  
+    # For each of the meeting ids: look up the (already fetched) meeting details, and store in dict  
     for idVerg in previous_meetings_ids:
-        meeting_details = extract_meeting_details(idVerg)
+        meeting_details = meeting_details_dict[idVerg]
         
         # Extract date of meeting (us 'datumagendering' and not e.g. 'datumbegin': if meeting cancelled: othterwise key error)
         #meeting_date = meeting_details['vergadering']['commissie'][0]['datumvan']
@@ -490,35 +491,25 @@ for index_overview, row_overview in commissions_overview_df.iterrows():
     spec_comm_df = pd.DataFrame.from_dict(aanwezigheid_vergaderingen_spec_comm_dict,
                                           orient='index') # use index orientation to get meetings as rows
     
-    # Create new empty columns to contain only attendance status for permanent members
-    spec_comm_df["AANWEZIG_vast"], spec_comm_df["AFWEZIG_vast"], spec_comm_df["VERONTSCHULDIGD_vast"] = "", "", ""
-
-    # Iterate over each meeting of specific commission and assign the permanent members to the relevant attendance status in new columns
-    # Use try-except to handle commissions where no column 'Afwezig' is registered
-    for index_spec_comm, row_spec_comm in spec_comm_df.iterrows():
-        try:
-            spec_comm_df.at[index_spec_comm, "AANWEZIG_vast"] = [member for member in row_spec_comm["AANWEZIG"] if member["Naam"] in vaste_leden_spec_comm] if isinstance(row_spec_comm["AANWEZIG"], list) else []
-        except: 
-            spec_comm_df.at[index_spec_comm, "AANWEZIG_vast"] = None
-            print(f"No column 'AANWEZIG' for {index_overview} {index_spec_comm}.")
-        try: 
-            spec_comm_df.at[index_spec_comm, "AFWEZIG_vast"] = [member for member in row_spec_comm["AFWEZIG"] if member["Naam"] in vaste_leden_spec_comm] if isinstance(row_spec_comm["AFWEZIG"], list) else []
-        except: 
-            spec_comm_df.at[index_spec_comm, "AFWEZIG_vast"] = None
-            print(f"No column 'AANWEZIG' for {index_overview} {index_spec_comm}.")
-        try: 
-            spec_comm_df.at[index_spec_comm, "VERONTSCHULDIGD_vast"] = [member for member in row_spec_comm["VERONTSCHULDIGD"] if member["Naam"] in vaste_leden_spec_comm] if isinstance(row_spec_comm["VERONTSCHULDIGD"], list) else []
-        except: 
-            spec_comm_df.at[index_spec_comm, "VERONTSCHULDIGD_vast"] = None
-            print(f"No column 'AANWEZIG' for {index_overview} {index_spec_comm}.")
+    # Assign the permanent members to the relevant attendance status in new columns: the members that were a permanent member
+    # of the commission on the date of the meeting (see `membership_intervals.py`). Statuses without column (e.g. no 'AFWEZIG' registered) obtain None.
+    if not spec_comm_df.empty:
+        for column_name, permanent_members in membership_intervals.tag_permanent_attendance(
+                spec_comm_df, commission_id, membership_intervals_index).items():
+            spec_comm_df[column_name] = permanent_members
         
     
     # Add commission name to each row, for easier filtering later on
     spec_comm_df['commissie.titel'] = commission_title
     
-    # Store amount of meetings for this commission in main dataframe
+    # Store amount of (new) meetings for this commission in main dataframe
     commissions_overview_df.at[index_overview, "aantal vergaderingen"] = spec_comm_df.shape[0]
     
+    # Register ingested meetings in state (meetings without attendance information are not registered, so they are retried next time)
+    ingestion_state.register_meetings(state, commission_id, 
+                                      [ingestion_state.meeting_id_from_index(label) for label in spec_comm_df.index],
+                                      spec_comm_df['Datum vergadering'] if not spec_comm_df.empty else [])
+    
     # Store all attendance information of all meetings of this commission in overall dict for later assessment
     overall_attendance_dict[commission_title] = spec_comm_df
     
@@ -541,48 +532,8 @@ new_meetings_all_commissions_df = pd.concat([overall_attendance_dict[key] for ke
 # Inspect results
 print("Amount of new meetings since last update:", new_meetings_all_commissions_df.shape[0])
 
-print("Amount of meetings on last day of initial data set:", 
-      new_meetings_all_commissions_df[new_meetings_all_commissions_df['Datum vergadering'] == start].shape[0])
-print("Amount of meetings on day before last day of initial data set (i.e. extra day):",
-      new_meetings_all_commissions_df[new_meetings_all_commissions_df['Datum vergadering'] == date_last_meeting].shape[0])
-
-
-# Then we merge dataframe of the old and new meeting and remove duplicates. For this, we can use the indices, as they contain the meeting id's. This is relevant since some entries are exactly identical, e.g. when 2 meetings occur on the same day with the same attendance (e.g. a full day meeting stretched over a morning and afternoon meeting). 
-
-# In[38]:
-
-
-# Concatenate the dataframes of the old meetings and the new meetings
-meetings_all_commissions_df_all = pd.concat([meetings_all_commissions_df_current, 
-                                             new_meetings_all_commissions_df])
-
-# Inspect results
-print("Amount of total meetings after update (incl. duplicates):", 
-      meetings_all_commissions_df_all.shape[0])
-
-
-# In[39]:
 
-
-# Convert all values in dataframe to strings to avoid errors when using 'duplicated' feature later on (i.e. cannot work with lists) 
-meetings_all_commissions_df_all_str = meetings_all_commissions_df_all.astype(str)
-
-# Convert the index to a column (to be able to take it into account for the duplicate analysis) 
-meetings_all_commissions_df_all_str['Index'] = meetings_all_commissions_df_all_str.index
-
-
-# Create a boolean mask for non-duplicated items, using the transformed dataframe
-mask = ~meetings_all_commissions_df_all_str.duplicated(keep='first')
-
-# Apply the mask to the original DataFrame to filter out any duplicates
-meetings_all_commissions_df = meetings_all_commissions_df_all[mask]
-
-# Inspect results
-print("Amount of total meetings after update (excl. duplicates):", 
-      meetings_all_commissions_df.shape[0])
-
-
-# Then we further modify the resulting dataframes. First we create some empty columns that will be later on filled during the interactive dash application. Some columns (i.e. those in `meetings_all_commissions_df` indicating how many members were present/absent/absent with notice, can however already be filled.  
+# Then we append the new meetings to the dataframe of the old meetings. No duplicates occur, since only meeting ids that were not ingested yet (for the relevant commission) were fetched, and an ingestion state that does not match the meetings is rebuilt when loading it. The counts of the attendance statuses (see below) are only calculated for the new meetings.
 
 # In[40]:
 
@@ -604,46 +555,83 @@ for column in columns_to_fill:
 # In[41]:
 
 
-# Create empty columns in meetings_all_commissions_filtered_df
+# Create empty columns in new_meetings_all_commissions_df
 new_columns = ["Aantal aanwezig alle leden", "Aantal afwezig alle leden", "Aantal verontschuldigd alle leden",
     "Aantal aanwezig vaste leden", "Aantal afwezig vaste leden", "Aantal verontschuldigd vaste leden"]
 
 # Assign np.nan to the new columns
 for new_col in new_columns:
-    meetings_all_commissions_df[new_col] = np.nan
+    new_meetings_all_commissions_df[new_col] = np.nan
 
 # Define a function to get the count for each column
 def get_count(column):
     return len(column) if isinstance(column, list) else 0
 
-# Modify meetings_all_commissions_filtered_df with counts for attendance statuses 
-for index_spec, row_specific in meetings_all_commissions_df.iterrows():
-    for column_name_spec_to_fill, column_name_to_calculate_from in zip(
-        ["Aantal aanwezig alle leden", "Aantal afwezig alle leden", "Aantal verontschuldigd alle leden",
-         "Aantal aanwezig vaste leden", "Aantal afwezig vaste leden", "Aantal verontschuldigd vaste leden"],
-        ['AANWEZIG', 'AFWEZIG', 'VERONTSCHULDIGD','AANWEZIG_vast', 'AFWEZIG_vast', 'VERONTSCHULDIGD_vast']):
-        meetings_all_commissions_df.at[index_spec, column_name_spec_to_fill] = get_count(
-            meetings_all_commissions_df.loc[index_spec, column_name_to_calculate_from])
+# Modify new_meetings_all_commissions_df with counts for attendance statuses 
+# (column-wise, since the index of a meeting can occur for multiple commissions)
+for column_name_spec_to_fill, column_name_to_calculate_from in zip(
+    ["Aantal aanwezig alle leden", "Aantal afwezig alle leden", "Aantal verontschuldigd alle leden",
+     "Aantal aanwezig vaste leden", "Aantal afwezig vaste leden", "Aantal verontschuldigd vaste leden"],
+    ['AANWEZIG', 'AFWEZIG', 'VERONTSCHULDIGD','AANWEZIG_vast', 'AFWEZIG_vast', 'VERONTSCHULDIGD_vast']):
+    if column_name_to_calculate_from in new_meetings_all_commissions_df.columns:
+        new_meetings_all_commissions_df[column_name_spec_to_fill] = new_meetings_all_commissions_df[
+            column_name_to_calculate_from].map(get_count).astype(float)
+    else:
+        new_meetings_all_commissions_df[column_name_spec_to_fill] = 0.0
+
+# Append the new meetings to the old meetings 
+meetings_all_commissions_df = pd.concat([meetings_all_commissions_df_current, 
+                                         new_meetings_all_commissions_df.reindex(columns=meetings_all_commissions_df_current.columns)])
+
+# Inspect results
+print("Amount of total meetings after update:", meetings_all_commissions_df.shape[0])
+
 
 
 
 
+# Also append the new meetings to the long format fact table of attendance (one row per member per meeting), see `attendance_facts.py`.
+# Do this before saving the meetings: if no fact table exists yet, it is built out of the current (i.e. old) meetings first.
+
+# In[45]:
+
+
+if retag_history:
+    # History tagged again: rebuild the fact table out of all meetings
+    attendance_facts_df, attendance_members_df = attendance_facts.build_attendance_facts(
+        meetings_all_commissions_df, commissions_overview_df)
+    attendance_facts.save_attendance_facts(attendance_facts_df, attendance_members_df, data_dir='../data')
+else:
+    attendance_facts_df, attendance_members_df = attendance_facts.append_attendance_facts(
+        new_meetings_all_commissions_df, commissions_overview_df, data_dir='../data')
+
+# Rebuild the counts per commission, member, status and month (see `attendance_cube.py`) out of the updated fact table
+attendance_cube.save_attendance_cube(attendance_cube.build_attendance_cube(attendance_facts_df), data_dir='../data')
+
 
 # In[46]:
 
 
 # Extract a version of the dataframe that only contains the names of the members (i.e. the third element)
+# Only do this for the new meetings, and append them to the current short version (for all meetings if the history was tagged again)
 # Obtain copy of relevant dataframe
-meetings_all_commissions_short_df = copy.deepcopy(meetings_all_commissions_df)
+new_meetings_all_commissions_short_df = copy.deepcopy(meetings_all_commissions_df if retag_history else 
+                                                      new_meetings_all_commissions_df.reindex(columns=meetings_all_commissions_df_current.columns))
 # Define the columns to modify
 columns_to_modify = [col for col in ['AANWEZIG', 'AFWEZIG', 'VERONTSCHULDIGD','AANWEZIG_vast', 'AFWEZIG_vast', 'VERONTSCHULDIGD_vast']]
 
 
 # Apply function to modify columns
 for col in columns_to_modify:
-    meetings_all_commissions_short_df[col] = meetings_all_commissions_short_df[col].apply(
+    new_meetings_all_commissions_short_df[col] = new_meetings_all_commissions_short_df[col].apply(
         lambda x: [item["Naam"] for item in x] if isinstance(x, list) else None)
 
+if retag_history:
+    meetings_all_commissions_short_df = new_meetings_all_commissions_short_df
+else:
+    meetings_all_commissions_short_df = pd.concat([pd.read_pickle(f'../data/meetings_all_commissions_short_df.pkl'),
+                                                   new_meetings_all_commissions_short_df])
+
 
  
 
@@ -698,5 +686,23 @@ commissions_overview_df.to_csv(path_or_buf = f'../data/commissions_overview_df.c
                                index = False)
 
 
+# In[52a]:
+
+
+## Save the membership intervals (including the composition observed today), see `membership_intervals.py`
+membership_intervals.save_membership_intervals(membership_intervals_df, data_dir='../data')
+
+
+# In[52b]:
+
+
+## Save Parquet version of the data with proper dtypes (see `columnar_data.py`), read by the dash application
+columnar_data.save_columnar_data(meetings_all_commissions_df, commissions_overview_df, 
+                                 attendance_facts_df, attendance_members_df, data_dir='../data')
+
+
+# In[53]:
 
 
+# Finally, save the ingestion state, only after all data is saved (so an interrupted run is simply redone next time)
+ingestion_state.save_state(state)
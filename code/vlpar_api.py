@@ -0,0 +1,256 @@
+"""
+Shared client for the API of the Flemish Parliament (http://ws.vlpar.be/e/opendata/api).
+
+All scripts in this folder (extraction, update and questions) use this module
+instead of calling requests.get() directly. It provides:
+    * one requests.Session, so TCP/TLS connections are kept alive and pooled
+    * a timeout on every request
+    * retries with exponential backoff and jitter on connection errors, 5xx and 429 responses
+    * a rate limit per host, shared by all threads
+    * optionally, an on-disk cache of responses with a replay mode that never uses the network (see vlpar_cache.py)
+
+Failing requests (i.e. after all retries) raise VlparAPIError instead of silently returning None.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from vlpar_cache import ResponseCache, default_cache_dir, default_max_size_mb
+
+
+# Set base_url of api
+base_url = "https://ws.vlpar.be/e/opendata"
+
+# Set amount of meeting details that are requested simultaneously (can be overruled through environment variable)
+max_workers_meeting_details = int(os.environ.get("VLPAR_MAX_WORKERS", 8))
+
+# Timeouts in seconds: (time to set up connection, time to wait for response)
+request_timeout = (5, 30)
+
+# Retry settings: amount of retries, and base and maximum waiting time (seconds) between them
+max_retries = 5
+backoff_base = 0.5
+backoff_max = 30
+retry_status_codes = {429, 500, 502, 503, 504}
+
+# Maximum amount of requests per second for each host (can be overruled through environment variable)
+max_requests_per_second = float(os.environ.get("VLPAR_MAX_REQUESTS_PER_SECOND", 10))
+
+
+class VlparAPIError(Exception):
+    """
+    Raised when a request to the API keeps failing after all retries,
+    or returns a status code for which retrying makes no sense (e.g. 404).
+    """
+    def __init__(self, url, status_code=None, message=""):
+        self.url = url
+        self.status_code = status_code
+        super().__init__(f"Failed to fetch {url} (status code: {status_code}). {message}".strip())
+
+
+class HostRateLimiter:
+    """
+    Allow at most max_per_second requests per host, over all threads.
+    Each request reserves the next free time slot of its host, and sleeps until then.
+    """
+    def __init__(self, max_per_second):
+        self.min_interval = 1 / max_per_second if max_per_second > 0 else 0
+        self.next_slot = {}  # host -> earliest moment a next request may start
+        self.lock = threading.Lock()
+
+    def wait(self, host):
+        if not self.min_interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def create_session(pool_size=max_workers_meeting_details):
+    """
+    Create session that keeps connections alive, with a pool large enough for all worker threads.
+    Retries are handled in get_json() (to add jitter and to also retry on 429), so not by the adapter.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(pool_size, 1), max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept": "application/json"})
+    return session
+
+
+# Session and rate limiter shared by all calls (requests.Session can be shared over threads for GET requests)
+session = create_session()
+rate_limiter = HostRateLimiter(max_requests_per_second)
+
+# On-disk cache of responses (None: no caching). Set through configure_cache()
+response_cache = None
+
+
+def configure_cache(enabled=True, cache_dir=default_cache_dir, max_size_mb=default_max_size_mb, replay=False):
+    """
+    Enable (or disable) the on-disk cache for all following requests.
+    In replay mode, all requests must be answered by the cache: the network is never used.
+    """
+    global response_cache
+    if replay and not enabled:
+        raise ValueError("Replay mode requires the cache to be enabled.")
+    response_cache = ResponseCache(cache_dir, max_size_mb, replay) if enabled else None
+    return response_cache
+
+
+def configure_from_command_line():
+    """
+    Configure the cache using the command line arguments of the calling script:
+        --replay            only use cached responses, never the network
+        --no-cache          do not use the cache at all
+        --cache-dir DIR     location of the cache (default: ../data/api_cache)
+        --cache-max-mb MB   maximum size of the cache (default: 500 MB)
+    Unknown arguments are ignored (e.g. those passed by Jupyter when running as notebook).
+    """
+    parser = argparse.ArgumentParser(description="Extract data from the API of the Flemish Parliament.")
+    parser.add_argument("--replay", action="store_true", help="only use cached responses, never the network")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the on-disk cache")
+    parser.add_argument("--cache-dir", default=default_cache_dir, help="location of the on-disk cache")
+    parser.add_argument("--cache-max-mb", type=float, default=default_max_size_mb, help="maximum size of the cache in MB")
+    args, _ = parser.parse_known_args()
+
+    configure_cache(enabled=not args.no_cache, cache_dir=args.cache_dir,
+                    max_size_mb=args.cache_max_mb, replay=args.replay)
+    if args.replay:
+        print(f"Replay mode: only using cached responses of {args.cache_dir}.")
+    return args
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Obtain waiting time before the next attempt: exponential backoff with 'full jitter'
+    (i.e. random time between 0 and the exponential delay), to avoid all threads retrying at once.
+    If the server indicates how long to wait (Retry-After header), respect that.
+    """
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), backoff_max)
+        except ValueError:
+            pass # Retry-After can also be a HTTP date: fall back on backoff
+    return random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+
+
+def get_json(url: str, params=None, headers=None):
+    """
+    Perform GET request on url and return parsed JSON response, with caching, retries and rate limiting.
+    """
+    # Use cached response if available (in replay mode: raises CacheMissError if not available)
+    if response_cache is not None:
+        cached_data = response_cache.get(url, params, headers)
+        if cached_data is not None:
+            return cached_data
+
+    data = get_json_from_network(url, params, headers)
+
+    if response_cache is not None:
+        response_cache.set(url, data, params, headers)
+    return data
+
+
+def get_json_from_network(url: str, params=None, headers=None):
+    """
+    Perform GET request on url, retrying with exponential backoff and jitter on failures
+    """
+    host = urlsplit(url).netloc
+
+    for attempt in range(max_retries + 1):
+        rate_limiter.wait(host)
+        retry_after = None
+        try:
+            response = session.get(url, params=params, headers=headers, timeout=request_timeout)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            failure = VlparAPIError(url, message=str(error))
+        else:
+            if response.status_code == 200:
+                return response.json()
+            failure = VlparAPIError(url, response.status_code)
+            # Do not retry on e.g. 404: the result will not change
+            if response.status_code not in retry_status_codes:
+                raise failure
+            retry_after = response.headers.get("Retry-After")
+
+        if attempt < max_retries:
+            delay = backoff_delay(attempt, retry_after)
+            print(f"{failure} Retrying in {delay:.1f} s ({attempt + 1}/{max_retries}).")
+            time.sleep(delay)
+
+    raise failure
+
+
+def get_endpoint(endpoint: str):
+    """
+    Return data available at inserted endpoint
+    """
+    return get_json(f"{base_url}{endpoint}")
+
+
+def extract_previous_meeting_ids_zoek(start_date, end_date, commission_id):
+    """
+    Return meeting ids of all meetings of commission_id between start_date and end_date
+    """
+    # Convert dates to the required format (ddmmyyyy)
+    start_date_str = start_date.strftime("%d%m%Y")
+    end_date_str = end_date.strftime("%d%m%Y")
+
+    # API endpoint and parameters
+    endpoint = '/verg/zoek/datums'
+    params = {
+        'type': 'comm',  # Choosing plenaire meetings
+        'datumVan': start_date_str,
+        'datumTot': end_date_str,
+        'idComm': commission_id  # Specific commission ID
+    }
+
+    meetings = get_json(base_url + endpoint, params=params)
+
+    # Obtain meeting ids of all relevant meetings
+    return [item['vergadering']['id'] for item in meetings['items']]
+
+
+def extract_meeting_details(idVerg: int):
+    """
+    Return details (incl. attendance) of meeting idVerg
+    """
+    # API endpoint and parameters
+    endpoint = f'/verg/{idVerg}'
+    params = {
+        'idVerg': idVerg  # Specific meeting ID
+    }
+
+    return get_json(base_url + endpoint, params=params)
+
+
+def fetch_meeting_details_concurrently(meeting_ids, max_workers=max_workers_meeting_details):
+    """
+    Obtain the details of all inserted meeting ids using a bounded thread pool,
+    instead of requesting them one after the other. Most time of a sequential
+    run is spent waiting for the API, so requests are overlapped.
+
+    Returns dict {idVerg: meeting_details}. Each meeting id is only requested once
+    (i.e. also when it occurs for multiple commissions), and the dict keeps the
+    order of meeting_ids, so further processing is identical to the sequential approach.
+    """
+    # Remove duplicates while maintaining order
+    unique_meeting_ids = list(dict.fromkeys(meeting_ids))
+
+    # executor.map() returns the results in the order of the input, regardless of which request finishes first
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        meeting_details_list = list(executor.map(extract_meeting_details, unique_meeting_ids))
+
+    return dict(zip(unique_meeting_ids, meeting_details_list))
@@ -0,0 +1,204 @@
+"""
+On-disk cache for responses of the API of the Flemish Parliament, used by vlpar_api.get_json().
+
+Each response is stored as a separate JSON file, named after the hash of the request
+(url + params + headers), so re-running the extraction or update scripts only hits
+the network for requests that are not cached yet or of which the cached version expired.
+
+    * How long a response remains valid depends on the endpoint (see ttl_for_request()).
+      Details of meetings that already took place do not change anymore, so they never expire.
+    * The cache is bounded in size: when it grows beyond max_size_bytes, the least recently
+      used responses are removed.
+    * In replay mode, the network is never used: every request must be answered from the cache
+      (regardless of its age), otherwise CacheMissError is raised. This allows to develop the
+      pipeline offline.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+
+# Default location of cache (relative to the code folder, as for the data files)
+default_cache_dir = os.environ.get("VLPAR_CACHE_DIR", "../data/api_cache")
+# Default maximum size of cache (in MB)
+default_max_size_mb = float(os.environ.get("VLPAR_CACHE_MAX_MB", 500))
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Time to live (in seconds) for each type of endpoint. None means the response never expires.
+# The first matching pattern is used.
+ttl_per_endpoint = [
+    (re.compile(r"/verg/zoek/"), 12 * HOUR),  # search for meetings: new meetings are added continuously
+    (re.compile(r"/verg/\d+$"), HOUR),        # details of meeting: see ttl_for_request() for past meetings
+    (re.compile(r"/comm/"), DAY),             # (composition of) commissions
+    (re.compile(r"/vv/"), DAY),               # members of parliament
+    (re.compile(r"/leg/"), 7 * DAY),          # legislatures
+    (re.compile(r"/api/search/"), DAY),       # search queries (e.g. written questions)
+]
+default_ttl = DAY
+
+
+class CacheMissError(Exception):
+    """
+    Raised in replay mode when a request is not available in the cache.
+    """
+    def __init__(self, url, params=None):
+        super().__init__(f"Replay mode: no cached response for {url} (params: {params}).")
+
+
+def request_key(url, params=None, headers=None):
+    """
+    Obtain key of request: hash of url, params and headers (params and headers sorted, so their order does not matter)
+    """
+    canonical = json.dumps({"url": url,
+                            "params": sorted((str(k), str(v)) for k, v in (params or {}).items()),
+                            "headers": sorted((str(k).lower(), str(v)) for k, v in (headers or {}).items())})
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def meeting_in_past(data):
+    """
+    Check whether the details of a meeting concern a meeting before today
+    """
+    try:
+        meeting_date_str = data['vergadering']['datumagendering']
+        meeting_date = datetime.strptime(meeting_date_str, "%Y-%m-%dT%H:%M:%S%z").date()
+    except (KeyError, TypeError, ValueError):
+        return False
+    return meeting_date < datetime.now().date()
+
+
+def ttl_for_request(url, data):
+    """
+    Obtain time to live (in seconds) of the response to url. None means the response never expires.
+    """
+    path = url.split("?")[0]
+    for pattern, ttl in ttl_per_endpoint:
+        if pattern.search(path):
+            # Details of past meetings are effectively immutable: cache them permanently
+            if pattern.pattern == r"/verg/\d+$" and meeting_in_past(data):
+                return None
+            return ttl
+    return default_ttl
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of JSON responses on disk, with TTL per endpoint and LRU eviction.
+    The modification time of a file is used as its 'last used' time (it is updated on each hit).
+    """
+    def __init__(self, cache_dir=default_cache_dir, max_size_mb=default_max_size_mb, replay=False):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.replay = replay
+        self.lock = threading.Lock()
+        self.size_bytes = None # obtained lazily, on first write
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path_for_key(self, key):
+        # Use first 2 characters of hash as subfolder, to avoid too many files in one folder
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, url, params=None, headers=None):
+        """
+        Return cached response, or None if not cached (or expired).
+        In replay mode, expired responses are returned as well, and a miss raises CacheMissError.
+        """
+        path = self.path_for_key(request_key(url, params, headers))
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            entry = None
+
+        if entry is not None and (self.replay or entry["expires"] is None or entry["expires"] > time.time()):
+            with self.lock:
+                self.hits += 1
+            try:
+                os.utime(path) # mark as recently used
+            except OSError:
+                pass
+            return entry["data"]
+
+        with self.lock:
+            self.misses += 1
+        if self.replay:
+            raise CacheMissError(url, params)
+        return None
+
+    def set(self, url, data, params=None, headers=None):
+        """
+        Store response in cache (atomically, so parallel threads or processes never read half-written files)
+        """
+        ttl = ttl_for_request(url, data)
+        entry = {"url": url,
+                 "params": params,
+                 "fetched": time.time(),
+                 "expires": None if ttl is None else time.time() + ttl,
+                 "data": data}
+        path = self.path_for_key(request_key(url, params, headers))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to temporary file and rename it
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+            json.dump(entry, file)
+
+        with self.lock:
+            # Size of the response that is overwritten (e.g. an expired one), if any
+            try:
+                old_size = os.path.getsize(path)
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(temp_path, path)
+            if self.size_bytes is None:
+                self.size_bytes = self.current_size()
+            else:
+                self.size_bytes += os.path.getsize(path) - old_size
+            if self.size_bytes > self.max_size_bytes:
+                self.evict()
+
+    def cached_files(self):
+        """
+        Return list of (last used, size, path) for all cached responses
+        """
+        files = []
+        for root, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if file_name.endswith(".json"):
+                    path = os.path.join(root, file_name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def current_size(self):
+        return sum(size for _, size, _ in self.cached_files())
+
+    def evict(self):
+        """
+        Remove least recently used responses until cache is at 90% of its maximum size
+        (to avoid evicting on every subsequent write)
+        """
+        files = sorted(self.cached_files())
+        total = sum(size for _, size, _ in files)
+        target = 0.9 * self.max_size_bytes
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self.size_bytes = total
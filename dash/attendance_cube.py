@@ -0,0 +1,167 @@
+"""
+Monthly pre-aggregated version of the attendance fact table (see attendance_facts.py): a cube of counts by
+
+    commission_id | member_id | status | is_permanent | month | count
+
+(month: first day of the month of the meetings). It is materialized by the extraction and update scripts
+(attendance_cube.pkl); if not available, load_attendance_cube() builds it out of the fact table.
+
+A query for a date range (start_date up to and including end_date) sums the months that are completely inside the
+range from the cube, and counts the individual facts only for the (at most two) partial months at the boundaries:
+
+    start_date           first whole month                      last whole month             end_date
+        |-- facts --|------------- cube ------------- ... -------------|------ facts ------|
+
+For a range within a single month, only the facts of that month are counted. raw_counts() counts all facts of the
+range instead; verify() (or python attendance_cube.py [amount of ranges]) checks both give the same counts.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import attendance_facts
+
+
+cube_file_name = 'attendance_cube.pkl'
+key_columns = ['commission_id', 'member_id', 'status', 'is_permanent']
+
+
+def build_attendance_cube(attendance_facts_df):
+    """
+    Aggregate the fact table per commission, member, status, permanent membership and month
+    """
+    cube_df = (attendance_facts_df.assign(month=attendance_facts_df['date'].dt.to_period('M').dt.to_timestamp())
+               .groupby(key_columns + ['month'], observed=True).size().rename('count').reset_index())
+    cube_df['count'] = cube_df['count'].astype(np.int32)
+    cube_df['status'] = cube_df['status'].astype(attendance_facts.status_dtype)
+    return cube_df.sort_values('month', kind='stable', ignore_index=True)
+
+
+def save_attendance_cube(cube_df, data_dir=attendance_facts.default_data_dir, file_suffix=""):
+    """
+    Save cube (file_suffix allows to add e.g. the extraction date to the file name)
+    """
+    cube_df.to_pickle(os.path.join(data_dir, cube_file_name.replace('.pkl', f'{file_suffix}.pkl')))
+
+
+def load_attendance_cube(data_dir=attendance_facts.default_data_dir, attendance_facts_df=None):
+    """
+    Load cube. If not stored yet, build it out of the fact table (attendance_facts_df, or the stored fact table).
+    """
+    cube_path = os.path.join(data_dir, cube_file_name)
+    if os.path.exists(cube_path):
+        return pd.read_pickle(cube_path)
+    if attendance_facts_df is None:
+        attendance_facts_df, _ = attendance_facts.load_attendance_facts(data_dir)
+    return build_attendance_cube(attendance_facts_df)
+
+
+def _sum_counts(frames):
+    # Sum counts of frames (facts count once, rows of the cube have a 'count' column) per key
+    frames = [frame[key_columns + ['count']] if 'count' in frame.columns else frame[key_columns].assign(count=1)
+              for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in
+                             [('commission_id', np.int32), ('member_id', np.int32), ('status', attendance_facts.status_dtype),
+                              ('is_permanent', bool), ('count', np.int64)]})
+    counts = pd.concat(frames, ignore_index=True).groupby(key_columns, observed=True)['count'].sum()
+    return counts.reset_index()
+
+
+class AttendanceCube:
+    """
+    Monthly cube together with the fact table (for the partial months), see module docstring
+    """
+    def __init__(self, cube_df, attendance_facts_df):
+        self.cube_df = cube_df
+        self.months = cube_df['month'].to_numpy(dtype='datetime64[D]')
+        # Facts sorted by date, to select the facts of a partial month with two binary searches
+        dates = attendance_facts_df['date'].to_numpy(dtype='datetime64[D]')
+        if np.any(dates[1:] < dates[:-1]):
+            order = np.argsort(dates, kind='stable')
+            attendance_facts_df, dates = attendance_facts_df.iloc[order], dates[order]
+        self.facts_df = attendance_facts_df
+        self.dates = dates
+
+    def _facts_between(self, start, end):
+        # Facts with start <= date <= end (numpy datetime64[D])
+        return self.facts_df.iloc[np.searchsorted(self.dates, start, side='left'):np.searchsorted(self.dates, end, side='right')]
+
+    def counts(self, start_date, end_date, commission_ids=None):
+        """
+        Obtain counts per commission, member, status and permanent membership of the meetings between start_date and
+        end_date (both included), of commission_ids (default: all): dataframe with key_columns and 'count'
+        """
+        start = np.datetime64(pd.Timestamp(start_date).date(), 'D')
+        end = np.datetime64(pd.Timestamp(end_date).date(), 'D')
+        # First and last month completely inside the range
+        first_month = start.astype('datetime64[M]')
+        if first_month.astype('datetime64[D]') != start:
+            first_month = first_month + 1
+        last_month = end.astype('datetime64[M]')
+        if (last_month + 1).astype('datetime64[D]') - 1 != end:
+            last_month = last_month - 1
+
+        if first_month > last_month:
+            parts = [self._facts_between(start, end)]
+        else:
+            whole_months = self.cube_df.iloc[np.searchsorted(self.months, first_month.astype('datetime64[D]'), side='left'):
+                                             np.searchsorted(self.months, last_month.astype('datetime64[D]'), side='right')]
+            parts = [self._facts_between(start, first_month.astype('datetime64[D]') - 1),
+                     whole_months,
+                     self._facts_between((last_month + 1).astype('datetime64[D]'), end)]
+        if commission_ids is not None:
+            commission_ids = list(commission_ids)
+            parts = [part[part['commission_id'].isin(commission_ids)] for part in parts]
+        return _sum_counts(parts)
+
+    def raw_counts(self, start_date, end_date, commission_ids=None):
+        """
+        Same as counts(), counting all individual facts of the range (without the cube)
+        """
+        facts_df = attendance_facts.filter_attendance_facts(self.facts_df, start_date, end_date, commission_ids)
+        return _sum_counts([facts_df])
+
+    def member_totals(self, start_date, end_date, commission_ids=None, permanent=False):
+        """
+        Obtain dataframe (indexed by member_id, a column per status) of how often each member had each status
+        in the meetings of the range (only counting permanent members if permanent)
+        """
+        counts = self.counts(start_date, end_date, commission_ids)
+        if permanent:
+            counts = counts[counts['is_permanent']]
+        return (counts.groupby(['member_id', 'status'], observed=False)['count'].sum()
+                .unstack('status', fill_value=0).reindex(columns=attendance_facts.STATUSES, fill_value=0))
+
+
+def verify(attendance_cube, ranges):
+    """
+    Check that counts() and raw_counts() are equal for each (start_date, end_date) of ranges.
+    Returns the ranges for which they differ.
+    """
+    differences = []
+    for start_date, end_date in ranges:
+        cube_counts = attendance_cube.counts(start_date, end_date).sort_values(key_columns, ignore_index=True)
+        raw_counts = attendance_cube.raw_counts(start_date, end_date).sort_values(key_columns, ignore_index=True)
+        if not cube_counts.astype({'count': np.int64}).equals(raw_counts.astype({'count': np.int64})):
+            differences.append((start_date, end_date))
+    return differences
+
+
+if __name__ == '__main__':
+    # Verify the stored cube against the fact table, for random date ranges (and a few edge cases)
+    attendance_facts_df, _ = attendance_facts.load_attendance_facts()
+    attendance_cube = AttendanceCube(load_attendance_cube(attendance_facts_df=attendance_facts_df), attendance_facts_df)
+    first_date, last_date = attendance_facts_df['date'].min(), attendance_facts_df['date'].max()
+    days = pd.date_range(first_date - pd.Timedelta(days=40), last_date + pd.Timedelta(days=40))
+    random_generator = np.random.default_rng(0)
+    ranges = [(first_date, last_date), (first_date.replace(day=1), last_date), (last_date, first_date)]
+    for _ in range(int(sys.argv[1]) if len(sys.argv) > 1 else 200):
+        start_date, end_date = sorted(random_generator.choice(days, size=2))
+        ranges.append((start_date, end_date))
+    differences = verify(attendance_cube, ranges)
+    print(f"{len(attendance_cube.cube_df)} rows in cube for {len(attendance_facts_df)} facts: "
+          f"{len(ranges) - len(differences)} of {len(ranges)} date ranges equal" +
+          (f", different for {differences}" if differences else ""))
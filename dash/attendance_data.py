@@ -0,0 +1,344 @@
+"""
+Shared data access layer of the dash application.
+
+All tabs (attendance per commission / party / member and written questions) obtain their data here,
+instead of each reading the pickles themselves. Each dataset is loaded at most once per process
+(i.e. once per gunicorn worker), on first use, and shared by all modules.
+
+The shared objects are read-only:
+    * the numpy arrays underlying the dataframes are flagged as not writeable, so modifying a value
+      (e.g. with .at or .loc) raises a ValueError. Take a .copy() of a dataframe before adding or modifying columns
+      (e.g. obtain_attendance_statistics() modifies the overview it receives).
+    * dicts are returned as read-only mappings (types.MappingProxyType).
+
+The location of the data can be set through the environment variable ATTENDANCE_DATA_DIR (default: ../data,
+relative to the dash folder).
+
+data_version() identifies the data currently on disk (size and modification time of the data files). When the
+(weekly) update script rewrites the data, the version changes and the loaded datasets are dropped, so they are
+loaded again on next use. The files are checked at most once every ATTENDANCE_DATA_CHECK_INTERVAL seconds (default: 30).
+
+When the Parquet version of the data is available (see columnar_data.py), the meetings, the overview and the fact
+table are read from it, and only the columns the tabs need (meetings_columns, overview_columns). Set the environment
+variable ATTENDANCE_DATA_FORMAT=pickle to read the pickles instead.
+
+The fact table, the monthly cube, the prefix-sum index and the sparse matrices of the attendance are backed by
+memory-mapped files shared by all workers (see shared_arrays.py), instead of a private copy in each worker.
+
+The periods in which members were permanent members of the commissions are read from the membership intervals
+written by the update script (see membership_intervals.py), or built out of the dated overviews and the current one.
+"""
+import hashlib
+import os
+import threading
+import time
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+import attendance_cube
+import attendance_facts
+import attendance_index
+import attendance_matrix
+import attendance_statistics
+import columnar_data
+import member_registry
+import membership_intervals
+import membership_matrix
+import shared_arrays
+
+
+data_dir = os.environ.get("ATTENDANCE_DATA_DIR", "../data")
+version_check_interval = float(os.environ.get("ATTENDANCE_DATA_CHECK_INTERVAL", 30))
+data_format = os.environ.get("ATTENDANCE_DATA_FORMAT", "parquet")
+
+# Columns of the meetings and the overview used by the tabs (only these are read from the Parquet files)
+meetings_columns = ['Datum vergadering', 'commissie.titel'] + attendance_statistics.meeting_count_columns
+overview_columns = (['commissie.id', 'commissie.titel', 'vaste leden', 'aantal vergaderingen']
+                    + [column_name for column_name, _, _ in attendance_statistics.counter_columns]
+                    + attendance_statistics.average_columns)
+
+# Data files the datasets are loaded from (their size and modification time determine the data version)
+data_files = ["meetings_all_commissions_df.pkl", "commissions_overview_df.pkl", "fracties.pkl", "parlementsleden.pkl",
+              attendance_facts.facts_file_name, attendance_facts.members_file_name, attendance_cube.cube_file_name,
+              "details_questions_term_df.pkl", membership_intervals.intervals_file_name,
+              columnar_data.meetings_file_name, columnar_data.overview_file_name,
+              columnar_data.facts_file_name, columnar_data.members_file_name]
+
+# Loaded datasets (name -> object) and time (seconds) it took to load each of them
+_datasets = {}
+load_durations = {}
+_lock = threading.RLock()
+_version = {"version": None, "checked": 0.0}
+
+# Functions called (with the new version) when the data on disk changed, e.g. to warm up caches (see warm_up.py)
+data_change_listeners = []
+
+
+def read_only_frame(df):
+    """
+    Flag the numpy arrays underlying df as not writeable (in place) and return df.
+    Extension arrays (e.g. categoricals) are left as they are.
+    """
+    for values in df._mgr.arrays:
+        if isinstance(values, np.ndarray):
+            values.flags.writeable = False
+    return df
+
+
+def _load_once(name, loader):
+    """
+    Return dataset name, loading it with loader() if not loaded yet (thread safe: loaded only once)
+    """
+    if name not in _datasets:
+        with _lock:
+            if _version["version"] is None:
+                data_version()  # version of the data as loaded
+            if name not in _datasets:
+                start = time.perf_counter()
+                _datasets[name] = loader()
+                load_durations[name] = time.perf_counter() - start
+    return _datasets[name]
+
+
+def compute_data_version():
+    """
+    Compute version of the data on disk: hash of the size and modification time of each data file
+    """
+    version = hashlib.sha1()
+    for file_name in data_files:
+        try:
+            file_stat = os.stat(os.path.join(data_dir, file_name))
+            version.update(f"{file_name}:{file_stat.st_size}:{file_stat.st_mtime_ns};".encode())
+        except FileNotFoundError:
+            version.update(f"{file_name}:missing;".encode())
+    return version.hexdigest()[:16]
+
+
+def data_modified():
+    """
+    Return the most recent modification time (seconds since the epoch) of the data files
+    """
+    modified = 0.0
+    for file_name in data_files:
+        try:
+            modified = max(modified, os.stat(os.path.join(data_dir, file_name)).st_mtime)
+        except FileNotFoundError:
+            pass
+    return modified
+
+
+def data_version():
+    """
+    Return version of the data (see compute_data_version()), checking the files at most once every
+    version_check_interval seconds. If the data changed since the previous check, the loaded datasets are dropped
+    and the data_change_listeners are called.
+    """
+    now = time.monotonic()
+    if _version["version"] is None or now - _version["checked"] >= version_check_interval:
+        changed = False
+        with _lock:
+            if _version["version"] is None or now - _version["checked"] >= version_check_interval:
+                version = compute_data_version()
+                if _version["version"] is not None and version != _version["version"]:
+                    print(f"Data changed (version {_version['version']} -> {version}): reloading datasets on next use")
+                    _datasets.clear()
+                    changed = True
+                _version["version"] = version
+                _version["checked"] = now
+            if changed:
+                for listener in data_change_listeners:
+                    listener(version)
+    return _version["version"]
+
+
+def _read_pickle(file_name):
+    return pd.read_pickle(os.path.join(data_dir, file_name))
+
+
+def use_columnar_data():
+    """
+    Check whether the Parquet version of the data is to be used (see columnar_data.py)
+    """
+    return data_format != "pickle" and columnar_data.columnar_data_available(data_dir)
+
+
+def get_meetings():
+    """
+    All meetings of all commissions, with their attendance (meetings_all_commissions_df).
+    From the Parquet files, only meetings_columns are read (i.e. without the nested attendance columns).
+    """
+    def load():
+        if use_columnar_data():
+            return columnar_data.read_meetings(data_dir, meetings_columns)
+        return _read_pickle("meetings_all_commissions_df.pkl")
+    return _load_once("meetings", lambda: read_only_frame(load()))
+
+
+def get_commissions_overview():
+    """
+    Overview with overall info on each commission (commissions_overview_df).
+    From the Parquet files, only overview_columns are read.
+    """
+    def load():
+        if use_columnar_data():
+            return columnar_data.read_commissions_overview(data_dir, overview_columns)
+        return _read_pickle("commissions_overview_df.pkl")
+    return _load_once("commissions_overview", lambda: read_only_frame(load()))
+
+
+def get_fracties():
+    """
+    Members of each party: {party: [[name, id], ...]}
+    """
+    def load():
+        fracties_dict = MappingProxyType(_read_pickle("fracties.pkl"))
+        # Registry of the members, also used by the helpers of attendance_statistics.py given this dict
+        member_registry.register(fracties_dict, member_registry.MemberRegistry(get_parlementsleden(), fracties_dict))
+        return fracties_dict
+    return _load_once("fracties", load)
+
+
+def get_parlementsleden():
+    """
+    Name and party of each member: {id: [name, party]}
+    """
+    return _load_once("parlementsleden", lambda: MappingProxyType(_read_pickle("parlementsleden.pkl")))
+
+
+def get_member_registry():
+    """
+    Registry of the members of parliament (see member_registry.py), built once out of parlementsleden.pkl and fracties.pkl
+    """
+    return member_registry.registry_for(get_fracties())
+
+
+def get_attendance_facts():
+    """
+    Long format fact table of the attendance and dimension table of the members (see attendance_facts.py)
+    Returns (attendance_facts_df, attendance_members_df)
+    """
+    def read():
+        if use_columnar_data():
+            return columnar_data.read_attendance_facts(data_dir)
+        return attendance_facts.load_attendance_facts(data_dir)
+
+    def load():
+        attendance_facts_df, attendance_members_df = read()
+        if shared_arrays.shared_arrays_enabled:
+            # Numeric fact table memory-mapped (shared by all workers), members (names) are kept in this process
+            attendance_facts_df = shared_arrays.shared_frame("attendance_facts", data_version(), lambda: attendance_facts_df,
+                                                             data_modified())
+        return read_only_frame(attendance_facts_df), read_only_frame(attendance_members_df)
+    return _load_once("attendance_facts", load)
+
+
+def get_attendance_cube():
+    """
+    Monthly cube of the attendance, with the fact table for the partial months (see attendance_cube.py)
+    """
+    def load():
+        attendance_facts_df, _ = get_attendance_facts()
+        read = lambda: attendance_cube.load_attendance_cube(data_dir, attendance_facts_df)
+        if shared_arrays.shared_arrays_enabled:
+            cube_df = shared_arrays.shared_frame("attendance_cube", data_version(), read, data_modified())
+        else:
+            cube_df = read()
+        return attendance_cube.AttendanceCube(read_only_frame(cube_df), attendance_facts_df)
+    return _load_once("attendance_cube", load)
+
+
+def get_attendance_index():
+    """
+    Prefix-sum index of the attendance (see attendance_index.py)
+    """
+    def build():
+        attendance_facts_df, attendance_members_df = get_attendance_facts()
+        return attendance_index.AttendanceIndex(get_meetings(), get_commissions_overview(),
+                                                attendance_facts_df, attendance_members_df)
+
+    def load():
+        if not shared_arrays.shared_arrays_enabled:
+            return build()
+        # Arrays of the index memory-mapped (shared by all workers), built by the first worker that needs them
+        arrays, _ = shared_arrays.load_or_create("attendance_index", data_version(), lambda: (build().to_arrays(), {}),
+                                                 data_modified())
+        return attendance_index.AttendanceIndex.from_arrays(arrays, get_meetings(), get_commissions_overview(),
+                                                            get_attendance_facts()[1])
+    return _load_once("attendance_index", load)
+
+
+def get_attendance_matrices():
+    """
+    Sparse member × meeting matrices of the attendance (see attendance_matrix.py)
+    """
+    def build():
+        attendance_facts_df, attendance_members_df = get_attendance_facts()
+        return attendance_matrix.AttendanceMatrices(get_meetings(), get_commissions_overview(), attendance_facts_df,
+                                                    attendance_members_df, get_parlementsleden())
+
+    def load():
+        if not shared_arrays.shared_arrays_enabled:
+            return build()
+        # Arrays of the matrices memory-mapped (shared by all workers), built by the first worker that needs them
+        # (named by the layout of the arrays, so files written by an earlier layout for the same data are not reused)
+        arrays, _ = shared_arrays.load_or_create(f"attendance_matrices_{attendance_matrix.array_layout}", data_version(),
+                                                 lambda: (build().to_arrays(), {}),
+                                                 data_modified())
+        member_names = attendance_matrix.obtain_member_names(np.asarray(arrays['member_ids']), get_attendance_facts()[1],
+                                                             get_parlementsleden())
+        return attendance_matrix.AttendanceMatrices.from_arrays(arrays, member_names)
+    return _load_once("attendance_matrices", load)
+
+
+def get_composition_snapshots():
+    """
+    Historical compositions of the commissions, out of the dated overviews written by the extraction script
+    (commissions_overview_df_<YYYY-MM-DD>.pkl, in the data folder or in old_data): {date: overview with 'commissie.id',
+    'commissie.titel' and 'vaste leden'}, sorted by date. The current overview (undated) is not included.
+    """
+    def load():
+        snapshots = membership_intervals.read_composition_snapshots(data_dir)
+        return MappingProxyType({snapshot_date: read_only_frame(snapshot) for snapshot_date, snapshot in snapshots.items()})
+    return _load_once("composition_snapshots", load)
+
+
+def get_composition(snapshot_date=None):
+    """
+    Composition of the commissions ('commissie.id', 'commissie.titel', 'vaste leden') on snapshot_date: the most recent
+    snapshot on or before that date (see get_composition_snapshots()). The current overview if snapshot_date is None,
+    or if there is no snapshot on or before that date.
+    """
+    if snapshot_date is not None:
+        snapshot = membership_matrix.snapshot_on(get_composition_snapshots(), snapshot_date)
+        if snapshot is not None:
+            return snapshot
+    return get_commissions_overview()[['commissie.id', 'commissie.titel', 'vaste leden']]
+
+
+def get_membership_intervals():
+    """
+    Index on the periods in which each member was a permanent member of each commission (see membership_intervals.py).
+    Read from the intervals written by the update script. If not written yet, built out of the dated overviews
+    (get_composition_snapshots()) and the current overview, assumed to be observed on the date of the most recent meeting
+    (or of the most recent dated overview, if later).
+    """
+    def load():
+        intervals_df = membership_intervals.load_membership_intervals(data_dir)
+        if intervals_df is None:
+            registry, attendance_members_df = get_member_registry(), get_attendance_facts()[1]
+            snapshots = get_composition_snapshots()
+            intervals_df = membership_intervals.build_membership_intervals(snapshots, registry, attendance_members_df)
+            observed_on = max(pd.Timestamp(observed_on) for observed_on in [get_meetings()['Datum vergadering'].max(), *snapshots.keys()])
+            intervals_df = membership_intervals.update_membership_intervals(
+                intervals_df, get_commissions_overview(), observed_on, registry, attendance_members_df)
+        return membership_intervals.MembershipIntervals(intervals_df)
+    return _load_once("membership_intervals", load)
+
+
+def get_written_questions():
+    """
+    Details of all written questions of the current term (details_questions_term_df, see code/questions.py)
+    """
+    return _load_once("written_questions", lambda: read_only_frame(_read_pickle("details_questions_term_df.pkl")))
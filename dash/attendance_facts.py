@@ -0,0 +1,172 @@
+"""
+Normalized (long format) version of the attendance data: one row per member per meeting.
+
+In meetings_all_commissions_df, attendance is stored as lists of {'Naam', 'id', 'Fractie'} dicts
+in the columns 'AANWEZIG', 'AFWEZIG', 'VERONTSCHULDIGD' (and their '_vast' versions). Here, the same
+information is stored as a flat fact table with integer and categorical columns:
+
+    meeting_id | commission_id | date | member_id | status | is_permanent
+
+together with a small dimension table of the members (member_id | Naam | Fractie).
+This allows to obtain any aggregation with a groupby instead of looping over nested lists.
+
+The fact table is written by the extraction and update scripts (see code folder). If it is not
+available, load_attendance_facts() builds it out of the meetings dataframe.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Attendance statuses, in the order of the columns of meetings_all_commissions_df
+STATUSES = ['AANWEZIG', 'AFWEZIG', 'VERONTSCHULDIGD']
+status_dtype = pd.CategoricalDtype(STATUSES)
+
+default_data_dir = '../data'
+facts_file_name = 'attendance_facts.pkl'
+members_file_name = 'attendance_members.pkl'
+
+
+def meeting_ids_from_index(index):
+    """
+    Obtain meeting ids out of index of meetings dataframe (e.g. 'Vergadering 1622819' -> 1622819)
+    """
+    return pd.Index(index).str.rsplit(" ", n=1).str[-1].astype(np.int64).to_numpy()
+
+
+def explode_attendance_column(meetings_df, column_name):
+    """
+    Explode column with lists of {'Naam', 'id', 'Fractie'} dicts into one row per member,
+    keeping the position of the meeting in meetings_df ('meeting_position').
+    """
+    exploded = meetings_df[column_name].reset_index(drop=True).explode()
+    # Cells without list (NaN / None) result in a NaN row: drop those
+    exploded = exploded[exploded.map(lambda member: isinstance(member, dict))]
+    if exploded.empty:
+        return pd.DataFrame({'meeting_position': pd.Series(dtype=np.int64), 'member_id': pd.Series(dtype=np.int64),
+                             'Naam': pd.Series(dtype=object), 'Fractie': pd.Series(dtype=object)})
+    return pd.DataFrame({'meeting_position': exploded.index.to_numpy(),
+                         'member_id': exploded.str.get('id').to_numpy(dtype=np.int64),
+                         'Naam': exploded.str.get('Naam').to_numpy(dtype=object),
+                         'Fractie': exploded.str.get('Fractie').to_numpy(dtype=object)})
+
+
+def build_attendance_facts(meetings_all_commissions_df, commissions_overview_df):
+    """
+    Build fact table (and member dimension) out of meetings_all_commissions_df.
+
+    Rows are ordered like the meetings in meetings_all_commissions_df, and within a meeting like
+    the lists of members. Hence, counting members in order of the fact table gives the same
+    order (e.g. for ties) as counting them by looping over the lists.
+
+    Returns (attendance_facts_df, attendance_members_df)
+    """
+    # Map commission titles to ids (meetings dataframe only contains the title)
+    title_to_id = dict(zip(commissions_overview_df['commissie.titel'], commissions_overview_df['commissie.id']))
+    commission_ids = meetings_all_commissions_df['commissie.titel'].astype(object).map(title_to_id).fillna(-1).to_numpy(dtype=np.int64)
+    meeting_ids = meeting_ids_from_index(meetings_all_commissions_df.index)
+    dates = pd.to_datetime(meetings_all_commissions_df['Datum vergadering']).to_numpy()
+
+    facts_per_status = []
+    for status in STATUSES:
+        if status not in meetings_all_commissions_df.columns:
+            continue
+        status_df = explode_attendance_column(meetings_all_commissions_df, status)
+        status_df['status'] = status
+
+        # A member is permanent for a meeting if also listed in the '_vast' version of the column
+        status_df['is_permanent'] = False
+        if f'{status}_vast' in meetings_all_commissions_df.columns:
+            permanent_df = explode_attendance_column(meetings_all_commissions_df, f'{status}_vast')
+            permanent_keys = pd.MultiIndex.from_arrays([permanent_df['meeting_position'], permanent_df['member_id']])
+            status_df['is_permanent'] = pd.MultiIndex.from_arrays(
+                [status_df['meeting_position'], status_df['member_id']]).isin(permanent_keys)
+        facts_per_status.append(status_df)
+
+    if not facts_per_status:
+        # No attendance information at all (e.g. no new meetings): explode empty column to obtain empty frame
+        facts_per_status.append(explode_attendance_column(pd.DataFrame({'empty': []}), 'empty').assign(status=None, is_permanent=False))
+
+    long_df = pd.concat(facts_per_status, ignore_index=True)
+    # Stable sort: keeps the order of the members within each meeting (and status)
+    long_df = long_df.sort_values('meeting_position', kind='stable', ignore_index=True)
+    positions = long_df['meeting_position'].to_numpy()
+
+    attendance_facts_df = pd.DataFrame({
+        'meeting_id': meeting_ids[positions].astype(np.int32),
+        'commission_id': commission_ids[positions].astype(np.int32),
+        'date': dates[positions],
+        'member_id': long_df['member_id'].to_numpy(dtype=np.int32),
+        'status': pd.Categorical(long_df['status'], dtype=status_dtype),
+        'is_permanent': long_df['is_permanent'].to_numpy(dtype=bool),
+    })
+
+    # Member dimension: name and most recent party of each member
+    long_df['date'] = dates[positions]
+    attendance_members_df = (long_df.sort_values('date', kind='stable')
+                             .drop_duplicates('member_id', keep='last')
+                             [['member_id', 'Naam', 'Fractie']]
+                             .astype({'member_id': np.int32})
+                             .sort_values('member_id', ignore_index=True))
+
+    return attendance_facts_df, attendance_members_df
+
+
+def save_attendance_facts(attendance_facts_df, attendance_members_df, data_dir=default_data_dir, file_suffix=""):
+    """
+    Save fact table and member dimension (file_suffix allows to add e.g. the extraction date to the file names)
+    """
+    attendance_facts_df.to_pickle(os.path.join(data_dir, facts_file_name.replace('.pkl', f'{file_suffix}.pkl')))
+    attendance_members_df.to_pickle(os.path.join(data_dir, members_file_name.replace('.pkl', f'{file_suffix}.pkl')))
+
+
+def append_attendance_facts(new_meetings_df, commissions_overview_df, data_dir=default_data_dir):
+    """
+    Build fact table for new meetings and append it (and new members) to the stored fact table.
+    Used by the incremental update: only the new meetings need to be processed.
+    """
+    new_facts_df, new_members_df = build_attendance_facts(new_meetings_df, commissions_overview_df)
+    attendance_facts_df, attendance_members_df = load_attendance_facts(data_dir)
+
+    # Remove facts of meetings that are appended again (e.g. when a previous update was interrupted)
+    already_stored = pd.MultiIndex.from_arrays([attendance_facts_df['meeting_id'], attendance_facts_df['commission_id']]).isin(
+        pd.MultiIndex.from_arrays([new_facts_df['meeting_id'], new_facts_df['commission_id']]))
+    attendance_facts_df = pd.concat([attendance_facts_df[~already_stored], new_facts_df], ignore_index=True)
+    # Keep most recent name and party of each member
+    attendance_members_df = (pd.concat([attendance_members_df, new_members_df], ignore_index=True)
+                             .drop_duplicates('member_id', keep='last')
+                             .sort_values('member_id', ignore_index=True))
+    attendance_facts_df['status'] = attendance_facts_df['status'].astype(status_dtype)
+
+    save_attendance_facts(attendance_facts_df, attendance_members_df, data_dir)
+    return attendance_facts_df, attendance_members_df
+
+
+def load_attendance_facts(data_dir=default_data_dir):
+    """
+    Load fact table and member dimension. If not stored yet, build them out of the meetings dataframe.
+    Returns (attendance_facts_df, attendance_members_df)
+    """
+    facts_path = os.path.join(data_dir, facts_file_name)
+    members_path = os.path.join(data_dir, members_file_name)
+    if os.path.exists(facts_path) and os.path.exists(members_path):
+        return pd.read_pickle(facts_path), pd.read_pickle(members_path)
+
+    meetings_all_commissions_df = pd.read_pickle(os.path.join(data_dir, 'meetings_all_commissions_df.pkl'))
+    commissions_overview_df = pd.read_pickle(os.path.join(data_dir, 'commissions_overview_df.pkl'))
+    return build_attendance_facts(meetings_all_commissions_df, commissions_overview_df)
+
+
+def filter_attendance_facts(attendance_facts_df, start_date=None, end_date=None, commission_ids=None):
+    """
+    Select facts of meetings between start_date and end_date (both included) and of the given commissions.
+    """
+    mask = np.ones(len(attendance_facts_df), dtype=bool)
+    if start_date is not None:
+        mask &= (attendance_facts_df['date'] >= pd.Timestamp(start_date)).to_numpy()
+    if end_date is not None:
+        mask &= (attendance_facts_df['date'] <= pd.Timestamp(end_date)).to_numpy()
+    if commission_ids is not None:
+        mask &= attendance_facts_df['commission_id'].isin(commission_ids).to_numpy()
+    return attendance_facts_df[mask]
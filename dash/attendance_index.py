@@ -0,0 +1,267 @@
+"""
+Prefix-sum index of the attendance data, to answer date range queries without filtering and counting again.
+
+For each commission, the meetings are sorted by date, and for each member and each counter column of
+attendance_statistics.counter_columns (present / absent / excused, for all members and for permanent members)
+the cumulative amount of meetings is stored:
+
+    cumulative[column, member, k] = amount of times member had the status of column in the first k meetings
+
+The counts of a date range then follow from two binary searches on the dates of the commission and one
+subtraction (cumulative[..., end] - cumulative[..., start]), regardless of the amount of meetings loaded.
+The sums of the meeting count columns ('Aantal aanwezig alle leden', ...) are stored the same way, to obtain
+the averages.
+
+To obtain exactly the same counters as obtain_attendance_statistics() (i.e. with ties in order of first
+appearance), the position in the fact table of the first appearance of each member in each meeting is stored as well:
+the first meeting of the range in which a member appears follows from a binary search on its cumulative counts.
+
+All arrays of the index can be exported (to_arrays()) and the index rebuilt out of them (from_arrays()), e.g. out of
+memory-mapped files shared by all workers (see shared_arrays.py).
+"""
+import numpy as np
+import pandas as pd
+
+import attendance_facts
+import attendance_statistics
+
+
+class CommissionIndex:
+    """
+    Prefix sums of the meetings of one commission (see module docstring)
+    """
+    def __init__(self, meeting_positions, dates, meeting_counts, member_ids, member_names, cumulative, first_keys, first_positions):
+        self.meeting_positions = meeting_positions  # positions of the meetings in meetings dataframe, sorted by date
+        self.dates = dates                          # dates of the meetings (datetime64[D], sorted)
+        self.meeting_counts = meeting_counts        # cumulative sums of meeting count columns, shape (meetings + 1, 6)
+        self.member_ids = member_ids                # ids of the members that attended (or not) a meeting of the commission
+        self.member_names = member_names            # names of these members
+        self.cumulative = cumulative                # cumulative counts, shape (6 * members, meetings + 1), see below
+        self.first_keys = first_keys                # sorted keys (meeting, member, column) ...
+        self.first_positions = first_positions      # ... and position of their first fact in the fact table
+
+        # Add an offset to each row of cumulative, so the flattened array is sorted and a single binary search
+        # can be performed for all members and columns at once (the offset is removed by each subtraction)
+        self.row_length = cumulative.shape[1]
+        self.offset = int(cumulative.max(initial=0)) + 1
+        self.cumulative = cumulative + (np.arange(cumulative.shape[0], dtype=np.int64) * self.offset)[:, None]
+        self.flattened = self.cumulative.ravel()
+
+    # Arrays describing a CommissionIndex (cumulative is stored with its offset, see __init__)
+    array_names = ['meeting_positions', 'dates', 'meeting_counts', 'member_ids', 'cumulative', 'first_keys', 'first_positions']
+
+    def to_arrays(self):
+        """
+        Obtain the arrays of the index: {name: array}
+        """
+        arrays = {name: getattr(self, name) for name in self.array_names}
+        arrays['offset'] = np.array([self.offset], dtype=np.int64)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, member_names):
+        """
+        Rebuild index out of the arrays of to_arrays() (used as they are, e.g. memory-mapped, without copying)
+        """
+        commission_index = cls.__new__(cls)
+        for name in cls.array_names:
+            setattr(commission_index, name, arrays[name])
+        commission_index.member_names = member_names
+        commission_index.offset = int(arrays['offset'][0])
+        commission_index.row_length = commission_index.cumulative.shape[1]
+        commission_index.flattened = commission_index.cumulative.reshape(-1)
+        return commission_index
+
+    def date_range(self, start_date=None, end_date=None):
+        """
+        Obtain (start, end) such that meetings start up to end (not included) are held between start_date and end_date
+        """
+        start = 0 if start_date is None else int(np.searchsorted(self.dates, np.datetime64(start_date, 'D'), side='left'))
+        end = len(self.dates) if end_date is None else int(np.searchsorted(self.dates, np.datetime64(end_date, 'D'), side='right'))
+        return start, max(start, end)
+
+    def counts(self, start, end):
+        """
+        Obtain counts of meetings start up to end, shape (6, members)
+        """
+        return (self.cumulative[:, end] - self.cumulative[:, start]).reshape(len(attendance_statistics.counter_columns), -1)
+
+    def averages(self, start, end):
+        """
+        Obtain average of each meeting count column over meetings start up to end (NaN if no meetings)
+        """
+        if end == start:
+            return np.full(self.meeting_counts.shape[1], np.nan)
+        return (self.meeting_counts[end] - self.meeting_counts[start]) / (end - start)
+
+    def counters(self, start, end):
+        """
+        Obtain counters of meetings start up to end: {counter column: [(member, count), ...]}, sorted by count
+        (descending), ties in order of first appearance (as obtain_attendance_counter())
+        """
+        counts = self.counts(start, end).ravel()
+        rows = np.flatnonzero(counts)
+        if len(rows) == 0:
+            return {}
+
+        # First meeting (from start onwards) in which the cumulative count increases
+        targets = self.cumulative[rows, start] + 1
+        first_meetings = np.searchsorted(self.flattened, targets, side='left') - rows * self.row_length - 1
+        amount_members = len(self.member_ids)
+        columns, members = np.divmod(rows, amount_members)
+        first_positions = self.first_positions[np.searchsorted(
+            self.first_keys, (first_meetings * amount_members + members) * len(attendance_statistics.counter_columns) + columns)]
+
+        order = np.lexsort((first_positions, -counts[rows], columns))
+        names = self.member_names[members[order]].tolist()
+        sizes = counts[rows][order].tolist()
+        columns = columns[order]
+
+        starts = np.flatnonzero(np.r_[True, np.diff(columns) != 0])
+        ends = np.r_[starts[1:], len(columns)]
+        return {attendance_statistics.counter_columns[columns[start_group]][0]: list(zip(names[start_group:end_group], sizes[start_group:end_group]))
+                for start_group, end_group in zip(starts.tolist(), ends.tolist())}
+
+
+class AttendanceIndex:
+    """
+    Prefix-sum index of all commissions, built out of meetings_all_commissions_df and its fact table
+    (see attendance_facts.py).
+    """
+    def __init__(self, meetings_all_commissions_df, commissions_overview_df, attendance_facts_df, attendance_members_df):
+        self.meetings_all_commissions_df = meetings_all_commissions_df
+        self.member_names = attendance_members_df.set_index('member_id')['Naam']
+
+        # Commission id of each meeting (-1 if the commission is not in the overview)
+        title_to_id = dict(zip(commissions_overview_df['commissie.titel'], commissions_overview_df['commissie.id']))
+        self.title_to_id = title_to_id
+        meeting_commission_ids = meetings_all_commissions_df['commissie.titel'].astype(object).map(title_to_id).fillna(-1).to_numpy(dtype=np.int64)
+        meeting_dates = pd.to_datetime(meetings_all_commissions_df['Datum vergadering']).to_numpy().astype('datetime64[D]')
+        meeting_counts = meetings_all_commissions_df[attendance_statistics.meeting_count_columns].to_numpy(dtype=float)
+
+        # Link each fact to (the first occurrence of) its meeting in the meetings dataframe
+        meeting_keys = attendance_statistics.meeting_commission_keys(
+            attendance_facts.meeting_ids_from_index(meetings_all_commissions_df.index), meeting_commission_ids)
+        unique_keys, first_occurrence = np.unique(meeting_keys, return_index=True)
+        fact_keys = attendance_statistics.meeting_commission_keys(attendance_facts_df['meeting_id'].to_numpy(),
+                                                                  attendance_facts_df['commission_id'].to_numpy())
+        found = np.clip(np.searchsorted(unique_keys, fact_keys), 0, max(len(unique_keys) - 1, 0))
+        is_linked = unique_keys[found] == fact_keys if len(unique_keys) else np.zeros(len(fact_keys), dtype=bool)
+        fact_meetings = first_occurrence[found] if len(unique_keys) else np.zeros(len(fact_keys), dtype=np.int64)
+
+        fact_positions = np.flatnonzero(is_linked)
+        fact_meetings = fact_meetings[is_linked]
+        fact_commission_ids = meeting_commission_ids[fact_meetings]
+        fact_member_ids = attendance_facts_df['member_id'].to_numpy()[is_linked]
+        fact_statuses = attendance_facts_df['status'].cat.codes.to_numpy().astype(np.int64)[is_linked]
+        fact_is_permanent = attendance_facts_df['is_permanent'].to_numpy()[is_linked]
+
+        self.commissions = {}
+        for commission_id in np.unique(meeting_commission_ids):
+            # Meetings of commission sorted by date (stable: meetings on the same date keep their order)
+            positions = np.flatnonzero(meeting_commission_ids == commission_id)
+            positions = positions[np.argsort(meeting_dates[positions], kind='stable')]
+            local_meetings = np.full(len(meetings_all_commissions_df), -1, dtype=np.int64)
+            local_meetings[positions] = np.arange(len(positions))
+
+            # Facts of commission: each fact counts for its status, and if permanent also for the permanent status
+            in_commission = fact_commission_ids == commission_id
+            member_ids, members = np.unique(fact_member_ids[in_commission], return_inverse=True)
+            meetings = local_meetings[fact_meetings[in_commission]]
+            statuses = fact_statuses[in_commission]
+            is_permanent = fact_is_permanent[in_commission]
+            facts = fact_positions[in_commission]
+
+            columns = np.r_[statuses, statuses[is_permanent] + len(attendance_facts.STATUSES)]
+            meetings = np.r_[meetings, meetings[is_permanent]]
+            members = np.r_[members, members[is_permanent]]
+            facts = np.r_[facts, facts[is_permanent]]
+
+            amount_columns = len(attendance_statistics.counter_columns)
+            counts = np.zeros((amount_columns * len(member_ids), len(positions) + 1), dtype=np.int64)
+            np.add.at(counts, (columns * len(member_ids) + members, meetings + 1), 1)
+
+            # Position of first fact of each (meeting, member, column)
+            keys = (meetings * len(member_ids) + members) * amount_columns + columns
+            order = np.lexsort((facts, keys))
+            keys, facts = keys[order], facts[order]
+            is_first = np.r_[True, np.diff(keys) != 0]
+
+            self.commissions[int(commission_id)] = CommissionIndex(
+                meeting_positions=positions,
+                dates=meeting_dates[positions],
+                meeting_counts=np.vstack([np.zeros((1, meeting_counts.shape[1])), np.cumsum(meeting_counts[positions], axis=0)]),
+                member_ids=member_ids,
+                member_names=self.member_names.reindex(member_ids).to_numpy(dtype=object),
+                cumulative=np.cumsum(counts, axis=1),
+                first_keys=keys[is_first],
+                first_positions=facts[is_first])
+
+    def to_arrays(self):
+        """
+        Obtain the arrays of the index of each commission: {'<commission id>/<name>': array}
+        """
+        return {f"{commission_id}/{name}": array
+                for commission_id, commission_index in self.commissions.items()
+                for name, array in commission_index.to_arrays().items()}
+
+    @classmethod
+    def from_arrays(cls, arrays, meetings_all_commissions_df, commissions_overview_df, attendance_members_df):
+        """
+        Rebuild index out of the arrays of to_arrays(), without the fact table
+        """
+        attendance_index = cls.__new__(cls)
+        attendance_index.meetings_all_commissions_df = meetings_all_commissions_df
+        attendance_index.member_names = attendance_members_df.set_index('member_id')['Naam']
+        attendance_index.title_to_id = dict(zip(commissions_overview_df['commissie.titel'], commissions_overview_df['commissie.id']))
+
+        arrays_per_commission = {}
+        for key, array in arrays.items():
+            commission_id, name = key.split("/")
+            arrays_per_commission.setdefault(int(commission_id), {})[name] = array
+        attendance_index.commissions = {
+            commission_id: CommissionIndex.from_arrays(
+                commission_arrays,
+                attendance_index.member_names.reindex(commission_arrays['member_ids']).to_numpy(dtype=object))
+            for commission_id, commission_arrays in arrays_per_commission.items()}
+        return attendance_index
+
+    def meeting_positions(self, start_date=None, end_date=None, commission_ids=None):
+        """
+        Obtain positions (in meetings dataframe, in its order) of the meetings of commission_ids between start_date and end_date
+        """
+        if commission_ids is None:
+            commission_ids = self.commissions.keys()
+        ranges = [(self.commissions[commission_id], self.commissions[commission_id].date_range(start_date, end_date))
+                  for commission_id in commission_ids if commission_id in self.commissions]
+        positions = [commission_index.meeting_positions[start:end] for commission_index, (start, end) in ranges]
+        return np.sort(np.concatenate(positions)) if positions else np.array([], dtype=np.int64)
+
+    def filter_meetings(self, start_date=None, end_date=None, commission_title=None):
+        """
+        Select meetings between start_date and end_date (both included), of commission_title (or all commissions if None).
+        Gives the same result as filtering meetings_all_commissions_df with boolean masks on 'Datum vergadering'.
+        """
+        if commission_title is None:
+            commission_ids = None
+        else:
+            commission_ids = [self.title_to_id.get(commission_title, -1)]
+        return self.meetings_all_commissions_df.iloc[self.meeting_positions(start_date, end_date, commission_ids)]
+
+    def obtain_attendance_statistics(self, commissions_overview_df_input, start_date=None, end_date=None):
+        """
+        Same as attendance_statistics.obtain_attendance_statistics() for the meetings between start_date and end_date,
+        but answered by the prefix sums. Modifies and returns commissions_overview_df_input.
+        """
+        counters = {}
+        averages = np.full((len(commissions_overview_df_input), len(attendance_statistics.average_columns)), np.nan)
+        for i, commission_id in enumerate(commissions_overview_df_input['commissie.id'].tolist()):
+            commission_index = self.commissions.get(int(commission_id))
+            if commission_index is None:
+                continue
+            start, end = commission_index.date_range(start_date, end_date)
+            for column_name, counter in commission_index.counters(start, end).items():
+                counters[(int(commission_id), column_name)] = counter
+            averages[i] = commission_index.averages(start, end)
+
+        return attendance_statistics.fill_attendance_statistics(commissions_overview_df_input, counters, averages)
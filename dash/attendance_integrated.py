@@ -6,6 +6,9 @@ import attendance_permanent_members_per_comm_integrated
 import attendance_per_party_integrated
 import attendance_per_member_integrated 
 import written_questions
+import background_callbacks
+import callback_metrics
+import warm_up
 
 
 app = dash.Dash(__name__, 
@@ -89,12 +92,22 @@ app.layout = html.Div([
 
   
     
+# Optionally run the expensive callbacks as background callbacks, using a local disk-based job manager
+# (None if not enabled through ATTENDANCE_BACKGROUND_CALLBACKS=1, see background_callbacks.py)
+background_callback_manager = background_callbacks.create_manager()
+
 # Register callbacks for each visualization
-attendance_permanent_members_per_comm_integrated.register_callbacks(app)
-attendance_per_party_integrated.register_callbacks(app)
-attendance_per_member_integrated.register_callbacks(app) 
+attendance_permanent_members_per_comm_integrated.register_callbacks(app, background_callback_manager)
+attendance_per_party_integrated.register_callbacks(app, background_callback_manager)
+attendance_per_member_integrated.register_callbacks(app, background_callback_manager) 
 written_questions.register_callbacks(app)
 
+# Record duration, inputs and response size of every callback, reported on /metrics (see callback_metrics.py)
+callback_metrics.instrument_callbacks(app)
+callback_metrics.register_metrics_route(app)
+
+# Warm up the result caches in a background thread, so gunicorn workers boot (and accept requests) right away
+warm_up.warm_up_in_background()
 
 # Define a callable application object for Gunicorn
 application = app.server
@@ -0,0 +1,198 @@
+"""
+Sparse member × meeting matrices of the attendance, to obtain totals per member or per commission for any selection.
+
+For each attendance status (present / absent / excused, see attendance_facts.STATUSES) a CSR sparse matrix is built
+with a row per meeting (in the order of meetings_all_commissions_df) and a column per member:
+
+    status_matrices[status][meeting, member]            = amount of times member had status in meeting
+    permanent_status_matrices[status][meeting, member]  = idem, only counting members listed as permanent member
+                                                          (the '_vast' columns)
+
+together with matrices of the same structure holding the position of the first fact of each entry in the fact table
+(status_positions, permanent_status_positions), to order members with the same count by their first appearance.
+
+A selection of commissions and a date range is a selection of rows (rows_of() for the meetings of a filtered meetings
+dataframe), and totals follow from a column sum over these rows (member_counts(), by name), or per commission
+(commission_member_totals()) from a sparse matrix product. No nested lists are walked.
+
+All arrays can be exported (to_arrays()) and the matrices rebuilt out of them (from_arrays()), e.g. out of
+memory-mapped files shared by all workers (see shared_arrays.py).
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import attendance_facts
+import attendance_statistics
+
+
+# Version of the arrays of to_arrays(), changed whenever arrays are added or removed
+array_layout = 2
+
+
+def obtain_member_names(member_ids, attendance_members_df, parlementsleden_all_dict=None):
+    """
+    Obtain name of each member of member_ids: from the member dimension, otherwise from parlementsleden_all_dict
+    """
+    names = attendance_members_df.set_index('member_id')['Naam'].reindex(member_ids)
+    if parlementsleden_all_dict is not None:
+        names = names.fillna(pd.Series([parlementsleden_all_dict.get(member_id, [None])[0] for member_id in member_ids.tolist()],
+                                       index=names.index))
+    return names.to_numpy(dtype=object)
+
+
+class AttendanceMatrices:
+    """
+    Sparse attendance matrices (see module docstring)
+    """
+    def __init__(self, meetings_all_commissions_df, commissions_overview_df, attendance_facts_df, attendance_members_df,
+                 parlementsleden_all_dict=None):
+        # Columns: all members in the fact table, followed by members of parliament that never attended (or not) a meeting
+        member_ids = attendance_members_df['member_id'].to_numpy(dtype=np.int64)
+        member_names = attendance_members_df['Naam'].tolist()
+        if parlementsleden_all_dict is not None:
+            known_ids = set(member_ids.tolist())
+            extra_members = [(member_id, values[0]) for member_id, values in parlementsleden_all_dict.items()
+                             if member_id not in known_ids]
+            member_ids = np.r_[member_ids, np.array([member_id for member_id, _ in extra_members], dtype=np.int64)]
+            member_names = member_names + [name for _, name in extra_members]
+        order = np.argsort(member_ids, kind='stable')
+        self.member_ids = member_ids[order]
+        self.member_names = np.array(member_names, dtype=object)[order]
+
+        # Rows: meetings, with the position of their commission in the overview (-1 if not in overview)
+        commission_ids = commissions_overview_df['commissie.id'].to_numpy(dtype=np.int64)
+        title_to_id = dict(zip(commissions_overview_df['commissie.titel'], commission_ids))
+        meeting_commission_ids = meetings_all_commissions_df['commissie.titel'].astype(object).map(title_to_id).fillna(-1).to_numpy(dtype=np.int64)
+        self.commission_ids = commission_ids
+        self.meeting_commissions = pd.Index(commission_ids).get_indexer(meeting_commission_ids).astype(np.int64)
+
+        # Link each fact to (the first occurrence of) its meeting, as in attendance_index.py
+        meeting_keys = attendance_statistics.meeting_commission_keys(
+            attendance_facts.meeting_ids_from_index(meetings_all_commissions_df.index), meeting_commission_ids)
+        self.meeting_keys = meeting_keys
+        unique_keys, first_occurrence = np.unique(meeting_keys, return_index=True)
+        fact_keys = attendance_statistics.meeting_commission_keys(attendance_facts_df['meeting_id'].to_numpy(),
+                                                                  attendance_facts_df['commission_id'].to_numpy())
+        found = np.clip(np.searchsorted(unique_keys, fact_keys), 0, max(len(unique_keys) - 1, 0))
+        is_linked = unique_keys[found] == fact_keys if len(unique_keys) else np.zeros(len(fact_keys), dtype=bool)
+        fact_rows = first_occurrence[found][is_linked] if len(unique_keys) else np.zeros(0, dtype=np.int64)
+        fact_columns = np.searchsorted(self.member_ids, attendance_facts_df['member_id'].to_numpy(dtype=np.int64)[is_linked])
+        fact_statuses = attendance_facts_df['status'].cat.codes.to_numpy()[is_linked]
+        fact_is_permanent = attendance_facts_df['is_permanent'].to_numpy()[is_linked]
+
+        fact_positions = np.flatnonzero(is_linked)
+
+        shape = (len(meetings_all_commissions_df), len(self.member_ids))
+        self.status_matrices, self.permanent_status_matrices = {}, {}
+        self.status_positions, self.permanent_status_positions = {}, {}
+        for code, status in enumerate(attendance_facts.STATUSES):
+            selected = fact_statuses == code
+            for matrices, positions, selected_facts in [
+                    (self.status_matrices, self.status_positions, selected),
+                    (self.permanent_status_matrices, self.permanent_status_positions, selected & fact_is_permanent)]:
+                # One entry per (meeting, member): the amount of facts and the position of the first one in the fact table
+                entry_keys = fact_rows[selected_facts].astype(np.int64) * shape[1] + fact_columns[selected_facts]
+                entry_keys, first_facts, amounts = np.unique(entry_keys, return_index=True, return_counts=True)
+                entry_rows, entry_columns = np.divmod(entry_keys, shape[1])
+                indptr = np.r_[0, np.cumsum(np.bincount(entry_rows, minlength=shape[0]))]
+                matrices[status] = sparse.csr_matrix((amounts.astype(np.int32), entry_columns, indptr), shape=shape)
+                positions[status] = sparse.csr_matrix((fact_positions[selected_facts][first_facts], entry_columns, indptr),
+                                                      shape=shape)
+
+    def rows_of(self, meetings_df, commissions_overview_df):
+        """
+        Obtain rows of the meetings of meetings_df (e.g. the meetings of the selected dates) of the commissions of
+        commissions_overview_df. As the counters of the overview (see attendance_statistics.fill_attendance_statistics()),
+        commissions without meetings according to the overview ('aantal vergaderingen') are left out.
+        """
+        if 'aantal vergaderingen' in commissions_overview_df.columns:
+            commissions_overview_df = commissions_overview_df[commissions_overview_df['aantal vergaderingen'] != 0]
+        title_to_id = dict(zip(commissions_overview_df['commissie.titel'], commissions_overview_df['commissie.id']))
+        commission_ids = meetings_df['commissie.titel'].astype(object).map(title_to_id)
+        is_relevant = commission_ids.notna().to_numpy()
+        keys = attendance_statistics.meeting_commission_keys(
+            attendance_facts.meeting_ids_from_index(meetings_df.index[is_relevant]), commission_ids[is_relevant].to_numpy(dtype=np.int64))
+        # First occurrence of each meeting (as the facts, see __init__), keys sorted once
+        if getattr(self, 'key_order', None) is None:
+            self.key_order = np.argsort(self.meeting_keys, kind='stable')
+        order = self.key_order
+        positions = np.clip(np.searchsorted(self.meeting_keys[order], keys), 0, max(len(order) - 1, 0))
+        is_found = self.meeting_keys[order][positions] == keys if len(order) else np.zeros(len(keys), dtype=bool)
+        return np.unique(order[positions[is_found]])
+
+    def matrix(self, status, permanent=False):
+        return (self.permanent_status_matrices if permanent else self.status_matrices)[status]
+
+    def member_counts(self, status, rows=None, permanent=False):
+        """
+        Obtain Series (indexed by name, 'Member') of how often each member had status in the meetings of rows, only
+        members with a count, sorted by count in descending order. Ties keep the order of first appearance of
+        obtain_counter_from_list_counter_likes() over the counters of the overview: commissions in order of the overview,
+        and within each commission by count (descending) and first appearance in the fact table.
+        """
+        if rows is None:
+            rows = np.arange(len(self.meeting_commissions))
+        counts = self.matrix(status, permanent)[rows].tocoo()
+        positions = (self.permanent_status_positions if permanent else self.status_positions)[status][rows].tocoo()
+        commissions = self.meeting_commissions[rows][counts.row]
+
+        # Counters per (commission, member): amount and first position, in the order in which they are walked
+        entries = pd.DataFrame({'commission': commissions, 'column': counts.col, 'count': counts.data,
+                                'position': positions.data}).groupby(['commission', 'column'], sort=False).agg(
+            count=('count', 'sum'), position=('position', 'min')).reset_index()
+        entries = entries.sort_values(['commission', 'count', 'position'], ascending=[True, False, True], kind='stable')
+
+        totals = entries.groupby('column', sort=False)['count'].sum()
+        member_counts = pd.Series(totals.to_numpy(), index=pd.Index(self.member_names[totals.index.to_numpy()], name='Member'))
+        return member_counts.groupby(level=0, sort=False).sum().sort_values(ascending=False, kind='stable')
+
+    def commission_member_totals(self, status, rows=None, permanent=False):
+        """
+        Obtain sparse matrix (commissions × members) of how often each member had status in the meetings
+        of rows of each commission
+        """
+        if rows is None:
+            rows = np.arange(len(self.meeting_commissions))
+        rows = rows[self.meeting_commissions[rows] >= 0]
+        meeting_to_commission = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (self.meeting_commissions[rows], np.arange(len(rows)))),
+            shape=(len(self.commission_ids), len(rows)))
+        return (meeting_to_commission @ self.matrix(status, permanent)[rows]).tocsr()
+
+    def to_arrays(self):
+        """
+        Obtain the arrays of the matrices: {name: array} (CSR matrices as their data, indices and indptr)
+        """
+        arrays = {'member_ids': self.member_ids, 'commission_ids': self.commission_ids, 'meeting_keys': self.meeting_keys,
+                  'meeting_commissions': self.meeting_commissions}
+        csr_matrices = {f'status/{status}': matrix for status, matrix in self.status_matrices.items()}
+        csr_matrices.update({f'permanent/{status}': matrix for status, matrix in self.permanent_status_matrices.items()})
+        csr_matrices.update({f'status_positions/{status}': matrix for status, matrix in self.status_positions.items()})
+        csr_matrices.update({f'permanent_positions/{status}': matrix for status, matrix in self.permanent_status_positions.items()})
+        for name, matrix in csr_matrices.items():
+            arrays.update({f'{name}/data': matrix.data, f'{name}/indices': matrix.indices,
+                           f'{name}/indptr': matrix.indptr, f'{name}/shape': np.array(matrix.shape, dtype=np.int64)})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, member_names):
+        """
+        Rebuild matrices out of the arrays of to_arrays() (used as they are, e.g. memory-mapped, without copying).
+        member_names holds the name of each member in arrays['member_ids'].
+        """
+        def csr(name):
+            return sparse.csr_matrix((arrays[f'{name}/data'], arrays[f'{name}/indices'], arrays[f'{name}/indptr']),
+                                     shape=tuple(arrays[f'{name}/shape'].tolist()), copy=False)
+
+        matrices = cls.__new__(cls)
+        matrices.member_ids = arrays['member_ids']
+        matrices.member_names = np.asarray(member_names, dtype=object)
+        matrices.commission_ids = arrays['commission_ids']
+        matrices.meeting_keys = arrays['meeting_keys']
+        matrices.meeting_commissions = arrays['meeting_commissions']
+        matrices.status_matrices = {status: csr(f'status/{status}') for status in attendance_facts.STATUSES}
+        matrices.permanent_status_matrices = {status: csr(f'permanent/{status}') for status in attendance_facts.STATUSES}
+        matrices.status_positions = {status: csr(f'status_positions/{status}') for status in attendance_facts.STATUSES}
+        matrices.permanent_status_positions = {status: csr(f'permanent_positions/{status}') for status in attendance_facts.STATUSES}
+        return matrices
@@ -3,8 +3,6 @@ from dash import dcc, html, dash_table # import dash_table to allow dynamically
 from dash.dependencies import Input, Output
 import pandas as pd
 
-from collections import Counter, defaultdict
-
 # import plotly.graph_objs as go
 # from plotly.subplots import make_subplots
 
@@ -12,12 +10,15 @@ import pandas as pd
 from datetime import datetime
 import locale
 
-import pickle
 
 import plotly.express as px # for scatterplots
 
 
+import attendance_data # shared data access layer (loads each dataset once per process)
+import background_callbacks # optionally run expensive callbacks in the background
+import result_cache # memoization of filter_data() and update_display()
 import attendance_statistics # import functions of attendance_statistics.py (i.e. obtain_attendance_statistics() and helper functions)
+import membership_matrix # member × commission matrix of the permanent members
 
 # Set the locale to Dutch (Belgian)
 locale.setlocale(locale.LC_TIME, 'nl_BE.utf8')  # Set appropriate locale for Dutch
@@ -28,8 +29,8 @@ locale.setlocale(locale.LC_TIME, 'nl_BE.utf8')  # Set appropriate locale for Dut
 
 # meetings_all_commissions_df = pd.read_pickle(f'../data/meetings_all_commissions_df_{relevant_extraction_date}.pkl')
 # meetings_all_commissions_short_df = pd.read_pickle(f'../data/meetings_all_commissions_short_df_{relevant_extraction_date}.pkl')
-meetings_all_commissions_df = pd.read_pickle(f'../data/meetings_all_commissions_df.pkl')
-meetings_all_commissions_short_df = pd.read_pickle(f'../data/meetings_all_commissions_short_df.pkl')
+# Data is loaded once per process and shared by all tabs (see attendance_data.py). The short version of the meetings is not used.
+meetings_all_commissions_df = attendance_data.get_meetings()
 
 
 # Obtain date of most recent meeting in dataset + format to e.g. "15 februari 2023"
@@ -40,14 +41,15 @@ diff_commissions = list(set(meetings_all_commissions_df["commissie.titel"]))
 
 # Read in commission_overview_df with overall info on each commission
 # commissions_overview_df = pd.read_pickle(f'../data/commissions_overview_df_{relevant_extraction_date}.pkl')
-commissions_overview_df = pd.read_pickle(f'../data/commissions_overview_df.pkl')
+commissions_overview_df = attendance_data.get_commissions_overview()
+
+# Prefix-sum index of the attendance per commission (see attendance_index.py), to answer date range selections
+attendance_prefix_index = attendance_data.get_attendance_index()
 
 
 # Load information about parties
-with open(f'../data/fracties.pkl', 'rb') as file:
-    fracties_dict = pickle.load(file)
-with open(f'../data/parlementsleden.pkl', 'rb') as file:
-    parlementsleden_all_dict = pickle.load(file)
+fracties_dict = attendance_data.get_fracties()
+parlementsleden_all_dict = attendance_data.get_parlementsleden()
 
 # Create a list of options for the dropdown
 dropdown_options_party  = [{"label": "Alle partijen", "value": "Alle partijen"}] + [{"label": party, "value": party} for party in fracties_dict.keys()] 
@@ -131,6 +133,8 @@ layout = html.Div(
 					children=[
 						html.Div(id='amount_meetings_per_member',
 								 children=f"Deze selectie resulteert in {amount_meetings_per_member} relevante vergaderingen."), 
+						# Progress of the computation (only shown when callbacks run in the background, see background_callbacks.py)
+						html.Div(id='progress_per_member'),
 					],
 					className="menu-element"
 				),
@@ -184,23 +188,26 @@ layout = html.Div(
 
 
 # Define function to filter data based on user selection
-def filter_data(start_date, end_date, party_value, 
-commissions_overview_df_input, meetings_all_commissions_df_input):   
+@result_cache.memoize(normalize=result_cache.normalize_selection, version=attendance_data.data_version,
+                      copy_result=lambda result: (result[0].copy(), result[1])) # copy: callers modify the overview
+def filter_data(start_date, end_date):   
+    # Obtain current data (reloaded by attendance_data when the update script rewrote it)
+    commissions_overview_df_input = attendance_data.get_commissions_overview()
+    attendance_prefix_index = attendance_data.get_attendance_index()
+
     # Ensure correct date format
     start_date = pd.to_datetime(start_date).date()
     end_date = pd.to_datetime(end_date).date()
 
-    # Filter DataFrame with all commission meetings based on the date range
-    meetings_all_commissions_filtered_df = meetings_all_commissions_df_input[
-        (meetings_all_commissions_df_input['Datum vergadering'] >= start_date) &
-        (meetings_all_commissions_df_input['Datum vergadering'] <= end_date)
-    ]
+    # Filter DataFrame with all commission meetings based on the date range (answered by the prefix-sum index, see attendance_index.py)
+    meetings_all_commissions_filtered_df = attendance_prefix_index.filter_meetings(start_date, end_date)
     
     
-    # Obtain for the filtered df the attendance statistics using imported function
-    filtered_df_overview = attendance_statistics.obtain_attendance_statistics(
-    commissions_overview_df_input = commissions_overview_df_input, 
-    meetings_all_commissions_df_input = meetings_all_commissions_filtered_df
+    # Obtain for the filtered df the attendance statistics using the prefix-sum index
+    filtered_df_overview = attendance_prefix_index.obtain_attendance_statistics(
+    commissions_overview_df_input = commissions_overview_df_input.copy(), # copy: the shared overview is read-only
+    start_date = start_date,
+    end_date = end_date
     )
     
     return (filtered_df_overview, meetings_all_commissions_filtered_df)
@@ -208,7 +215,8 @@ commissions_overview_df_input, meetings_all_commissions_df_input):
 
 def amount_commissions_as_permanent_dict(commissions_overview_df_input, 
                                     parlementsleden_all_dict_input, 
-                                    fracties_dict_input):
+                                    fracties_dict_input,
+                                    snapshot_date=None):
     """
     Function to obtain dict of how many commissions each member of parliament is a permanent member of.
     {'Willem-Frederik Schiltz': 12,
@@ -217,91 +225,85 @@ def amount_commissions_as_permanent_dict(commissions_overview_df_input,
      "Jos D'Haese": 9,
      'Andries Gryffroy': 7,
      ...}
+    Members of parliament (of parlementsleden_all_dict_input) that are in no commission as permanent member obtain 0.
+    The counts are the row sums of the member × commission matrix of the composition of the commissions (see membership_matrix.py),
+    computed once per composition (i.e. per data version) and kept with the matrix.
+    With snapshot_date, the composition of the commissions of commissions_overview_df_input on that date is used
+    (see attendance_data.get_composition()) instead of the current one.
     """
-    
-     # Count how often a member occurs in the overview of lists of permanent members of commissions
-    amount_commissions_members = attendance_statistics.count_member_occurrence(commissions_overview_df_input['vaste leden'])
-    
-    
-    # Group members per amount of commissions
-    grouped_by_count = defaultdict(list)
-    # Grouping elements by their count
-    for name, count in amount_commissions_members:
-        grouped_by_count[count].append(name)
-
-
-    # Add members that are in no commissions at all (with count = 0)
-    # Obtain list of all member that are in at least 1 commission as permanent member
-    permanent_members = [name for names in grouped_by_count.values() for name in names]
-    # Obtain list of all members of parliament (i.e. including those not in any commission)
-    parlementsleden_list = [parlementsleden_all_dict[member_tuple][0] for member_tuple in parlementsleden_all_dict_input.keys()]
-    # Obtain list of all members of parliament that do not reside in any commission as permanent member
-    not_permanent_members = list(set(parlementsleden_list).difference(set(permanent_members)))
-    # Add members that are in no commission as permanent member to dict
-    grouped_by_count[0] = not_permanent_members
-    
-    # Turn into dict that maps names to amount of commissions
-    name2amount_dict = {}
-    for number, names in grouped_by_count.items():
-        for name in names:
-            name2amount_dict[name] = number
-    
-    return name2amount_dict
-
-def obtain_attendance_permanent_members(commissions_overview_df_input, fracties_dict_input, name2count_permanent_dict_input):
+    if snapshot_date is not None:
+        composition_df = attendance_data.get_composition(snapshot_date)
+        composition_df = composition_df[composition_df['commissie.id'].isin(commissions_overview_df_input['commissie.id'])]
+    else:
+        composition_df = commissions_overview_df_input
+    membership = membership_matrix.membership_of(composition_df)
+
+    # Obtain names of all members of parliament (i.e. including those not in any commission)
+    parlementsleden_list = tuple(values[0] for values in parlementsleden_all_dict_input.values())
+
+    def compute():
+        commissions_per_member = membership.commissions_per_member()
+        # Members in no commission as permanent member obtain 0
+        name2amount_dict = dict.fromkeys(parlementsleden_list, 0)
+        name2amount_dict.update(zip(commissions_per_member.index.tolist(), commissions_per_member.tolist()))
+        return name2amount_dict
+
+    return dict(membership.cached(('amount_commissions_as_permanent', parlementsleden_list), compute))
+
+def obtain_attendance_permanent_members(commissions_overview_df_input, fracties_dict_input, name2count_permanent_dict_input,
+                                        meetings_all_commissions_df_input=None):
     """
-    We obtain aggregated counts per member over all commissions, to get overall totals per member how often they had a certain attendance status (e.g. 'Aanwezig', 'Afwezig', 'Verontschuldigd'), using a helper function `obtain_aggregated_counts()`.
+    We obtain aggregated counts per member over all commissions, to get overall totals per member how often they had a certain attendance status (e.g. 'Aanwezig', 'Afwezig', 'Verontschuldigd').
+    The amount of relevant meetings is the amount of meetings (of meetings_all_commissions_df_input, e.g. the meetings of the selected dates; default all meetings)
+    of the commissions in commissions_overview_df_input held while the member was a permanent member of that commission (see membership_intervals.py).
     """
-    # Obtaining actual aggregated counts for how often permanent members were present / absent / absent with notice + rename output column 'Aggregate_Count" to more insightful name + to avoid duplicates)
-    aanwezig_per_lid = attendance_statistics.obtain_aggregated_counts(commissions_overview_df_input['aanwezig_count_vaste']).rename(columns={"Aggregated_Count": "Aantal vergaderingen aanwezig"})
-    afezig_per_lid = attendance_statistics.obtain_aggregated_counts(commissions_overview_df_input['afwezig_count_vaste']).rename(columns={"Aggregated_Count": "Aantal vergaderingen afwezig"})
-    verontschuldigd_per_lid = attendance_statistics.obtain_aggregated_counts(commissions_overview_df_input['verontschuldigd_count_vaste']).rename(columns={"Aggregated_Count": "Aantal vergaderingen verontschuldigd"})
-    #Merge those dfs, using 'Member' column as identifier
-    merged_df = pd.merge(aanwezig_per_lid, afezig_per_lid,  on="Member", how="outer")
-    merged_df = pd.merge(merged_df, verontschuldigd_per_lid,  on="Member", how="outer") 
-    # Set member names as index (to allow easier processing later on)
-    aanwezigheid_per_lid_df = merged_df.set_index("Member")
-
-    # There seems to be some members present in `all_permanent_members` (which is based on `commissions_overview_df['vaste leden']`) that are not present in `aanwezig_per_lid` (which is based on `commissions_overview_df['aanwezig_count_vaste']`). We assess which these are, and add them to the `aanwezig_per_lid` dataframe, with count 0.
-    # Obtain list of all members of parliament that reside in commissions as permanent member
-    all_permanent_members = set()
-    for member_list in commissions_overview_df_input['vaste leden']:
-        all_permanent_members.update(member_list)
-    # Obtain list of all members of parliament that do not reside in any commission as permanent member
-    permanent_members_never_present = [element for element in all_permanent_members if element not in aanwezigheid_per_lid_df.index]
-    # Add those members to the dataframe, with counts of 0
-    for member in permanent_members_never_present:
-        aanwezigheid_per_lid_df.loc[member] = 0
-        
-    #Add extra columns for amount of relevant meetings, percentage and amount commissions as permanent member
-    aanwezigheid_per_lid_df['Aantal relevante vergaderingen'] = 0
-    aanwezigheid_per_lid_df['Percentage vergaderingen aanwezig'] = 0.0 # initialise as float
+    if meetings_all_commissions_df_input is None:
+        meetings_all_commissions_df_input = attendance_data.get_meetings()
+
+    # Obtaining aggregated counts for how often permanent members were present / absent / absent with notice (a column per status, NaN if a member never had that status),
+    # as column sums over the relevant meetings of the sparse attendance matrices (see attendance_matrix.py)
+    attendance_matrices = attendance_data.get_attendance_matrices()
+    rows = attendance_matrices.rows_of(meetings_all_commissions_df_input, commissions_overview_df_input)
+    status_columns = {'AANWEZIG': "Aantal vergaderingen aanwezig",
+                      'AFWEZIG': "Aantal vergaderingen afwezig",
+                      'VERONTSCHULDIGD': "Aantal vergaderingen verontschuldigd"}
+    aanwezigheid_per_lid_df = pd.concat(
+        {column_name: attendance_matrices.member_counts(status, rows, permanent=True)
+         for status, column_name in status_columns.items()},
+        axis=1).sort_index()
+    aanwezigheid_per_lid_df = aanwezigheid_per_lid_df.reindex(columns=list(status_columns.values()))
+    aanwezigheid_per_lid_df.index.name = "Member"
+
+    # Permanent members of the commissions (rows) × commissions (columns)
+    membership = membership_matrix.membership_of(commissions_overview_df_input)
+
+    # Amount of relevant meetings of each member: the meetings held while they were a permanent member, by meeting date
+    relevant_meetings_per_member = attendance_data.get_membership_intervals().relevant_meetings(
+        meetings_all_commissions_df_input, commissions_overview_df_input)
+
+    # Some permanent members (currently in 'vaste leden', or permanent member during some relevant meetings) are never present
+    # in the counters of 'aanwezig_count_vaste' etc.: add them, with counts of 0
+    permanent_members_never_present = membership.member_names.append(
+        relevant_meetings_per_member.index[relevant_meetings_per_member.to_numpy() > 0]).unique().difference(
+        aanwezigheid_per_lid_df.index, sort=False)
+    aanwezigheid_per_lid_df = pd.concat([aanwezigheid_per_lid_df,
+                                         pd.DataFrame(0, index=permanent_members_never_present, columns=aanwezigheid_per_lid_df.columns)])
+    aanwezigheid_per_lid_df.index.name = "Member"
+
+    aanwezigheid_per_lid_df['Aantal relevante vergaderingen'] = (
+        relevant_meetings_per_member.reindex(aanwezigheid_per_lid_df.index, fill_value=0).to_numpy())
+    # Percentage of attended meetings (0.0 for members without relevant meetings)
+    relevant_meetings = aanwezigheid_per_lid_df['Aantal relevante vergaderingen']
+    aanwezigheid_per_lid_df['Percentage vergaderingen aanwezig'] = (
+        (aanwezigheid_per_lid_df['Aantal vergaderingen aanwezig'] / relevant_meetings.where(relevant_meetings != 0))
+        .where(relevant_meetings != 0, 0.0).astype(float))
     aanwezigheid_per_lid_df['Aantal commissies waarin vast lid'] = 0
-    #Fill amount of relevant meetings: Iterate over all permanent members of parliament
-    for index_members, row_members in aanwezigheid_per_lid_df.iterrows():
-        # Iterate for each member through all commissions. 
-        # If they are a permanent member, add the amount of meetings of that commission to their key in the dict
-        for index_overview, row_overview in commissions_overview_df.iterrows():
-            if index_members in row_overview["vaste leden"]:
-                aanwezigheid_per_lid_df.at[index_members, 'Aantal relevante vergaderingen'] += row_overview['aantal vergaderingen']
-        
-                
-    
-    #Iterate over all permanent members of parliament
-    for index_members, row_members in aanwezigheid_per_lid_df.iterrows():
-        # Obtain percentage of attended meetings (taking zero division into account, i.e. with Aantal relevante vergaderingen == 0)
-        percentage_attendance = row_members['Aantal vergaderingen aanwezig'] / row_members['Aantal relevante vergaderingen'] if row_members['Aantal relevante vergaderingen'] != 0 else 0.0      
-        aanwezigheid_per_lid_df.at[index_members, "Percentage vergaderingen aanwezig"] = percentage_attendance
 
     # Sort dataframe by percentage attended
-    aanwezigheid_per_lid_df = aanwezigheid_per_lid_df.sort_values(by = "Percentage vergaderingen aanwezig", ascending = False)
+    aanwezigheid_per_lid_df = aanwezigheid_per_lid_df.sort_values(by = "Percentage vergaderingen aanwezig", ascending = False, kind = "stable")
     
-    # Add parties of relevant members
-    parties_list = []
-    for member in aanwezigheid_per_lid_df.index:
-        party = attendance_statistics.find_member(fracties_dict_input, member)
-        parties_list.append(party)       
-    aanwezigheid_per_lid_df["Partij"] = parties_list
+    # Add parties of relevant members (looked up at once in the member registry)
+    aanwezigheid_per_lid_df["Partij"] = attendance_statistics.map_parties(aanwezigheid_per_lid_df.index, fracties_dict_input).tolist()
     
     # Mapping members to the amount of commission they are permanent member of
     # using the grouped_by_count_dict obtained before
@@ -312,92 +314,50 @@ def obtain_attendance_permanent_members(commissions_overview_df_input, fracties_
 
 
 def obtain_attendance_non_permanent_members(commissions_overview_df_input, 
-                                            parlementsleden_all_dict_input,
-                                            fracties_dict_input):
+                                            fracties_dict_input,
+                                            meetings_all_commissions_df_input=None):
     """
     We obtain aggregated counts per member over all commissions in which they
     were no permanent member, to get overall totals per member how often they
-    had a certain attendance     status (e.g. 'Aanwezig', 'Afwezig', 'Verontschuldigd'), 
-    using a helper function `obtain_aggregated_counts()`.
+    had a certain attendance     status (e.g. 'Aanwezig', 'Afwezig', 'Verontschuldigd').
+    The meetings attended per commission and member (of meetings_all_commissions_df_input, default all meetings)
+    are a sparse matrix product of the attendance matrices (see attendance_matrix.py): the meetings attended as
+    permanent member (tagged by the date of each meeting, see membership_intervals.py) are subtracted from all
+    meetings attended. The amount of meetings and of commissions per member follow from grouped aggregations.
     """
-    # Obtaining actual aggregated counts for how often members were present
-    aanwezig_per_lid_alle = attendance_statistics.obtain_aggregated_counts(commissions_overview_df_input['aanwezig_count_alle'])
-    # Set member names as index (to allow easier processing later on)
-    aanwezig_per_lid_alle = aanwezig_per_lid_alle.set_index("Member")
-    
-    
-    # Then we obtain a list of all members of parliament, to compare them with the attendance data.
-    alle_parlementsleden_list = [parlementsleden_all_dict_input[member_tuple][0] for member_tuple in parlementsleden_all_dict_input.keys()]
-    
-    
-    # Obtain list of all members of parliament that have never attended a commission
-    all_members_never_present = [element for element in alle_parlementsleden_list if element not in aanwezig_per_lid_alle.index]
-
-    
-    # Then we obtain for each commission a list of members that have attended meetings of that commission although they are no permanent member of that commission.
-    members_present_but_no_permanent_overall = [] # Create empty list to fill
-    # Iterate over each commission
-    for index_overview, row_overview in commissions_overview_df_input.iterrows():
-        permanent_members = row_overview["vaste leden"] # Obtain permanent members of commission
-        # Obtain list of all members that have been present at at least 1 meeting of this commission
-        members_present_in_meetings = [member_tuple[0] for member_tuple in row_overview["aanwezig_count_alle"]]
-        # Obtain subset of those members that are no permanent members
-        members_present_but_no_permanent = [member for member in members_present_in_meetings if member not in permanent_members]
-        # Append this subset to the overall list
-        members_present_but_no_permanent_overall.append(members_present_but_no_permanent)
-      
-    
-    # Then we obtain for each of those non-permanent members how often they were present at a specific commission.
-    count_members_present_but_not_permanent_overall = []
-    for index, spec_commission_attendance_list in enumerate(commissions_overview_df_input['aanwezig_count_alle']):
-        count_members_present_but_not_permanent = [member_tuple for member_tuple in spec_commission_attendance_list if member_tuple[0] in members_present_but_no_permanent_overall[index]]
-        count_members_present_but_not_permanent_overall.append(count_members_present_but_not_permanent)
-    # Append resulting list as new column to overview data frame 
-    commissions_overview_df_input["aanwezig_count_alle_maar_geen_vast_lid"] = count_members_present_but_not_permanent_overall
-        
-        
-    # Obtaining actual aggregated counts for how often members were present
-    aanwezig_per_lid_alle_maar_niet_vast_df = attendance_statistics.obtain_aggregated_counts(count_members_present_but_not_permanent_overall)
-    # Use member name as index
-    aanwezig_per_lid_alle_maar_niet_vast_df = aanwezig_per_lid_alle_maar_niet_vast_df.set_index('Member')
-
-    
-    # Then we add the party the dataframe, using the earlier defined helper function.
-    parties_list = []
-    for member in aanwezig_per_lid_alle_maar_niet_vast_df.index:
-        party = attendance_statistics.find_member(fracties_dict_input, member)
-        parties_list.append(party)
-    aanwezig_per_lid_alle_maar_niet_vast_df["Partij"] = parties_list
-    
-    
-    # We also add in how many additional commissions they were present.
-    aanwezig_per_lid_alle_maar_niet_vast_df["Aantal commissies extra aanwezig"] = 0
-    # Flatten list of attendance (including counts)
-    flattened_attendance_list = [item for sublist in commissions_overview_df_input["aanwezig_count_alle_maar_geen_vast_lid"] for item in sublist]
-    # Maintain only names and not counts
-    flattened_attendance_list = [item[0] for item in flattened_attendance_list]
-    # Count occurrences of members for all meetings represented in attandance_list
-    amount_of_meetings_counter = Counter(flattened_attendance_list)
-    # Sort elements by their counts in descending order
-    amount_of_meetings_list = sorted(amount_of_meetings_counter.items(), key=lambda x: x[1], reverse=True)
-    for member_name, count in amount_of_meetings_counter.items():
-        aanwezig_per_lid_alle_maar_niet_vast_df.at[member_name, "Aantal commissies extra aanwezig"] = count
-    
-    
-    # Finally we also add for each member in how many commissions they are a permanent member.
-    aanwezig_per_lid_alle_maar_niet_vast_df["Aantal commissies waarin vast lid"] = 0 # Initialize new column
-    # Create flattened list of all permanent member accross all commissions
-    flattened_permanent_members = [item for sublist in commissions_overview_df_input['vaste leden'] for item in sublist]
-    # Count occurrences of meetings for which member is permanent member
-    amount_of_meetings_as_permanent_counter = Counter(flattened_permanent_members)
-    #Store counts in column '"Aantal commissies waarin vast lid"'
-    for member_name, count in amount_of_meetings_as_permanent_counter.items():
-        if member_name in aanwezig_per_lid_alle_maar_niet_vast_df.index:
-            aanwezig_per_lid_alle_maar_niet_vast_df.at[member_name, "Aantal commissies waarin vast lid"] = count
-
-
-    # Rename column "Aggregated_Count" to "Aantal vergaderingen aanwezig"
-    aanwezig_per_lid_alle_maar_niet_vast_df = aanwezig_per_lid_alle_maar_niet_vast_df.rename(columns={"Aggregated_Count": "Aantal vergaderingen aanwezig"})
+    if meetings_all_commissions_df_input is None:
+        meetings_all_commissions_df_input = attendance_data.get_meetings()
+
+    # Attendance as no permanent member: one row per (commission, member, amount of meetings present)
+    attendance_matrices = attendance_data.get_attendance_matrices()
+    rows = attendance_matrices.rows_of(meetings_all_commissions_df_input, commissions_overview_df_input)
+    non_permanent_counts = (attendance_matrices.commission_member_totals('AANWEZIG', rows)
+                            - attendance_matrices.commission_member_totals('AANWEZIG', rows, permanent=True)).tocoo()
+    attendance_df = pd.DataFrame({'row': non_permanent_counts.row, 'Member': attendance_matrices.member_names[non_permanent_counts.col],
+                                  'count': non_permanent_counts.data})
+    # Members with the same name are counted together, in order of the commissions and of the counts
+    attendance_df = attendance_df.groupby(['row', 'Member'], sort=False)['count'].sum().reset_index()
+    attendance_df = attendance_df.sort_values(by=['row', 'count'], ascending=[True, False], kind='stable')
+    attendance_non_permanent_df = attendance_df[attendance_df['count'] > 0]
+    
+    # Permanent members of the commissions (rows) × commissions (columns)
+    membership = membership_matrix.membership_of(commissions_overview_df_input)
+    
+    # How often members were present, and in how many commissions (in order of first appearance)
+    aanwezig_per_lid_alle_maar_niet_vast_df = attendance_non_permanent_df.groupby('Member', sort=False).agg(
+        **{"Aantal vergaderingen aanwezig": ('count', 'sum'),
+           "Aantal commissies extra aanwezig": ('row', 'size')})
+    # Sort by amount of meetings present, in descending order
+    aanwezig_per_lid_alle_maar_niet_vast_df = aanwezig_per_lid_alle_maar_niet_vast_df.sort_values(
+        by="Aantal vergaderingen aanwezig", ascending=False, kind="stable")
+    
+    # Then we add the party the dataframe, using the member registry (all members at once).
+    aanwezig_per_lid_alle_maar_niet_vast_df.insert(
+        1, "Partij", attendance_statistics.map_parties(aanwezig_per_lid_alle_maar_niet_vast_df.index, fracties_dict_input).tolist())
+    
+    # Finally we also add for each member in how many commissions they are a permanent member (0 if none).
+    aanwezig_per_lid_alle_maar_niet_vast_df["Aantal commissies waarin vast lid"] = (
+        membership.commissions_per_member().reindex(aanwezig_per_lid_alle_maar_niet_vast_df.index, fill_value=0).to_numpy())
     
     
     return aanwezig_per_lid_alle_maar_niet_vast_df
@@ -541,8 +501,59 @@ def update_graph_scatter_non_permanent(df_input):
     
     return fig
 
+# Outputs of the callback, computed once per selection and data version for all workers (see result_cache.py and shared_cache.py)
+@result_cache.memoize(normalize=result_cache.normalize_callback_selection, version=attendance_data.data_version, shared=True)
+def update_display(set_progress, party_value, start_date, end_date):
+    set_progress("Vergaderingen filteren...")
+    # Filter df based on party and timeframe
+    filtered_df_overview, meetings_all_commissions_filtered_df = filter_data(
+        start_date, end_date
+    )
+    
+    # Obtain count of relevant data, after filtering
+    amount_meetings_per_member = len(meetings_all_commissions_filtered_df)
+		
+    set_progress("Aanwezigheid per parlementslid berekenen...")
+    # Obtain dict on amount of commissions members are partaking
+    name2count_permanent_dict = amount_commissions_as_permanent_dict(filtered_df_overview,
+                                                                    parlementsleden_all_dict,fracties_dict)
+    
+    # Obtain aggregated counts of attendance (present, absent, absent with notice) for each permanent member
+    permanent_member_amount_meetings_df = obtain_attendance_permanent_members(filtered_df_overview, fracties_dict, name2count_permanent_dict,
+                                                                              meetings_all_commissions_filtered_df)
+    
+    non_permanent_member_amount_meetings_df = obtain_attendance_non_permanent_members(
+            filtered_df_overview, fracties_dict, meetings_all_commissions_filtered_df)
+    
+    # Filter permanent_member_amount_meetings_df & non_permanent_member_amount_meetings_df on selected party
+    if party_value == "Alle partijen":
+        permanent_member_amount_meetings_df = permanent_member_amount_meetings_df
+        non_permanent_member_amount_meetings_df = non_permanent_member_amount_meetings_df
+        
+    else:
+        permanent_member_amount_meetings_df = permanent_member_amount_meetings_df[permanent_member_amount_meetings_df["Partij"] == party_value]
+        non_permanent_member_amount_meetings_df = non_permanent_member_amount_meetings_df[non_permanent_member_amount_meetings_df["Partij"] == party_value]
+    
+    set_progress("Grafieken opstellen...")
+    # Turn attendance data in graph
+    # permanent_member_amount_meetings_df_graph = update_graph_bar(permanent_member_amount_meetings_df) # bar graph
+    permanent_member_amount_meetings_df_graph = update_graph_scatter_permanent(permanent_member_amount_meetings_df) # scatter graph
+    
+    # non_permanent_member_amount_meetings_df_graph = update_graph_bar(non_permanent_member_amount_meetings_df) # bar graph
+    non_permanent_member_amount_meetings_df_graph = update_graph_scatter_non_permanent(non_permanent_member_amount_meetings_df) # scatter graph
+    
+    # # Turn attendance data in dash table
+    # permanent_member_amount_meetings_df_table = update_dash_table(permanent_member_amount_meetings_df, "permanent_member_amount_meetings_df_table")
+    # member_amount_meetings_df_table = update_dash_table(non_permanent_member_amount_meetings_df_graph, "non_permanent_member_amount_meetings_df_table")
+    
+    return [f"Deze selectie resulteert in {amount_meetings_per_member} relevante vergaderingen.", # Use text formatting to allow easier build of layout
+				permanent_member_amount_meetings_df_graph, 
+				non_permanent_member_amount_meetings_df_graph]
+    # , member_amount_meetings_df_table
+
+
 #Create function to load app in integrated appraoch
-def register_callbacks(app):
+def register_callbacks(app, background_callback_manager=None):
 
     # Update display
     @app.callback(
@@ -556,51 +567,13 @@ def register_callbacks(app):
             Input("party-dropdown-per-member", "value"),
             Input('date-range-per-member', 'start_date'),
             Input('date-range-per-member', 'end_date')
-        ]
+        ],
+        # Optionally run as background callback (see background_callbacks.py)
+        **background_callbacks.callback_options(background_callback_manager, 'progress_per_member')
     )
-    def update_display(party_value, start_date, end_date):
-        # Filter df based on party and timeframe
-        filtered_df_overview, meetings_all_commissions_filtered_df = filter_data(
-            start_date, end_date, party_value, commissions_overview_df, meetings_all_commissions_df
-        )
-        
-		# Obtain count of relevant data, after filtering
-        amount_meetings_per_member = len(meetings_all_commissions_filtered_df)
-		
-        # Obtain dict on amount of commissions members are partaking
-        name2count_permanent_dict = amount_commissions_as_permanent_dict(filtered_df_overview,
-                                                                        parlementsleden_all_dict,fracties_dict)
-        
-        # Obtain aggregated counts of attendance (present, absent, absent with notice) for each permanent member
-        permanent_member_amount_meetings_df = obtain_attendance_permanent_members(filtered_df_overview, fracties_dict, name2count_permanent_dict)
-        
-        non_permanent_member_amount_meetings_df = obtain_attendance_non_permanent_members(
-                filtered_df_overview, parlementsleden_all_dict, fracties_dict)
-        
-        # Filter permanent_member_amount_meetings_df & non_permanent_member_amount_meetings_df on selected party
-        if party_value == "Alle partijen":
-            permanent_member_amount_meetings_df = permanent_member_amount_meetings_df
-            non_permanent_member_amount_meetings_df = non_permanent_member_amount_meetings_df
-            
-        else:
-            permanent_member_amount_meetings_df = permanent_member_amount_meetings_df[permanent_member_amount_meetings_df["Partij"] == party_value]
-            non_permanent_member_amount_meetings_df = non_permanent_member_amount_meetings_df[non_permanent_member_amount_meetings_df["Partij"] == party_value]
-        
-        # Turn attendance data in graph
-        # permanent_member_amount_meetings_df_graph = update_graph_bar(permanent_member_amount_meetings_df) # bar graph
-        permanent_member_amount_meetings_df_graph = update_graph_scatter_permanent(permanent_member_amount_meetings_df) # scatter graph
-        
-        # non_permanent_member_amount_meetings_df_graph = update_graph_bar(non_permanent_member_amount_meetings_df) # bar graph
-        non_permanent_member_amount_meetings_df_graph = update_graph_scatter_non_permanent(non_permanent_member_amount_meetings_df) # scatter graph
-        
-        # # Turn attendance data in dash table
-        # permanent_member_amount_meetings_df_table = update_dash_table(permanent_member_amount_meetings_df, "permanent_member_amount_meetings_df_table")
-        # member_amount_meetings_df_table = update_dash_table(non_permanent_member_amount_meetings_df_graph, "non_permanent_member_amount_meetings_df_table")
-        
-        return [f"Deze selectie resulteert in {amount_meetings_per_member} relevante vergaderingen.", # Use text formatting to allow easier build of layout
-				permanent_member_amount_meetings_df_graph, 
-				non_permanent_member_amount_meetings_df_graph]
-        # , member_amount_meetings_df_table
+    @background_callbacks.with_progress(background_callback_manager)
+    def update_display_callback(set_progress, party_value, start_date, end_date):
+        return update_display(set_progress, party_value, start_date, end_date)
 
 
 
@@ -13,9 +13,13 @@ import pandas as pd
 from datetime import datetime
 import locale
 
-import pickle
 
+import attendance_data # shared data access layer (loads each dataset once per process)
+import attendance_facts # attendance statuses of the fact table
+import background_callbacks # optionally run expensive callbacks in the background
+import result_cache # memoization of filter_data() and update_display()
 import attendance_statistics # import functions of attendance_statistics.py (i.e. obtain_attendance_statistics() and helper functions)
+import membership_matrix # member × commission matrix of the permanent members (shared with the tab per member)
 
 
 # Set the locale to Dutch (Belgian)
@@ -26,8 +30,8 @@ locale.setlocale(locale.LC_TIME, 'nl_BE.utf8')  # Set appropriate locale for Dut
 
 #meetings_all_commissions_df = pd.read_pickle(f'../data/meetings_all_commissions_df_{relevant_extraction_date}.pkl')
 #meetings_all_commissions_short_df = pd.read_pickle(f'../data/meetings_all_commissions_short_df_{relevant_extraction_date}.pkl')
-meetings_all_commissions_df = pd.read_pickle(f'../data/meetings_all_commissions_df.pkl')
-meetings_all_commissions_short_df = pd.read_pickle(f'../data/meetings_all_commissions_short_df.pkl')
+# Data is loaded once per process and shared by all tabs (see attendance_data.py). The short version of the meetings is not used.
+meetings_all_commissions_df = attendance_data.get_meetings()
 
 
 # Obtain date of most recent meeting in dataset + format to e.g. "15 februari 2023"
@@ -38,14 +42,14 @@ diff_commissions = list(set(meetings_all_commissions_df["commissie.titel"]))
 
 # Read in commission_overview_df with overall info on each commission
 # commissions_overview_df = pd.read_pickle(f'../data/commissions_overview_df_{relevant_extraction_date}.pkl')
-commissions_overview_df = pd.read_pickle(f'../data/commissions_overview_df.pkl')
+commissions_overview_df = attendance_data.get_commissions_overview()
+
+# Prefix-sum index of the attendance per commission (see attendance_index.py), to answer date range selections
+attendance_prefix_index = attendance_data.get_attendance_index()
 
 
 # Load information about parties
-with open(f'../data/fracties.pkl', 'rb') as file:
-    fracties_dict = pickle.load(file)
-with open(f'../data/parlementsleden.pkl', 'rb') as file:
-    parlementsleden_all_dict = pickle.load(file)
+fracties_dict = attendance_data.get_fracties()
 
 # Create a list of options for the dropdown
 dropdown_options_commission = [{"label": "Alle commissies", "value": "Alle commissies"}] + [{'label': item, 'value': item} for item in diff_commissions]
@@ -258,6 +262,8 @@ layout = html.Div(
 							children=[
 								html.Div(id='amount_meetings_per_party',
 										 children=f"Deze selectie resulteert in {amount_meetings_per_party} relevante vergaderingen."),
+								# Progress of the computation (only shown when callbacks run in the background, see background_callbacks.py)
+								html.Div(id='progress_per_party'),
 							],
 							className="menu-element"
 						),
@@ -294,63 +300,64 @@ layout = html.Div(
 
 
 #Define function to filter data based on user selection
-def filter_data(start_date, end_date, commission_value, 
-commissions_overview_df, meetings_all_commissions_df):   
+@result_cache.memoize(normalize=result_cache.normalize_selection, version=attendance_data.data_version,
+                      copy_result=lambda result: (result[0].copy(), result[1])) # copy: callers may modify the overview
+def filter_data(start_date, end_date, commission_value):   
+    # Obtain current data (reloaded by attendance_data when the update script rewrote it)
+    commissions_overview_df = attendance_data.get_commissions_overview()
+    attendance_prefix_index = attendance_data.get_attendance_index()
+
     # Ensure correct date format
     start_date = pd.to_datetime(start_date).date()
     end_date = pd.to_datetime(end_date).date()
 
-    # Filter i) the DataFrame with all commission meetings based on the commission dropdown value and
+    # Filter i) the DataFrame with all commission meetings based on the commission dropdown value and the date range
+    # (answered by the prefix-sum index, see attendance_index.py) and
     # ii) the overview dataframe based on the commission dropdown value
     if commission_value == "Alle commissies":
-        meetings_all_commissions_filtered_df = meetings_all_commissions_df
-        commissions_overview_filtered_df = commissions_overview_df
+        meetings_all_commissions_filtered_df = attendance_prefix_index.filter_meetings(start_date, end_date)
+        commissions_overview_filtered_df = commissions_overview_df.copy() # copy: the shared overview is read-only
     else:
-        meetings_all_commissions_filtered_df = meetings_all_commissions_df[
-            meetings_all_commissions_df['commissie.titel'] == commission_value
-        ]
+        meetings_all_commissions_filtered_df = attendance_prefix_index.filter_meetings(start_date, end_date, commission_value)
         commissions_overview_filtered_df = commissions_overview_df[
             commissions_overview_df['commissie.titel'] == commission_value
-        ]
-
-    # Filter DataFrame with all commission meetings further based on the date range
-    meetings_all_commissions_filtered_df = meetings_all_commissions_filtered_df[
-        (meetings_all_commissions_filtered_df['Datum vergadering'] >= start_date) &
-        (meetings_all_commissions_filtered_df['Datum vergadering'] <= end_date)
-    ]
+        ].copy()
     
     
-    # Obtain for the filtered df the attendance statistics using imported function
-    filtered_df_overview = attendance_statistics.obtain_attendance_statistics(
+    # Obtain for the filtered df the attendance statistics using the prefix-sum index
+    filtered_df_overview = attendance_prefix_index.obtain_attendance_statistics(
     commissions_overview_df_input = commissions_overview_filtered_df, 
-    meetings_all_commissions_df_input = meetings_all_commissions_filtered_df
+    start_date = start_date,
+    end_date = end_date
     )
     
     # print(filtered_df_overview)
     return (filtered_df_overview, meetings_all_commissions_filtered_df)
     
 	
-def update_attendance_per_party(commissions_overview_df_input, fracties_dict_input):
+def update_attendance_per_party(commissions_overview_df_input, fracties_dict_input, start_date, end_date):
     """
-    To obtain an overview of how members of each party attend meetings, we group the counts of each members along the party the are member to. We use the helper function get_overall_presence() to obtain this for each attendance status ('Aanwezig', 'Afwezig', 'Verontschuldigd').
+    To obtain an overview of how members of each party attend meetings, we group the counts of each members along the party the are member to. 
+    The counts of each member come from the monthly attendance cube (see attendance_cube.py): whole months of the range between start_date and end_date are summed from the cube, only the meetings of the partial months at the boundaries are counted individually. This for each attendance status ('Aanwezig', 'Afwezig', 'Verontschuldigd'), and for the commissions in the (filtered) overview.
     
     Then we actually obtain the attendance status. We do this, accross all members, so not limited to the permanent members. This might provide a better picture, since this indicates whether members of parliament took care in ensuring their commission was attended properly, even if not by them personally.
 
-    The resulting dictionaries do not necessarily have the same keys. If a certain party was never absent, no key for that party will be available in the dictionary of the absent counts. Hence, we add keys (with a zero count) if necessary.
+    Parties without any count for a certain status (e.g. never absent) obtain a zero count, parties without any count at all obtain 0%. Parties are ordered as in fracties_dict_input.
 
     """
-
-    # Obtain attendance for each attendance status, and for each party
-    party_count_aanwezig = attendance_statistics.get_overall_presence(commissions_overview_df_input["aanwezig_count_alle"], fracties_dict)
-    party_count_afwezig = attendance_statistics.get_overall_presence(commissions_overview_df_input["afwezig_count_alle"], fracties_dict)
-    party_count_verontschuldigd = attendance_statistics.get_overall_presence(commissions_overview_df_input["verontschuldigd_count_alle"], fracties_dict)
-    
+    # Only commissions for which meetings were held (as the counters of the overview, see fill_attendance_statistics())
+    commission_ids = commissions_overview_df_input.loc[commissions_overview_df_input["aantal vergaderingen"] != 0, 'commissie.id']
+    member_totals = attendance_data.get_attendance_cube().member_totals(start_date, end_date, commission_ids)
     
-    # Modify dictionaries to ensure all have the same parties (i.e. if certain party never afwezig: create new entry with 0)
-    for attendance_dict in [party_count_aanwezig, party_count_afwezig, party_count_verontschuldigd]:
-        for party in fracties_dict.keys():
-            if party not in attendance_dict.keys():
-                attendance_dict[party] = 0
+    # Group the counts of the members per party (parties of the member names looked up in the member registry)
+    _, attendance_members_df = attendance_data.get_attendance_facts()
+    member_names = attendance_members_df.set_index('member_id')['Naam'].reindex(member_totals.index)
+    party_totals = member_totals.groupby(attendance_statistics.map_parties(member_names, fracties_dict_input).to_numpy()).sum()
+
+    # Obtain attendance for each attendance status, and for each party (all parties, with 0 if no count)
+    party_count_aanwezig, party_count_afwezig, party_count_verontschuldigd = [
+        {party: int(party_totals.at[party, status]) if party in party_totals.index else 0 for party in fracties_dict_input.keys()}
+        for status in attendance_facts.STATUSES]
 
     
     # Then we create a dataframe of these dictionaries, to ease up further assessment. We also include a total count per party. Furthermore, we create a dictionary with the counts as percentages, which is easier for the graphical respresentation later on. 
@@ -362,12 +369,9 @@ def update_attendance_per_party(commissions_overview_df_input, fracties_dict_inp
     attendance_per_party.loc['Totaal'] = attendance_per_party.sum()
 
 
-    # Calculate percentages using numpy
-    percentages = (attendance_per_party.values / attendance_per_party.values[-1, :]) * 100
-    # Create a new DataFrame with the calculated percentages
-    attendance_per_party_percentages = pd.DataFrame(percentages, 
-                                                    columns = attendance_per_party.columns,
-                                                    index = attendance_per_party.index)
+    # Calculate percentages (parties without any count, e.g. in a range without meetings, obtain 0% instead of a division by zero)
+    total = attendance_per_party.loc['Totaal']
+    attendance_per_party_percentages = (attendance_per_party.div(total.where(total != 0), axis='columns') * 100).fillna(0.0)
     
     
     # Format the DataFrame to display up to 2 decimals after the comma
@@ -456,68 +460,58 @@ def update_table_indices(df):
 
 
 
-def update_attendance_permanent_members(commissions_overview_input_df, parlementsleden_all_dict):
-    # Obtain list of all members of parliament
-    parlementsleden_list = [parlementsleden_all_dict[member_tuple][0] for member_tuple in parlementsleden_all_dict.keys()]
-    # Obtain list of all members of parliament that reside in commissions as permanent member
-    all_permanent_members = set()
-    for member_list in commissions_overview_input_df['vaste leden']:
-        all_permanent_members.update(member_list)
-    
+def update_attendance_permanent_members(commissions_overview_input_df, fracties_dict_input, meetings_input_df=None):
+    """
+    Obtain for each permanent member (of the commissions in commissions_overview_input_df) the amount of relevant meetings
+    (the meetings of meetings_input_df, default all meetings, of the commissions they were a permanent member of on the date
+    of the meeting, see membership_intervals.py), the amount of meetings attended, the percentage and the party (out of fracties_dict_input).
+    Not displayed at the moment: see permanent_members_statistics().
+    """
+    # Permanent members of the commissions (rows) × commissions (columns), shared with the other tabs
+    membership = membership_matrix.membership_of(commissions_overview_input_df)
     
-    # Obtaining actual aggregated counts for how often members were present
-    aanwezig_per_lid = attendance_statistics.obtain_aggregated_counts(commissions_overview_input_df['aanwezig_count_vaste'])
-    # Set member names as index (to allow easier processing later on)
-    aanwezig_per_lid = aanwezig_per_lid.set_index("Member")
+    # Amount of relevant meetings of each member: the meetings held while they were a permanent member, by meeting date
+    if meetings_input_df is None:
+        meetings_input_df = attendance_data.get_meetings()
+    relevant_meetings_per_member = attendance_data.get_membership_intervals().relevant_meetings(
+        meetings_input_df, commissions_overview_input_df)
+    # Current permanent members, and former permanent members with relevant meetings
+    member_names = membership.member_names.append(
+        relevant_meetings_per_member.index[relevant_meetings_per_member.to_numpy() > 0]).unique()
     
+    # Obtaining actual aggregated counts for how often members were present (0 for permanent members never present)
+    aanwezig_per_lid = attendance_statistics.explode_counters(commissions_overview_input_df['aanwezig_count_vaste']).groupby('Member')['count'].sum()
     
-    # There seems to be some members present in `all_permanent_members` (which is based on `commissions_overview_df['vaste leden']`) that are not present in `aanwezig_per_lid` (which is based on `commissions_overview_df['aanwezig_count_vaste']`). We assess which these are, and add them to the `aanwezig_per_lid` dataframe, with count 0.
-    # Obtain list of all members of parliament that do not reside in any commission as permanent member
-    permanent_members_never_present = [element for element in all_permanent_members if element not in aanwezig_per_lid.index]
-    # Add those members to the dataframe, with a count of 0
-    for member in permanent_members_never_present:
-        aanwezig_per_lid.loc[member] = 0
-        
-        
-    #Create empty dataframe with permanent members, fill with zero (i.e. starting count) and use parmanent members as index
-    # Create empty dataframe with permanent members
-    member_amount_meetings_pd = pd.DataFrame({'Aantal relevante vergaderingen': 0,
-                                              'Aantal bijgewoonde vergaderingen': 0,
-                                              'Percentage bijgewoond': 0.0  # Setting the 'Percentage bijgewoond' column as float
-                                              }, index=list(all_permanent_members))
-    #Iterate over all permanent members of parliament
-    for index_members, row_members in member_amount_meetings_pd.iterrows():
-        # Iterate for each member through all commissions. 
-        # If they are a permanent member, add the amount of meetings of that commission to their key in the dict
-        for index_overview, row_overview in commissions_overview_input_df.iterrows():
-            if index_members in row_overview["vaste leden"]:
-                member_amount_meetings_pd.at[index_members, 'Aantal relevante vergaderingen'] += row_overview['aantal vergaderingen']
-
-
-    #Iterate over all permanent members of parliament
-    for index_members, row_members in member_amount_meetings_pd.iterrows():
-        # Extract the aggregated count out of aanwezig_per_lid for the relevant member (i.e. serving as index) 
-        # and add to member_amount_meetings_pd at relevant index
-        bijgewoonde_verg = aanwezig_per_lid.loc[index_members, "Aggregated_Count"]
-        member_amount_meetings_pd.at[index_members, "Aantal bijgewoonde vergaderingen"] = bijgewoonde_verg
-        
-        # Obtain percentage of attended meetings (taking zero division into account, i.e. with Aantal relevante vergaderingen == 0)
-        percentage_attendance = bijgewoonde_verg / row_members['Aantal relevante vergaderingen'] if row_members['Aantal relevante vergaderingen'] != 0 else 0      
-        member_amount_meetings_pd.at[index_members, "Percentage bijgewoond"] = percentage_attendance
+    # Dataframe with the permanent members as index
+    member_amount_meetings_pd = pd.DataFrame({
+        'Aantal relevante vergaderingen': relevant_meetings_per_member.reindex(member_names, fill_value=0).to_numpy(),
+        'Aantal bijgewoonde vergaderingen': aanwezig_per_lid.reindex(member_names, fill_value=0).to_numpy(),
+        }, index=list(member_names))
+    # Obtain percentage of attended meetings (taking zero division into account, i.e. with Aantal relevante vergaderingen == 0)
+    relevant_meetings = member_amount_meetings_pd['Aantal relevante vergaderingen']
+    member_amount_meetings_pd['Percentage bijgewoond'] = (
+        (member_amount_meetings_pd['Aantal bijgewoonde vergaderingen'] / relevant_meetings.where(relevant_meetings != 0))
+        .where(relevant_meetings != 0, 0.0).astype(float))
 
     # Sort dataframe by percentage attended
-    member_amount_meetings_pd = member_amount_meetings_pd.sort_values(by = "Percentage bijgewoond", ascending = False)
+    member_amount_meetings_pd = member_amount_meetings_pd.sort_values(by = "Percentage bijgewoond", ascending = False, kind = "stable")
     
     
-    # Finally, we add the party of the relevant member to the dataframe.
-    parties_list = []
-    for member in member_amount_meetings_pd.index:
-        party = attendance_statistics.find_member(fracties_dict, member)
-        parties_list.append(party)   
-    member_amount_meetings_pd["Partij"] = parties_list
+    # Finally, we add the party of the relevant member to the dataframe (looked up at once in the member registry).
+    member_amount_meetings_pd["Partij"] = attendance_statistics.map_parties(member_amount_meetings_pd.index, fracties_dict_input).tolist()
 
     
     return member_amount_meetings_pd
+
+
+# Attendance of the permanent members is not displayed by update_display(): it is only computed when a view requests it,
+# once per selection and data version
+@result_cache.memoize(normalize=result_cache.normalize_selection, version=attendance_data.data_version,
+                      copy_result=lambda result: result.copy())
+def permanent_members_statistics(start_date, end_date, commission_value):
+    filtered_df_overview, filtered_df_meetings = filter_data(start_date, end_date, commission_value)
+    # Parties of the current data (reloaded by attendance_data when the update script rewrote it)
+    return update_attendance_permanent_members(filtered_df_overview, attendance_data.get_fracties(), filtered_df_meetings)
      
 
 
@@ -526,8 +520,43 @@ def update_attendance_permanent_members(commissions_overview_input_df, parlement
 
 
 
+# Outputs of the callback, computed once per selection and data version for all workers (see result_cache.py and shared_cache.py)
+@result_cache.memoize(normalize=result_cache.normalize_callback_selection, version=attendance_data.data_version, shared=True)
+def update_display(set_progress, commission_value, start_date, end_date):
+    set_progress("Vergaderingen filteren...")
+    # Filter df based on user input
+    filtered_df_overview, filtered_df_meetings = filter_data(
+    start_date, end_date, commission_value)
+		
+    # Obtain count of relevant data, after filtering
+    amount_meetings_per_party = len(filtered_df_meetings)
+    
+    
+    # # update table
+    # table = update_table(filtered_df_overview)
+    
+    set_progress("Aanwezigheid per partij berekenen...")
+    # The attendance of the permanent members is not displayed: available on request through permanent_members_statistics()
+    
+    # update variable of attendance_per_party
+    attendance_per_party_percentage_df, attendance_per_party_percentage_df_formatted = update_attendance_per_party(filtered_df_overview, fracties_dict_input = attendance_data.get_fracties(),
+                                                                                                                 start_date = start_date, end_date = end_date)
+    
+    set_progress("Tabel en grafiek opstellen...")
+    # update of table of attendance_per_party
+    attendance_per_party_percentage_table = update_table_indices(attendance_per_party_percentage_df_formatted)
+    
+    # update graph of attendance_per_party
+    attendance_per_party_percentage_graph = update_attendance_per_party_graph(attendance_per_party_percentage_df)
+    
+    
+    return [f"Deze selectie resulteert in {amount_meetings_per_party} relevante vergaderingen.", # Use text formatting to allow easier build of layout
+				attendance_per_party_percentage_table, 
+				attendance_per_party_percentage_graph]
+
+
 #Create function to load app in integrated appraoch
-def register_callbacks(app):
+def register_callbacks(app, background_callback_manager=None):
     # Define callback to update display based on selected commission and date range
     @app.callback(
         [
@@ -537,37 +566,13 @@ def register_callbacks(app):
          ], 
         [Input('commissie-dropdown-per-party', 'value'),
          Input('date-range-per-party', 'start_date'),
-         Input('date-range-per-party', 'end_date')]
+         Input('date-range-per-party', 'end_date')],
+        # Optionally run as background callback (see background_callbacks.py)
+        **background_callbacks.callback_options(background_callback_manager, 'progress_per_party')
     )
-    def update_display(commission_value, start_date, end_date):
-        # Filter df based on user input
-        filtered_df_overview, filtered_df_meetings = filter_data(
-        start_date, end_date, commission_value,
-        commissions_overview_df, meetings_all_commissions_df)
-		
-		# Obtain count of relevant data, after filtering
-        amount_meetings_per_party = len(filtered_df_meetings)
-        
-        
-        # # update table
-        # table = update_table(filtered_df_overview)
-        
-        # update table_attendance_permanent
-        table_attendance_permanent = update_attendance_permanent_members(filtered_df_overview, parlementsleden_all_dict)
-        
-        # update variable of attendance_per_party
-        attendance_per_party_percentage_df, attendance_per_party_percentage_df_formatted = update_attendance_per_party(filtered_df_overview, fracties_dict_input = fracties_dict)
-        
-        # update of table of attendance_per_party
-        attendance_per_party_percentage_table = update_table_indices(attendance_per_party_percentage_df_formatted)
-        
-        # update graph of attendance_per_party
-        attendance_per_party_percentage_graph = update_attendance_per_party_graph(attendance_per_party_percentage_df)
-        
-        
-        return [f"Deze selectie resulteert in {amount_meetings_per_party} relevante vergaderingen.", # Use text formatting to allow easier build of layout
-				attendance_per_party_percentage_table, 
-				attendance_per_party_percentage_graph]
+    @background_callbacks.with_progress(background_callback_manager)
+    def update_display_callback(set_progress, commission_value, start_date, end_date):
+        return update_display(set_progress, commission_value, start_date, end_date)
 
    
 ## Comment in integrated approach
@@ -11,15 +11,15 @@ except:
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
 
-from collections import Counter
-
 import pandas as pd
 
 from datetime import datetime
 import locale
 
-import pickle
 
+import attendance_data # shared data access layer (loads each dataset once per process)
+import background_callbacks # optionally run expensive callbacks in the background
+import result_cache # memoization of filter_data() and update_display()
 import attendance_statistics # import functions of attendance_statistics.py (i.e. obtain_attendance_statistics() and helper functions)
 
 # Set the locale to Dutch (Belgian)
@@ -31,8 +31,8 @@ locale.setlocale(locale.LC_TIME, 'nl_BE.utf8')  # Set appropriate locale for Dut
 
 #meetings_all_commissions_df = pd.read_pickle(f'../data/meetings_all_commissions_df_{relevant_extraction_date}.pkl')
 #meetings_all_commissions_short_df = pd.read_pickle(f'../data/meetings_all_commissions_short_df_{relevant_extraction_date}.pkl')
-meetings_all_commissions_df = pd.read_pickle(f'../data/meetings_all_commissions_df.pkl')
-meetings_all_commissions_short_df = pd.read_pickle(f'../data/meetings_all_commissions_short_df.pkl')
+# Data is loaded once per process and shared by all tabs (see attendance_data.py). The short version of the meetings is not used.
+meetings_all_commissions_df = attendance_data.get_meetings()
 
 
 # Obtain date of most recent meeting in dataset + format to e.g. "15 februari 2023"
@@ -43,13 +43,14 @@ diff_commissions = list(set(meetings_all_commissions_df["commissie.titel"]))
 
 # Read in commission_overview_df with overall info on each commission
 # commissions_overview_df = pd.read_pickle(f'../data/commissions_overview_df_{relevant_extraction_date}.pkl')
-commissions_overview_df = pd.read_pickle(f'../data/commissions_overview_df.pkl')
+commissions_overview_df = attendance_data.get_commissions_overview()
+
+# Prefix-sum index of the attendance per commission (see attendance_index.py), to answer date range selections
+attendance_prefix_index = attendance_data.get_attendance_index()
 
 # Load information about parties
-with open(f'../data/fracties.pkl', 'rb') as file:
-    fracties_dict = pickle.load(file)
-with open(f'../data/parlementsleden.pkl', 'rb') as file:
-    parlementsleden_all_dict = pickle.load(file)
+fracties_dict = attendance_data.get_fracties()
+parlementsleden_all_dict = attendance_data.get_parlementsleden()
 
 # Create a list of options for the dropdown
 dropdown_options_commission = [{"label": "Alle commissies", "value": "Alle commissies"}] + [{'label': item, 'value': item} for item in diff_commissions]
@@ -138,6 +139,8 @@ layout = html.Div(
 							children=[
 								html.Div(id='amount_meetings_per_com',
 										 children=f"Deze selectie resulteert in {amount_meetings_per_com} relevante vergaderingen."), 
+								# Progress of the computation (only shown when callbacks run in the background, see background_callbacks.py)
+								html.Div(id='progress_per_com'),
 							],
 							className="menu-element"
 						),
@@ -249,36 +252,35 @@ layout = html.Div(
 
 
 #Define function to filter data based on user selection
-def filter_data(start_date, end_date, commission_value, 
-commissions_overview_df, meetings_all_commissions_df):   
+@result_cache.memoize(normalize=result_cache.normalize_selection, version=attendance_data.data_version,
+                      copy_result=lambda result: (result[0].copy(), result[1])) # copy: callers may modify the overview
+def filter_data(start_date, end_date, commission_value):   
+    # Obtain current data (reloaded by attendance_data when the update script rewrote it)
+    commissions_overview_df = attendance_data.get_commissions_overview()
+    attendance_prefix_index = attendance_data.get_attendance_index()
+
     # Ensure correct date format
     start_date = pd.to_datetime(start_date).date()
     end_date = pd.to_datetime(end_date).date()
 
-    # Filter i) the DataFrame with all commission meetings based on the commission dropdown value and
+    # Filter i) the DataFrame with all commission meetings based on the commission dropdown value and the date range
+    # (answered by the prefix-sum index, see attendance_index.py) and
     # ii) the overview dataframe based on the commission dropdown value
     if commission_value == "Alle commissies":
-        meetings_all_commissions_filtered_df = meetings_all_commissions_df
-        commissions_overview_filtered_df = commissions_overview_df
+        meetings_all_commissions_filtered_df = attendance_prefix_index.filter_meetings(start_date, end_date)
+        commissions_overview_filtered_df = commissions_overview_df.copy() # copy: the shared overview is read-only
     else:
-        meetings_all_commissions_filtered_df = meetings_all_commissions_df[
-            meetings_all_commissions_df['commissie.titel'] == commission_value
-        ]
+        meetings_all_commissions_filtered_df = attendance_prefix_index.filter_meetings(start_date, end_date, commission_value)
         commissions_overview_filtered_df = commissions_overview_df[
             commissions_overview_df['commissie.titel'] == commission_value
-        ]
-
-    # Filter DataFrame with all commission meetings further based on the date range
-    meetings_all_commissions_filtered_df = meetings_all_commissions_filtered_df[
-        (meetings_all_commissions_filtered_df['Datum vergadering'] >= start_date) &
-        (meetings_all_commissions_filtered_df['Datum vergadering'] <= end_date)
-    ]
+        ].copy()
     
     
-    # Obtain for the filtered df the attendance statistics using imported function
-    filtered_df_overview = attendance_statistics.obtain_attendance_statistics(
+    # Obtain for the filtered df the attendance statistics using the prefix-sum index
+    filtered_df_overview = attendance_prefix_index.obtain_attendance_statistics(
 		commissions_overview_df_input = commissions_overview_filtered_df, 
-		meetings_all_commissions_df_input = meetings_all_commissions_filtered_df
+		start_date = start_date,
+		end_date = end_date
     )
     
     # print(filtered_df_overview)
@@ -394,8 +396,43 @@ def update_dash_table(df):
 
     return datatable  # Return a list containing the table element
 
+# Outputs of the callback, computed once per selection and data version for all workers (see result_cache.py and shared_cache.py)
+@result_cache.memoize(normalize=result_cache.normalize_callback_selection, version=attendance_data.data_version, shared=True)
+def update_display(set_progress, commission_value, start_date, end_date):
+    set_progress("Vergaderingen filteren...")
+    # Filter df based on user input
+    filtered_df_overview, filtered_df_meetings = filter_data(
+    start_date, end_date, commission_value)
+    
+    # Obtain count of relevant data, after filtering
+    amount_meetings_per_com = len(filtered_df_meetings)
+    
+    set_progress("Tabel en grafieken opstellen...")
+    # Obtain table including the attendance counts of the permanent members, as column sums over the
+    # selected meetings of the sparse attendance matrices (see attendance_matrix.py)
+    attendance_matrices = attendance_data.get_attendance_matrices()
+    attendance_permanent_df = attendance_statistics.obtain_aggregated_counts_vectorized(
+        attendance_matrices, 'AANWEZIG', attendance_matrices.rows_of(filtered_df_meetings, filtered_df_overview), permanent=True)
+    attendance_permanent_df.columns = ['Naam vast lid', 'Aantal keer aanwezig']
+
+    # Generate htlm table
+        # Option 1: use normal table
+    # table_attendance = update_table(attendance_permanent_df) 
+        # Option 2: use dash_table
+    # table_attendance = update_dash_table(attendance_permanent_df)
+    table_attendance = attendance_permanent_df.to_dict('records')
+
+    # Update the pie charts based on the selected data
+    pie_charts = update_pie_charts(filtered_df_overview)
+    
+    return [f"Deze selectie resulteert in {amount_meetings_per_com} relevante vergaderingen.", # Use text formatting to allow easier build of layout
+				pie_charts,  # Return the list of graphs as children of graphs_container
+            table_attendance
+			   ]
+
+
 #Create function to load app in integrated appraoch
-def register_callbacks(app):
+def register_callbacks(app, background_callback_manager=None):
 
     # Define callback to update display based on selected commission and date range
     @app.callback(
@@ -407,36 +444,13 @@ def register_callbacks(app):
 		],
         [Input('commissie-dropdown-per-com', 'value'),
          Input('date-range-per-com', 'start_date'),
-         Input('date-range-per-com', 'end_date')]
+         Input('date-range-per-com', 'end_date')],
+        # Optionally run as background callback (see background_callbacks.py)
+        **background_callbacks.callback_options(background_callback_manager, 'progress_per_com')
     )
-    def update_display(commission_value, start_date, end_date):
-        # Filter df based on user input
-        filtered_df_overview, filtered_df_meetings = filter_data(
-        start_date, end_date, commission_value,
-        commissions_overview_df, meetings_all_commissions_df)
-        
-		# Obtain count of relevant data, after filtering
-        amount_meetings_per_com = len(filtered_df_meetings)
-        
-        # Obtain table including the attendance counts of the permanent members, 
-        # using the Counter objects in the column 'aanwezig_count_vaste' of filtered_df_overview
-        attendance_permanent_df = attendance_statistics.obtain_counter_from_list_counter_likes(
-            filtered_df_overview['aanwezig_count_vaste'], ['Naam vast lid', 'Aantal keer aanwezig'])
-    
-        # Generate htlm table
-            # Option 1: use normal table
-        # table_attendance = update_table(attendance_permanent_df) 
-            # Option 2: use dash_table
-        # table_attendance = update_dash_table(attendance_permanent_df)
-        table_attendance = attendance_permanent_df.to_dict('records')
-
-    	# Update the pie charts based on the selected data
-        pie_charts = update_pie_charts(filtered_df_overview)
-        
-        return [f"Deze selectie resulteert in {amount_meetings_per_com} relevante vergaderingen.", # Use text formatting to allow easier build of layout
-				pie_charts,  # Return the list of graphs as children of graphs_container
-                table_attendance
-			   ]
+    @background_callbacks.with_progress(background_callback_manager)
+    def update_display_callback(set_progress, commission_value, start_date, end_date):
+        return update_display(set_progress, commission_value, start_date, end_date)
        
     
 # Comment in integrated approach   
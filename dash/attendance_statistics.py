@@ -2,6 +2,8 @@ from collections import Counter, defaultdict
 import numpy as np
 import pandas as pd
 
+import member_registry # lookups of members by name or id (used by find_member(), get_overall_presence(), ...)
+
 # Define function to obtain counters for the relevant dataframes
 def obtain_attendance_counter(DataFrame_column_attendance):
     # Create empty list to store all names for relevant attendance status
@@ -111,9 +113,80 @@ def obtain_attendance_statistics(commissions_overview_df_input, meetings_all_com
     return commissions_overview_df_input
 
 
+# Columns of commissions_overview_df filled by obtain_attendance_statistics(), and the status and (permanent) members they relate to
+counter_columns = [('aanwezig_count_alle', 'AANWEZIG', False), ('afwezig_count_alle', 'AFWEZIG', False),
+                   ('verontschuldigd_count_alle', 'VERONTSCHULDIGD', False),
+                   ('aanwezig_count_vaste', 'AANWEZIG', True), ('afwezig_count_vaste', 'AFWEZIG', True),
+                   ('verontschuldigd_count_vaste', 'VERONTSCHULDIGD', True)]
+meeting_count_columns = ["Aantal aanwezig alle leden", "Aantal afwezig alle leden", "Aantal verontschuldigd alle leden",
+                         "Aantal aanwezig vaste leden", "Aantal afwezig vaste leden", "Aantal verontschuldigd vaste leden"]
+average_columns = ['Gemiddelde aantal aanwezig alle leden', 'Gemiddelde aantal afwezig alle leden',
+                   'Gemiddelde aantal verontschuldigd alle leden',
+                   'Gemiddelde aantal aanwezig vaste leden', 'Gemiddelde aantal afwezig vaste leden',
+                   'Gemiddelde aantal verontschuldigd vaste leden']
+rounded_average_columns = [f'{column} (afgerond)' for column in average_columns]
+
+
+def round_numbers_rows(values):
+    """
+    Vectorized version of round_numbers(), applied to each row of a 2D array
+    (i.e. to the averages of present, absent and absent with notice for each commission).
+    """
+    values = np.asarray(values, dtype=float)
+    whole_numbers = np.trunc(values)
+    fractional_parts = values - whole_numbers
+    remaining = np.round(fractional_parts.sum(axis=1))
+
+    # Rank of each fractional part within its row (largest first, ties in order of appearance)
+    order = np.argsort(-fractional_parts, axis=1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(values.shape[1])[None, :].repeat(values.shape[0], axis=0), axis=1)
+
+    # Add 1 to the members with the largest fractional parts, until the rounded sum is distributed
+    return whole_numbers + (ranks < remaining[:, None])
+
+
+def meeting_commission_keys(meeting_ids, commission_ids):
+    """
+    Combine meeting id and commission id into one integer (a meeting can be held by multiple commissions)
+    """
+    return (np.asarray(meeting_ids, dtype=np.int64) << 32) + (np.asarray(commission_ids, dtype=np.int64) & 0xFFFFFFFF)
+
+
+def fill_attendance_statistics(commissions_overview_df_input, counters, averages):
+    """
+    Write counters ({(commission_id, counter column): [(member, count), ...]}) and averages (array with a row per
+    commission of commissions_overview_df_input and a column per column of average_columns) into
+    commissions_overview_df_input, together with the rounded averages, as obtain_attendance_statistics() does.
+    """
+    # Rounded averages (rows without meetings remain NaN)
+    rounded = np.full_like(averages, np.nan)
+    has_meetings = ~np.isnan(averages).any(axis=1)
+    rounded[has_meetings, :3] = round_numbers_rows(averages[has_meetings, :3])
+    rounded[has_meetings, 3:] = round_numbers_rows(averages[has_meetings, 3:])
+
+    # Only modify dataframe with respect to commissions for which meetings were held
+    to_modify = (commissions_overview_df_input["aantal vergaderingen"] != 0).to_numpy()
+    commission_ids = commissions_overview_df_input['commissie.id'].to_numpy()
+
+    for column_name_overview, _, _ in counter_columns:
+        current_values = commissions_overview_df_input[column_name_overview].tolist() \
+            if column_name_overview in commissions_overview_df_input.columns else [np.nan] * len(commission_ids)
+        commissions_overview_df_input[column_name_overview] = pd.Series(
+            [counters.get((commission_id, column_name_overview), []) if modify else current_value
+             for commission_id, modify, current_value in zip(commission_ids, to_modify, current_values)],
+            index=commissions_overview_df_input.index, dtype=object)
+
+    for i, (column_average, column_rounded) in enumerate(zip(average_columns, rounded_average_columns)):
+        for column_name, values in [(column_average, averages[:, i]), (column_rounded, rounded[:, i])]:
+            if column_name in commissions_overview_df_input.columns:
+                current_values = commissions_overview_df_input[column_name].to_numpy(dtype=float)
+            else:
+                current_values = np.full(len(commission_ids), np.nan)
+            commissions_overview_df_input[column_name] = np.where(to_modify, values, current_values)
+
+    return commissions_overview_df_input
 
-    
-    
     
     
 def obtain_aggregated_counts(dataframe_column):
@@ -149,31 +222,37 @@ def obtain_aggregated_counts(dataframe_column):
   
     return aggregated_df
 
+def explode_counters(dataframe_column):
+    """
+    Flatten a column of (member, count) lists (e.g. 'aanwezig_count_vaste') into a long dataframe with
+    the position of the row ('row'), the member ('Member') and the count ('count'): one row per (member, count) tuple
+    """
+    rows = list(dataframe_column)
+    lengths = np.fromiter((len(row) if isinstance(row, (list, tuple)) else 0 for row in rows), dtype=np.int64, count=len(rows))
+    member_counts = [member_count for row in rows if isinstance(row, (list, tuple)) for member_count in row]
+    exploded_df = pd.DataFrame(member_counts, columns=['Member', 'count']) if member_counts else \
+        pd.DataFrame({'Member': pd.Series(dtype=object), 'count': pd.Series(dtype=np.int64)})
+    exploded_df.insert(0, 'row', np.repeat(np.arange(len(rows), dtype=np.int64), lengths))
+    return exploded_df
+
+
 def find_member(dictionary, member_name):
     """
-    Function to add member of party to dataframe
+    Function to add member of party to dataframe (lookup in the member registry of dictionary, see member_registry.py)
     """
-    for key, value in dictionary.items():
-        for member in value:
-            if member[0] == member_name:
-                return key
-    return None  # Return None if member is not found in any group
+    return member_registry.registry_for(dictionary).party_of(member_name)  # None if member is not found in any group
     
 
 def get_overall_presence(dataframe_attendance_column, fracties_dict):
-    # Initialize a defaultdict to store aggregated counts for each party
-    party_counts = defaultdict(int)
-
-    # Loop through each row of attendance counts
-    for row in dataframe_attendance_column:
-        # Loop through each member and their count in the row
-        for member, count in row:
-            # Match the member's name to their party and accumulate their count
-            for party, members in fracties_dict.items():
-                if any(member_name == member for member_name, _ in members):
-                    party_counts[party] += count
-                    break  # Stop iterating if the member is found in a party
-    return dict(party_counts)
+    # Flatten the (member, count) tuples of all rows
+    member_counts = [member_count for row in dataframe_attendance_column for member_count in row]
+    if not member_counts:
+        return {}
+    member_counts_df = pd.DataFrame(member_counts, columns=['member', 'count'])
+    # Match the members' names to their party (at once), and aggregate the counts per party (in order of first appearance)
+    member_counts_df['party'] = member_registry.registry_for(fracties_dict).map_parties(member_counts_df['member'])
+    party_counts = member_counts_df.dropna(subset=['party']).groupby('party', sort=False)['count'].sum()
+    return {party: int(count) for party, count in party_counts.items()}
     
     
 def count_member_occurrence(attendance_list: list):
@@ -192,6 +271,17 @@ def count_member_occurrence(attendance_list: list):
 
     return sorted_counts
 
+
+def obtain_aggregated_counts_vectorized(attendance_matrices, status, rows=None, permanent=False):
+    """
+    Vectorized alternative to obtain_aggregated_counts(): dataframe ('Member', 'Aggregated_Count') of how often each
+    member had status in the meetings of rows (e.g. of the selected commissions and dates), sorted by count in descending
+    order (ties in order of first appearance). The counts are column sums of the sparse attendance matrices
+    (see attendance_matrix.py) instead of nested lists.
+    """
+    counts = attendance_matrices.member_counts(status, rows, permanent)
+    return pd.DataFrame({'Member': counts.index.to_numpy(dtype=object), 'Aggregated_Count': counts.to_numpy()})
+
 def obtain_counter_from_list_counter_likes(input_list, column_names_list):
 	"""
 	Obtain a sorted dataframe of a list or series of Counter-like objects.
@@ -221,24 +311,20 @@ def obtain_counter_from_list_counter_likes(input_list, column_names_list):
 	return overall_df.sort_values(by='Aantal keer aanwezig', ascending=False)
 
 
-# Function to search values of dict and return key of match
+# Function to search values of dict and return key of match (member name or id in the member registry of dictionary)
 def find_key(dictionary, search_value):
-    for key, values in dictionary.items():
-        for value in values:
-            if search_value in value:
-                return key
-    return None  # Return None if the value is not found in any list
+    return member_registry.registry_for(dictionary).party_of(search_value)  # None if the value is not found in any list
 
     
 # Function to get party color based on the provided dictionary
 def get_party(row, facties_dict_input):
-    # Obtain member's name
-    parliamentarian_name = row['Parlementslid']
-    # Obtain party of member
-    party_of_member = find_key(dictionary = facties_dict_input,
-                               search_value = parliamentarian_name)
-    # if this yields no error: obtain relevant color
-    if party_of_member:
-        return party_of_member
-    else:
-        return None
\ No newline at end of file
+    # Obtain party of member's name (None if not found)
+    return find_key(dictionary = facties_dict_input,
+                    search_value = row['Parlementslid'])
+
+
+def map_parties(member_names, facties_dict_input):
+    """
+    Obtain Series with the party of each of member_names (None if not found), looked up all at once
+    """
+    return member_registry.registry_for(facties_dict_input).map_parties(member_names)
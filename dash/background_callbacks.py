@@ -0,0 +1,75 @@
+"""
+Optionally run the expensive callbacks (update_display of the attendance tabs) as Dash background callbacks.
+
+When enabled, the callback runs in a separate process managed by a local, disk-based job manager
+(dash.DiskcacheManager), instead of in the gunicorn worker handling the request. The worker only starts
+the job and polls for its result, so it never blocks past the gunicorn timeout. When the user changes the
+selection (e.g. dragging the date picker) before a job is finished, Dash terminates the running job
+of that callback and starts a new one, so stale requests do not pile up.
+
+Enable through environment variables:
+    ATTENDANCE_BACKGROUND_CALLBACKS=1         run callbacks in the background (default: 0, i.e. regular callbacks)
+    ATTENDANCE_BACKGROUND_CACHE_DIR=<folder>  location of the job manager's cache (default: ../data/background_callbacks)
+
+Requires the packages diskcache, multiprocess and psutil (e.g. pip install "dash[diskcache]").
+"""
+import functools
+import os
+
+from dash.dependencies import Output
+
+
+background_callbacks_enabled = os.environ.get("ATTENDANCE_BACKGROUND_CALLBACKS", "0") == "1"
+background_cache_dir = os.environ.get("ATTENDANCE_BACKGROUND_CACHE_DIR", "../data/background_callbacks")
+
+
+def create_manager():
+    """
+    Create disk-based job manager for background callbacks, or return None if not enabled (or not available)
+    """
+    if not background_callbacks_enabled:
+        return None
+    try:
+        import diskcache
+        from dash import DiskcacheManager
+    except ImportError:
+        print("Background callbacks require diskcache, multiprocess and psutil (pip install \"dash[diskcache]\"). "
+              "Using regular callbacks.")
+        return None
+    return DiskcacheManager(diskcache.Cache(background_cache_dir))
+
+
+def callback_options(manager, progress_component_id):
+    """
+    Obtain keyword arguments for app.callback(): none for a regular callback, otherwise those of a background
+    callback reporting its progress in the children of progress_component_id
+    """
+    if manager is None:
+        return {}
+    return {"background": True,
+            "manager": manager,
+            "progress": Output(progress_component_id, "children"),
+            "progress_default": ""}
+
+
+def no_progress(progress):
+    """
+    Used as set_progress() for regular callbacks: progress is not reported
+    """
+    pass
+
+
+def with_progress(manager):
+    """
+    Decorator for callbacks defined as function(set_progress, *inputs).
+    Background callbacks receive set_progress() from Dash; regular callbacks receive no_progress().
+    """
+    def decorator(function):
+        if manager is not None:
+            return function
+
+        @functools.wraps(function)
+        def regular_callback(*inputs):
+            return function(no_progress, *inputs)
+        return regular_callback
+    return decorator
@@ -0,0 +1,238 @@
+"""
+Benchmark suite of the statistics of attendance_statistics.py and the bodies of the dash callbacks.
+
+Each benchmark is run repeatedly (after one untimed run) and its median and 95th percentile duration are reported:
+    * obtain_attendance_statistics(), obtain_aggregated_counts() and obtain_aggregated_counts_vectorized()
+    * update_attendance_per_party(), update_attendance_permanent_members() (tab per party),
+      obtain_attendance_permanent_members() and obtain_attendance_non_permanent_members() (tab per member)
+    * filter_data() and update_display() of each tab, for the default selection over the full period.
+      The result caches (see result_cache.py) are emptied before each run, and the shared cache is disabled,
+      so the actual computation is timed.
+
+The benchmarks run on the shipped data and on synthetic datasets (see synthetic_data.py) scaled to a multiple of
+the meetings per week of the shipped data, each in a separate process (the tabs load their data when imported).
+Synthetic datasets are seeded, and generated only once (in --synthetic-dir).
+
+Results can be stored as JSON baseline (--save-baseline), and compared against it (--compare): a benchmark of
+which the median is more than --threshold (default 0.2, i.e. 20%) and at least --min-difference ms slower than
+the baseline is reported as regression, and the exit code is 1.
+
+Run from the dash folder:
+    python benchmark_callbacks.py [--repetitions 20] [--scales 1 10] [--save-baseline] [--compare] [--threshold 0.2]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+default_baseline_path = "benchmark_baseline.json"
+
+
+def time_function(function, prepare, repetitions):
+    """
+    Obtain durations (ms) of function(*prepare()) over repetitions (prepare() is not timed), after one untimed run
+    """
+    function(*prepare())
+    durations = []
+    for _ in range(repetitions):
+        arguments = prepare()
+        start = time.perf_counter()
+        function(*arguments)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def summarize(durations):
+    return {"median_ms": float(np.median(durations)), "p95_ms": float(np.percentile(durations, 95)),
+            "min_ms": float(np.min(durations)), "repetitions": len(durations)}
+
+
+def collect_benchmarks():
+    """
+    Obtain the benchmarks on the data of this process: list of (name, function, prepare)
+    """
+    import attendance_data
+    import attendance_statistics
+    import attendance_per_member_integrated as per_member
+    import attendance_per_party_integrated as per_party
+    import attendance_permanent_members_per_comm_integrated as per_commission
+    import background_callbacks
+    import result_cache
+
+    def uncached(function):
+        # Empty the result caches before each run (e.g. filter_data() called by update_display())
+        def run(*arguments):
+            for cache in result_cache.caches.values():
+                cache.clear()
+            return function(*arguments)
+        return run
+
+    meetings_df = attendance_data.get_meetings()
+    start_date = meetings_df['Datum vergadering'].min()
+    end_date = meetings_df['Datum vergadering'].max()
+    fracties_dict = attendance_data.get_fracties()
+    parlementsleden_all_dict = attendance_data.get_parlementsleden()
+    # Meetings with the nested attendance lists, needed by obtain_attendance_statistics()
+    nested_meetings_df = pd.read_pickle(os.path.join(attendance_data.data_dir, 'meetings_all_commissions_df.pkl'))
+    commissions_overview_df = attendance_data.get_commissions_overview()
+    # Overview with the statistics of the full period, as obtained by filter_data()
+    filtered_overview_df, filtered_meetings_df = per_party.filter_data.__wrapped__(start_date, end_date, "Alle commissies")
+    name2count_permanent_dict = per_member.amount_commissions_as_permanent_dict(
+        filtered_overview_df, parlementsleden_all_dict, fracties_dict)
+
+    benchmarks = [
+        ("attendance_statistics.obtain_attendance_statistics", attendance_statistics.obtain_attendance_statistics,
+         lambda: (commissions_overview_df.copy(), nested_meetings_df)),
+        ("attendance_statistics.obtain_aggregated_counts", attendance_statistics.obtain_aggregated_counts,
+         lambda: (filtered_overview_df['aanwezig_count_vaste'],)),
+        ("attendance_statistics.obtain_aggregated_counts_vectorized", attendance_statistics.obtain_aggregated_counts_vectorized,
+         lambda: (attendance_data.get_attendance_matrices(), 'AANWEZIG',
+                  attendance_data.get_attendance_matrices().rows_of(filtered_meetings_df, filtered_overview_df), True)),
+        ("per_party.update_attendance_per_party", per_party.update_attendance_per_party,
+         lambda: (filtered_overview_df.copy(), fracties_dict, start_date, end_date)),
+        ("per_party.update_attendance_permanent_members", per_party.update_attendance_permanent_members,
+         lambda: (filtered_overview_df.copy(), fracties_dict, filtered_meetings_df)),
+        ("per_member.obtain_attendance_permanent_members", per_member.obtain_attendance_permanent_members,
+         lambda: (filtered_overview_df.copy(), fracties_dict, name2count_permanent_dict, filtered_meetings_df)),
+        ("per_member.obtain_attendance_non_permanent_members", per_member.obtain_attendance_non_permanent_members,
+         lambda: (filtered_overview_df.copy(), fracties_dict, filtered_meetings_df)),
+        ("per_commission.filter_data", per_commission.filter_data.__wrapped__,
+         lambda: (start_date, end_date, "Alle commissies")),
+        ("per_party.filter_data", per_party.filter_data.__wrapped__,
+         lambda: (start_date, end_date, "Alle commissies")),
+        ("per_member.filter_data", per_member.filter_data.__wrapped__,
+         lambda: (start_date, end_date)),
+        ("per_commission.update_display", uncached(per_commission.update_display.__wrapped__),
+         lambda: (background_callbacks.no_progress, "Alle commissies", start_date, end_date)),
+        ("per_party.update_display", uncached(per_party.update_display.__wrapped__),
+         lambda: (background_callbacks.no_progress, "Alle commissies", start_date, end_date)),
+        ("per_member.update_display", uncached(per_member.update_display.__wrapped__),
+         lambda: (background_callbacks.no_progress, "Alle partijen", start_date, end_date)),
+    ]
+    # The written questions are not part of the shipped data (see questions.py)
+    if os.path.exists(os.path.join(attendance_data.data_dir, 'details_questions_term_df.pkl')):
+        import written_questions
+        benchmarks.append(("written_questions.update_display", written_questions.update_display,
+                           lambda: (start_date, end_date, None, None, "vraagsteller", None)))
+    return benchmarks
+
+
+def run_benchmarks(repetitions, selected=None):
+    """
+    Run the benchmarks (names containing one of selected, default: all) on the data of this process
+    """
+    import attendance_data
+    results = {}
+    for name, function, prepare in collect_benchmarks():
+        if selected and not any(part in name for part in selected):
+            continue
+        results[name] = summarize(time_function(function, prepare, repetitions))
+        print(f"  {name:<62}{results[name]['median_ms']:>10.1f}{results[name]['p95_ms']:>10.1f}", file=sys.stderr)
+    return {"meetings": len(attendance_data.get_meetings()), "benchmarks": results}
+
+
+def prepare_dataset(name, scale, synthetic_dir):
+    """
+    Obtain data folder of dataset name: the shipped data (scale None), or synthetic data with scale times the
+    meetings per week of the shipped data (generated if not done yet)
+    """
+    if scale is None:
+        return os.environ.get("ATTENDANCE_DATA_DIR", "../data")
+    import synthetic_data
+    data_dir = os.path.join(synthetic_dir, name)
+    if not os.path.exists(os.path.join(data_dir, "meetings_all_commissions_df.pkl")):
+        print(f"Generating {name} in {data_dir}", file=sys.stderr)
+        synthetic_data.save_synthetic_data(synthetic_data.generate_synthetic_data(meetings_per_week=6.0 * scale, seed=0), data_dir)
+    return data_dir
+
+
+def run_dataset(data_dir, repetitions, selected):
+    """
+    Run the benchmarks on the data in data_dir in a separate process (the tabs load their data when imported)
+    """
+    environment = dict(os.environ, ATTENDANCE_DATA_DIR=data_dir, ATTENDANCE_SHARED_CACHE_PATH="", ATTENDANCE_WARM_UP="0",
+                       ATTENDANCE_SHARED_ARRAYS_DIR=os.path.join(data_dir, "shared_arrays"))
+    command = [sys.executable, os.path.abspath(__file__), "--worker", "--repetitions", str(repetitions)]
+    if selected:
+        command += ["--only"] + selected
+    output = subprocess.run(command, env=environment, stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(output)
+
+
+def compare(results, baseline, threshold, min_difference_ms):
+    """
+    Compare median durations of results with baseline. Returns list of regressions (dataset, benchmark, baseline, now)
+    """
+    regressions = []
+    print(f"{'dataset':<16}{'benchmark':<62}{'baseline (ms)':>14}{'now (ms)':>10}{'change':>9}")
+    for dataset, dataset_results in results["datasets"].items():
+        baseline_benchmarks = baseline.get("datasets", {}).get(dataset, {}).get("benchmarks", {})
+        for name, summary in dataset_results["benchmarks"].items():
+            if name not in baseline_benchmarks:
+                continue
+            before, now = baseline_benchmarks[name]["median_ms"], summary["median_ms"]
+            change = now / before - 1 if before > 0 else 0.0
+            is_regression = change > threshold and now - before >= min_difference_ms
+            if is_regression:
+                regressions.append((dataset, name, before, now))
+            print(f"{dataset:<16}{name:<62}{before:>14.1f}{now:>10.1f}{change:>+8.0%}{'  REGRESSION' if is_regression else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the attendance statistics and the dash callbacks (see benchmark_callbacks.py).")
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--scales", type=float, nargs="*", default=[1, 10],
+                        help="synthetic datasets, as multiple of the meetings per week of the shipped data (none: only shipped data)")
+    parser.add_argument("--synthetic-dir", default=os.path.join(tempfile.gettempdir(), "attendance_benchmark"))
+    parser.add_argument("--only", nargs="*", help="only run benchmarks of which the name contains one of these")
+    parser.add_argument("--baseline", default=default_baseline_path, help="JSON file of the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as baseline")
+    parser.add_argument("--compare", action="store_true", help="compare the results with the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slow-down reported as regression")
+    parser.add_argument("--min-difference", type=float, default=1.0, help="minimal slow-down (ms) reported as regression")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.worker:
+        # Benchmarks on the data of ATTENDANCE_DATA_DIR, results as JSON on stdout
+        json.dump(run_benchmarks(arguments.repetitions, arguments.only), sys.stdout)
+        return 0
+
+    datasets = [("shipped", None)] + [(f"synthetic-{scale:g}x", scale) for scale in arguments.scales]
+    results = {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+               "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+               "repetitions": arguments.repetitions, "datasets": {}}
+    for name, scale in datasets:
+        data_dir = prepare_dataset(name, scale, arguments.synthetic_dir)
+        print(f"{name} ({data_dir}): median and p95 (ms) over {arguments.repetitions} repetitions", file=sys.stderr)
+        results["datasets"][name] = run_dataset(data_dir, arguments.repetitions, arguments.only)
+
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if arguments.save_baseline:
+        with open(arguments.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline stored in {arguments.baseline}")
+    if arguments.compare:
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, arguments.threshold, arguments.min_difference)
+        print(f"{len(regressions)} regression(s) beyond {arguments.threshold:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Benchmark of the time it takes to load the data of the dash application: pickles versus Parquet files
+(only the columns the tabs need, see attendance_data.py and columnar_data.py).
+
+Run from the dash folder:
+    python benchmark_data_loading.py [amount of repetitions, default 20]
+"""
+import os
+import statistics
+import sys
+import time
+
+import pandas as pd
+
+import attendance_data
+import attendance_facts
+import columnar_data
+
+
+def time_loader(loader, repetitions):
+    """
+    Obtain median duration (ms) of loader() over repetitions
+    """
+    durations = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        loader()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def file_size(*file_names):
+    return sum(os.path.getsize(os.path.join(attendance_data.data_dir, file_name)) for file_name in file_names) / 1024
+
+
+def benchmark(repetitions=20):
+    data_dir = attendance_data.data_dir
+    if not columnar_data.columnar_data_available(data_dir):
+        print(f"No Parquet files in {data_dir} (or pyarrow not installed): run the update script first")
+        return
+
+    datasets = [
+        ("meetings",
+         lambda: pd.read_pickle(os.path.join(data_dir, "meetings_all_commissions_df.pkl")),
+         lambda: columnar_data.read_meetings(data_dir, attendance_data.meetings_columns),
+         ["meetings_all_commissions_df.pkl"], [columnar_data.meetings_file_name]),
+        ("commissions overview",
+         lambda: pd.read_pickle(os.path.join(data_dir, "commissions_overview_df.pkl")),
+         lambda: columnar_data.read_commissions_overview(data_dir, attendance_data.overview_columns),
+         ["commissions_overview_df.pkl"], [columnar_data.overview_file_name]),
+        ("attendance facts",
+         lambda: attendance_facts.load_attendance_facts(data_dir),
+         lambda: columnar_data.read_attendance_facts(data_dir),
+         [attendance_facts.facts_file_name, attendance_facts.members_file_name],
+         [columnar_data.facts_file_name, columnar_data.members_file_name]),
+    ]
+
+    print(f"Median load time over {repetitions} repetitions")
+    print(f"{'dataset':<22}{'pickle (ms)':>14}{'parquet (ms)':>14}{'speed-up':>10}{'pickle (kB)':>14}{'parquet (kB)':>14}")
+    total_pickle, total_parquet = 0, 0
+    for name, pickle_loader, parquet_loader, pickle_files, parquet_files in datasets:
+        pickle_ms = time_loader(pickle_loader, repetitions)
+        parquet_ms = time_loader(parquet_loader, repetitions)
+        total_pickle += pickle_ms
+        total_parquet += parquet_ms
+        print(f"{name:<22}{pickle_ms:>14.1f}{parquet_ms:>14.1f}{pickle_ms / parquet_ms:>9.1f}x"
+              f"{file_size(*pickle_files):>14.0f}{file_size(*parquet_files):>14.0f}")
+    print(f"{'total':<22}{total_pickle:>14.1f}{total_parquet:>14.1f}{total_pickle / total_parquet:>9.1f}x")
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,380 @@
+"""
+Latency instrumentation of the dash callbacks, exposed in the Prometheus text format on /metrics.
+
+instrument_callbacks(app) wraps every callback registered on app (app.callback_map), and records for each callback
+(named after its module and function, e.g. attendance_per_party_integrated.update_display_callback):
+    * a histogram of its duration (buckets_seconds), and the p50 / p95 / p99 of its most recent calls
+      (ATTENDANCE_METRICS_WINDOW, default 1024)
+    * a histogram of the size of its response (the JSON sent to the browser, buckets_bytes)
+    * the amount of calls and the total duration per input signature (the selection, e.g. dates and dropdown values),
+      for at most ATTENDANCE_METRICS_SIGNATURES (default 100) signatures per callback; others are counted as "other"
+    * the amount of errors (PreventUpdate is not counted as error)
+
+register_metrics_route(app) adds /metrics to app.server, which reports these metrics together with the hits and
+misses of the result caches (result_cache.stats()) and the time it took to load each dataset
+(attendance_data.load_durations).
+
+Metrics are recorded per process, and aggregated over all processes (e.g. the 7 gunicorn workers) before they are
+reported: each process stores a snapshot of its metrics in the shared cache (see shared_cache.py) at most every
+ATTENDANCE_METRICS_PUBLISH_INTERVAL seconds (default 10), and the worker answering /metrics merges the snapshots of all
+workers. Histograms and counters are summed (the snapshots of workers that stopped are kept, merged into one, so the
+counters never decrease), the quantiles are computed over the most recent calls of all running workers, and the load
+time of each dataset is that of the slowest worker. Without shared cache, only the metrics of the answering process are
+reported. For background callbacks (see background_callbacks.py), the timed call is the request starting or polling the
+job, not the job itself.
+
+Disable through the environment variable ATTENDANCE_METRICS=0.
+"""
+import collections
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from dash.exceptions import PreventUpdate
+
+import attendance_data
+import result_cache
+
+
+metrics_enabled = os.environ.get("ATTENDANCE_METRICS", "1") == "1"
+window_size = int(os.environ.get("ATTENDANCE_METRICS_WINDOW", 1024))
+max_signatures = int(os.environ.get("ATTENDANCE_METRICS_SIGNATURES", 100))
+publish_interval = float(os.environ.get("ATTENDANCE_METRICS_PUBLISH_INTERVAL", 10))
+
+buckets_seconds = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+buckets_bytes = [1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000]
+quantiles = [0.5, 0.95, 0.99]
+
+
+class Histogram:
+    """
+    Cumulative histogram (as Prometheus): counts of observations <= each bucket, their sum and their count
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for position, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.counts[position] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        """
+        Add the observations of other (a histogram with the same buckets)
+        """
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+
+class CallbackMetrics:
+    """
+    Metrics of a single callback (see module docstring)
+    """
+    def __init__(self, window=window_size):
+        self.durations = Histogram(buckets_seconds)
+        self.payload_sizes = Histogram(buckets_bytes)
+        # Most recent durations (all of them if window is None, e.g. when merging those of several processes)
+        self.recent_durations = collections.deque(maxlen=window)
+        self.errors = 0
+        # Input signature -> [amount of calls, total duration]
+        self.signatures = {}
+
+    def observe(self, signature, duration, payload_size):
+        self.durations.observe(duration)
+        self.recent_durations.append(duration)
+        if payload_size is not None:
+            self.payload_sizes.observe(payload_size)
+        if signature not in self.signatures and len(self.signatures) >= max_signatures:
+            signature = "other"
+        calls = self.signatures.setdefault(signature, [0, 0.0])
+        calls[0] += 1
+        calls[1] += duration
+
+    def copy(self):
+        """
+        Obtain a copy (e.g. as snapshot of this process, see snapshot())
+        """
+        metrics = CallbackMetrics()
+        metrics.merge(self)
+        return metrics
+
+    def merge(self, other, recent=True):
+        """
+        Add the metrics of other (e.g. of another process). recent: also add its most recent durations
+        """
+        self.durations.merge(other.durations)
+        self.payload_sizes.merge(other.payload_sizes)
+        if recent:
+            self.recent_durations.extend(other.recent_durations)
+        self.errors += other.errors
+        for signature, (calls, duration) in other.signatures.items():
+            total = self.signatures.setdefault(signature, [0, 0.0])
+            total[0] += calls
+            total[1] += duration
+
+
+# Metrics of each instrumented callback, by name
+callback_metrics = {}
+_lock = threading.Lock()
+
+# Publication of the snapshots of this process in the shared cache (see publish())
+_publisher = {"pid": None, "dirty": False}
+# Snapshots of processes that stopped are merged into the snapshot of this pid
+retired_pid = 0
+
+
+def input_signature(args):
+    """
+    Obtain the input signature of a call: its input values, with dates of the date picker reduced to 'YYYY-MM-DD'
+    """
+    values = []
+    for value in args:
+        value = result_cache.normalize_value(value)
+        if isinstance(value, str) and len(value) >= 10 and value[4:5] == "-" and value[7:8] == "-":
+            value = value[:10]
+        values.append(value)
+    return ", ".join(repr(value) for value in values)
+
+
+def callback_name(function):
+    return f"{function.__module__}.{getattr(function, '__name__', 'callback')}"
+
+
+def instrument(function, name):
+    """
+    Wrap function (a callback as stored in app.callback_map) to record its metrics under name
+    """
+    with _lock:
+        metrics = callback_metrics.setdefault(name, CallbackMetrics())
+
+    def timed_callback(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = function(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            with _lock:
+                metrics.errors += 1
+            raise
+        duration = time.perf_counter() - start
+        # Regular callbacks return the JSON response sent to the browser
+        payload_size = len(response) if isinstance(response, (str, bytes)) else None
+        with _lock:
+            metrics.observe(input_signature(args), duration, payload_size)
+            _publisher["dirty"] = True
+        start_publisher()
+        return response
+
+    timed_callback.__wrapped__ = function
+    return timed_callback
+
+
+def instrument_callbacks(app):
+    """
+    Wrap every callback registered on app (call after all callbacks are registered)
+    """
+    if not metrics_enabled:
+        return
+    for callback in app.callback_map.values():
+        function = callback["callback"]
+        if getattr(function, "_instrumented", False):
+            continue
+        # Dash wraps the registered function (functools.wraps), so its name is that of the function
+        timed_callback = instrument(function, callback_name(function))
+        timed_callback._instrumented = True
+        callback["callback"] = timed_callback
+
+
+def snapshot():
+    """
+    Obtain a snapshot of the metrics of this process: callback metrics, statistics of the result caches and load durations
+    """
+    with _lock:
+        callbacks = {name: metrics.copy() for name, metrics in callback_metrics.items()}
+    return {"callbacks": callbacks,
+            "caches": result_cache.stats(),
+            "load_durations": dict(attendance_data.load_durations)}
+
+
+def merge_snapshots(snapshots, stopped_snapshots=()):
+    """
+    Merge snapshots of several processes into one: callback metrics and counts of the caches are summed.
+    Of the running processes (snapshots), the most recent durations, the size of the caches and the load
+    durations (of the slowest process) are kept too. Of the processes that stopped (stopped_snapshots), only the counts.
+    """
+    merged = {"callbacks": {}, "caches": {}, "load_durations": {}}
+    for worker_snapshot, running in [(snapshot, True) for snapshot in snapshots] + [(snapshot, False) for snapshot in stopped_snapshots]:
+        for name, metrics in worker_snapshot["callbacks"].items():
+            merged["callbacks"].setdefault(name, CallbackMetrics(window=None)).merge(metrics, recent=running)
+        for name, stats in worker_snapshot["caches"].items():
+            total = merged["caches"].setdefault(name, {"hits": 0, "misses": 0, "size": 0})
+            total["hits"] += stats["hits"]
+            total["misses"] += stats["misses"]
+            if running:
+                # The shared cache is a single database, seen by all processes
+                total["size"] = max(total["size"], stats["size"]) if name == "shared" else total["size"] + stats["size"]
+        if running:
+            for name, duration in worker_snapshot["load_durations"].items():
+                merged["load_durations"][name] = max(merged["load_durations"].get(name, 0.0), duration)
+    return merged
+
+
+def process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def publish():
+    """
+    Store the snapshot of this process in the shared cache (if any)
+    """
+    shared_cache = result_cache.get_shared_cache()
+    if shared_cache is None:
+        return
+    with _lock:
+        _publisher["dirty"] = False
+    try:
+        shared_cache.put_worker_metrics(snapshot())
+    except sqlite3.Error as error:
+        print(f"Metrics of process {os.getpid()} not published ({error})")
+
+
+def start_publisher():
+    """
+    Start the thread publishing the snapshot of this process every publish_interval seconds (when changed),
+    once per process (a thread started before forking does not run in the forked workers)
+    """
+    if _publisher["pid"] == os.getpid():
+        return
+    with _lock:
+        if _publisher["pid"] == os.getpid():
+            return
+        _publisher["pid"] = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(publish_interval)
+            if _publisher["dirty"]:
+                publish()
+    threading.Thread(target=run, name="metrics-publisher", daemon=True).start()
+
+
+def collect_metrics():
+    """
+    Obtain the metrics of all processes (see module docstring): the snapshot of this process merged with the
+    snapshots of the other processes in the shared cache. Only this process without shared cache.
+    Returns (merged snapshot, amount of running processes)
+    """
+    shared_cache = result_cache.get_shared_cache()
+    if shared_cache is None:
+        return merge_snapshots([snapshot()]), 1
+    try:
+        publish()
+        shared_cache.retire_worker_metrics(process_running, lambda snapshots: merge_snapshots([], snapshots), retired_pid)
+        snapshots = shared_cache.worker_metrics()
+    except sqlite3.Error as error:
+        print(f"Metrics of other processes not available ({error})")
+        return merge_snapshots([snapshot()]), 1
+    running = [worker_snapshot for pid, worker_snapshot in snapshots.items() if pid != retired_pid]
+    retired = [snapshots[retired_pid]] if retired_pid in snapshots else []
+    return merge_snapshots(running, retired), len(running)
+
+
+def _labels(**labels):
+    # Prometheus label set, with escaped values
+    escaped = {key: str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+               for key, value in labels.items()}
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+def _histogram_lines(metric_name, histogram, **labels):
+    lines = [f"{metric_name}_bucket{_labels(**labels, le=bucket)} {count}"
+             for bucket, count in zip(histogram.buckets, histogram.counts)]
+    lines.append(f"{metric_name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+    lines.append(f"{metric_name}_sum{_labels(**labels)} {histogram.sum}")
+    lines.append(f"{metric_name}_count{_labels(**labels)} {histogram.count}")
+    return lines
+
+
+def render_metrics():
+    """
+    Obtain the metrics of all processes (see collect_metrics()) in the Prometheus text format
+    """
+    collected, amount_workers = collect_metrics()
+    lines = []
+
+    def add(metric_name, metric_type, description, samples):
+        lines.append(f"# HELP {metric_name} {description}")
+        lines.append(f"# TYPE {metric_name} {metric_type}")
+        lines.extend(samples)
+
+    metrics = {name: (metrics.durations, metrics.payload_sizes, list(metrics.recent_durations), metrics.errors,
+                      metrics.signatures)
+               for name, metrics in collected["callbacks"].items()}
+
+    add("dash_workers", "gauge", "Amount of running processes of which the metrics are reported",
+        [f"dash_workers {amount_workers}"])
+    add("dash_callback_duration_seconds", "histogram", "Duration of the dash callbacks",
+        [line for name, (durations, *_) in metrics.items()
+         for line in _histogram_lines("dash_callback_duration_seconds", durations, callback=name)])
+    add("dash_callback_latency_seconds", "summary", f"Quantiles of the duration of the last {window_size} calls of each callback in each running process",
+        [f"dash_callback_latency_seconds{_labels(callback=name, quantile=quantile)} {value}"
+         for name, (_, _, recent, _, _) in metrics.items() if recent
+         for quantile, value in zip(quantiles, np.quantile(recent, quantiles))]
+        + [line for name, (durations, *_) in metrics.items()
+           for line in [f"dash_callback_latency_seconds_sum{_labels(callback=name)} {durations.sum}",
+                        f"dash_callback_latency_seconds_count{_labels(callback=name)} {durations.count}"]])
+    add("dash_callback_response_bytes", "histogram", "Size of the JSON response of the dash callbacks",
+        [line for name, (_, payload_sizes, *_) in metrics.items()
+         for line in _histogram_lines("dash_callback_response_bytes", payload_sizes, callback=name)])
+    add("dash_callback_errors_total", "counter", "Amount of dash callbacks that raised an exception",
+        [f"dash_callback_errors_total{_labels(callback=name)} {errors}"
+         for name, (_, _, _, errors, _) in metrics.items()])
+    add("dash_callback_inputs_calls_total", "counter", "Amount of calls of each callback per input signature",
+        [f"dash_callback_inputs_calls_total{_labels(callback=name, inputs=signature)} {calls}"
+         for name, (*_, signatures) in metrics.items() for signature, (calls, _) in signatures.items()])
+    add("dash_callback_inputs_duration_seconds_total", "counter", "Total duration of each callback per input signature",
+        [f"dash_callback_inputs_duration_seconds_total{_labels(callback=name, inputs=signature)} {duration}"
+         for name, (*_, signatures) in metrics.items() for signature, (_, duration) in signatures.items()])
+
+    cache_stats = collected["caches"]
+    add("result_cache_hits_total", "counter", "Hits of the result caches (see result_cache.py and shared_cache.py)",
+        [f"result_cache_hits_total{_labels(cache=name)} {stats['hits']}" for name, stats in cache_stats.items()])
+    add("result_cache_misses_total", "counter", "Misses of the result caches",
+        [f"result_cache_misses_total{_labels(cache=name)} {stats['misses']}" for name, stats in cache_stats.items()])
+    add("result_cache_hit_ratio", "gauge", "Hits / (hits + misses) of the result caches",
+        [f"result_cache_hit_ratio{_labels(cache=name)} {stats['hits'] / (stats['hits'] + stats['misses'])}"
+         for name, stats in cache_stats.items() if stats['hits'] + stats['misses']])
+    add("result_cache_size", "gauge", "Amount of results in the result caches",
+        [f"result_cache_size{_labels(cache=name)} {stats['size']}" for name, stats in cache_stats.items()])
+
+    add("attendance_data_load_seconds", "gauge", "Time it took to load each dataset, in the slowest process (see attendance_data.py)",
+        [f"attendance_data_load_seconds{_labels(dataset=name)} {duration}"
+         for name, duration in collected["load_durations"].items()])
+    return "\n".join(lines) + "\n"
+
+
+def register_metrics_route(app, path="/metrics"):
+    """
+    Add path (default /metrics) to the server of app, answering with render_metrics()
+    """
+    if not metrics_enabled:
+        return
+
+    def metrics_view():
+        return render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    app.server.add_url_rule(path, "metrics", metrics_view)
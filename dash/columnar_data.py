@@ -0,0 +1,118 @@
+"""
+Columnar (Parquet) version of the datasets used by the dash application.
+
+Unpickling meetings_all_commissions_df loads every column, including the nested lists of {'Naam', 'id', 'Fractie'}
+dicts the dash application no longer reads (it uses the fact table, see attendance_facts.py), and ties the data
+to the pandas version that wrote it. The update pipeline therefore also writes Parquet files with proper dtypes:
+
+    meetings_all_commissions_df.parquet   meeting_id (int64), Datum vergadering (date), commissie.titel (categorical)
+                                          and the meeting count columns (float64). The nested attendance columns
+                                          are not stored: they are available as fact table.
+    commissions_overview_df.parquet       overview of the commissions, commissie.titel categorical
+    attendance_facts.parquet              fact table: int32 ids, date, categorical status, boolean is_permanent
+    attendance_members.parquet            dimension table of the members
+
+Parquet allows to read only the columns that are needed (see read_meetings() and read_commissions_overview()).
+Requires pyarrow (pip install pyarrow): if not available, the pickles are used.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow # noqa: F401 (engine of pd.read_parquet() / to_parquet())
+    pyarrow_available = True
+except ImportError:
+    pyarrow_available = False
+
+
+meetings_file_name = 'meetings_all_commissions_df.parquet'
+overview_file_name = 'commissions_overview_df.parquet'
+facts_file_name = 'attendance_facts.parquet'
+members_file_name = 'attendance_members.parquet'
+
+# Columns of the overview holding lists (Parquet returns them as numpy arrays: turned back into lists when read)
+overview_list_columns = ['voorzitter', 'eerste ondervoorzitter', 'tweede ondervoorzitter', 'derde ondervoorzitter',
+                         'vierde ondervoorzitter', 'vaste leden', 'plaatsvervangende leden', 'toegevoegde leden']
+
+
+def columnar_data_available(data_dir):
+    """
+    Check whether pyarrow is installed and all Parquet files are present in data_dir
+    """
+    return pyarrow_available and all(os.path.exists(os.path.join(data_dir, file_name)) for file_name in
+                                     [meetings_file_name, overview_file_name, facts_file_name, members_file_name])
+
+
+def meetings_to_columnar(meetings_all_commissions_df):
+    """
+    Obtain flat version of meetings_all_commissions_df with proper dtypes (see module docstring)
+    """
+    meeting_ids = meetings_all_commissions_df.index.str.rsplit(" ", n=1).str[-1].astype(np.int64)
+    columnar_df = pd.DataFrame({
+        'meeting_id': meeting_ids.to_numpy(),
+        'Datum vergadering': pd.to_datetime(meetings_all_commissions_df['Datum vergadering']).dt.date.to_numpy(),
+        'commissie.titel': pd.Categorical(meetings_all_commissions_df['commissie.titel']),
+    })
+    for column_name in meetings_all_commissions_df.columns:
+        if column_name.startswith('Aantal '):
+            columnar_df[column_name] = meetings_all_commissions_df[column_name].to_numpy(dtype=np.float64)
+    return columnar_df
+
+
+def overview_to_columnar(commissions_overview_df):
+    """
+    Obtain version of commissions_overview_df with proper dtypes (see module docstring)
+    """
+    columnar_df = commissions_overview_df.copy()
+    columnar_df['commissie.titel'] = pd.Categorical(columnar_df['commissie.titel'])
+    columnar_df['aantal vergaderingen'] = pd.to_numeric(columnar_df['aantal vergaderingen']).astype(np.int64)
+    return columnar_df
+
+
+def save_columnar_data(meetings_all_commissions_df, commissions_overview_df, attendance_facts_df, attendance_members_df,
+                       data_dir='../data', file_suffix=""):
+    """
+    Write Parquet version of the meetings, the overview, the fact table and the member dimension
+    (file_suffix allows to add e.g. the extraction date to the file names)
+    """
+    if not pyarrow_available:
+        print("pyarrow not installed: Parquet files not written (pip install pyarrow)")
+        return
+    for df, file_name in [(meetings_to_columnar(meetings_all_commissions_df), meetings_file_name),
+                          (overview_to_columnar(commissions_overview_df), overview_file_name),
+                          (attendance_facts_df, facts_file_name),
+                          (attendance_members_df, members_file_name)]:
+        df.to_parquet(os.path.join(data_dir, file_name.replace('.parquet', f'{file_suffix}.parquet')), index=False)
+
+
+def read_meetings(data_dir='../data', columns=None):
+    """
+    Read meetings (only columns, if given), indexed like meetings_all_commissions_df (e.g. 'Vergadering 1622819')
+    """
+    if columns is not None:
+        columns = ['meeting_id'] + [column_name for column_name in columns if column_name != 'meeting_id']
+    meetings_df = pd.read_parquet(os.path.join(data_dir, meetings_file_name), columns=columns)
+    meetings_df.index = pd.Index("Vergadering " + meetings_df["meeting_id"].astype(str), dtype=object, name=None)
+    return meetings_df.drop(columns='meeting_id')
+
+
+def read_commissions_overview(data_dir='../data', columns=None):
+    """
+    Read overview of the commissions (only columns, if given)
+    """
+    commissions_overview_df = pd.read_parquet(os.path.join(data_dir, overview_file_name), columns=columns)
+    for column_name in overview_list_columns:
+        if column_name in commissions_overview_df.columns:
+            commissions_overview_df[column_name] = commissions_overview_df[column_name].map(
+                lambda values: None if values is None else list(values))
+    return commissions_overview_df
+
+
+def read_attendance_facts(data_dir='../data'):
+    """
+    Read fact table and member dimension. Returns (attendance_facts_df, attendance_members_df)
+    """
+    return (pd.read_parquet(os.path.join(data_dir, facts_file_name)),
+            pd.read_parquet(os.path.join(data_dir, members_file_name)))
@@ -0,0 +1,134 @@
+"""
+Registry of the members of parliament, built once out of parlementsleden.pkl ({id: [name, party]}) and
+fracties.pkl ({party: [[name, id], ...]}), to look up members by id or by name in constant time.
+
+Before, the party of a member was found by scanning fracties_dict (find_member(), find_key(), get_overall_presence())
+or parlementsleden_all_dict (map_member_to_party() in questions.py) for every member looked up. Here both are
+turned into dicts once:
+
+    id -> name, id -> party, normalized name -> id
+
+Names are normalized (normalize_name()) before being looked up, so differences in unicode composition, case or
+whitespace do not matter. When a name occurs more than once, the first member (in order of fracties.pkl, then
+parlementsleden.pkl) is kept, as the linear scans did.
+
+The map_*() methods take a pandas Series (or index, or list) and look up all its values at once with Series.map().
+"""
+import unicodedata
+
+import pandas as pd
+
+
+def normalize_name(name):
+    """
+    Normalize name of a member: unicode composition (NFKC), case and whitespace. Other values are returned as is.
+    """
+    if not isinstance(name, str):
+        return name
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
+class MemberRegistry:
+    """
+    Members of parliament by id and by normalized name (see module docstring)
+    """
+    def __init__(self, parlementsleden_all_dict=None, fracties_dict=None):
+        self.names = {}     # id -> name
+        self.parties = {}   # id -> party
+        self.ids = {}       # normalized name -> id
+
+        # Parties as in fracties.pkl (first party listing a member wins)
+        for party, members in (fracties_dict or {}).items():
+            for name, member_id in members:
+                self._add(member_id, name, party)
+        # Members of parliament not in any party of fracties.pkl
+        for member_id, values in (parlementsleden_all_dict or {}).items():
+            self._add(member_id, values[0], values[1] if len(values) > 1 else None)
+
+    def _add(self, member_id, name, party):
+        if member_id not in self.names:
+            self.names[member_id] = name
+            self.parties[member_id] = party
+        self.ids.setdefault(normalize_name(name), member_id)
+
+    def __len__(self):
+        return len(self.names)
+
+    def id_of(self, name):
+        """
+        Obtain id of member name (None if unknown)
+        """
+        return self.ids.get(normalize_name(name))
+
+    def name_of(self, member_id):
+        return self.names.get(member_id)
+
+    def party_of(self, member):
+        """
+        Obtain party of member, given by name or by id (None if unknown)
+        """
+        member_id = member if member in self.names else self.id_of(member)
+        return self.parties.get(member_id)
+
+    def _map(self, values, mapping):
+        # Look up each value with Series.map(), None for unknown values
+        mapped = pd.Series(values).map(mapping)
+        return mapped.astype(object).where(mapped.notna(), None)
+
+    def map_ids(self, names):
+        """
+        Obtain Series with the id of each name in names (None if unknown)
+        """
+        return self._map(pd.Series(names, dtype=object).map(normalize_name), self.ids)
+
+    def map_names(self, member_ids):
+        """
+        Obtain Series with the name of each id in member_ids (None if unknown)
+        """
+        return self._map(member_ids, self.names)
+
+    def map_parties(self, names):
+        """
+        Obtain Series with the party of each member name in names (None if unknown)
+        """
+        return self._map(self.map_ids(names), self.parties)
+
+    def map_parties_by_id(self, member_ids):
+        """
+        Obtain Series with the party of each id in member_ids (None if unknown)
+        """
+        return self._map(member_ids, self.parties)
+
+
+# Registries of the dicts passed to the helper functions of attendance_statistics.py, built once per dict
+# (the dicts are loaded once per process by attendance_data.py). The dict itself is kept, so its id is not reused.
+# Only the registry registered last (i.e. of the current data version) is kept apart from the ones built on first use,
+# so it is never evicted with them, while the dict and registry of a previous data version are released.
+_registered = None
+_registries = {}
+
+
+def register(fracties_dict, registry):
+    """
+    Use registry for fracties_dict (e.g. the registry of attendance_data.py, built out of both pickles),
+    instead of the registry registered before
+    """
+    global _registered
+    _registered = (fracties_dict, registry)
+
+
+def registry_for(fracties_dict):
+    """
+    Obtain registry of fracties_dict ({party: [[name, id], ...]}), built on first use
+    """
+    if isinstance(fracties_dict, MemberRegistry):
+        return fracties_dict
+    registered = _registered
+    if registered is not None and registered[0] is fracties_dict:
+        return registered[1]
+    cached = _registries.get(id(fracties_dict))
+    if cached is None or cached[0] is not fracties_dict:
+        if len(_registries) >= 16:
+            _registries.clear()
+        cached = _registries[id(fracties_dict)] = (fracties_dict, MemberRegistry(fracties_dict=fracties_dict))
+    return cached[1]
@@ -0,0 +1,291 @@
+"""
+Time-aware composition of the commissions: the periods in which each member was a permanent member ('vast lid')
+of each commission.
+
+The column 'vaste leden' of the overview only holds the composition at the time of extraction (/comm/huidige).
+Judging the attendance of past meetings against it counts members that joined a commission afterwards as
+permanent members of its earlier meetings (and members that left as non-permanent). Here, the compositions observed
+at each run of the extraction and update scripts are kept as intervals:
+
+    member_id | Naam | commission_id | valid_from | valid_to
+
+where valid_to is exclusive, and NaT means open ended (valid_from NaT: since the first observation, i.e. also
+before it; valid_to NaT: still a permanent member). 'Naam' is the name as listed in 'vaste leden' (the statistics
+of the tabs are by name).
+
+Between two observations, the composition of the earlier one is assumed to hold (last observation carried
+forward): a member appearing in a composition observed on date D is a permanent member from D on, a member no
+longer listed on D is not any more from D on. The first observation of a commission is assumed to hold for all its
+earlier meetings (also for a commission that first appears in a later observation).
+
+MembershipIntervals is the index on those intervals: the intervals sorted by (commission, member, valid_from),
+so "was member X a permanent member of commission C on date D" is a binary search (O(log n) in the amount of
+intervals), for a whole array of (commission, member, date) triples at once. Reshuffles (e.g. a new legislature
+with new commissions) only add intervals.
+
+The intervals are maintained by the extraction and update scripts (see code folder), which tag the permanent members
+of each meeting (the '_vast' columns) with tag_permanent_attendance(), i.e. by the date of the meeting. Meetings tagged
+before by the current composition are tagged again with retag_permanent_attendance() (once, when the update script
+first builds the intervals).
+"""
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+import attendance_facts
+import member_registry
+
+
+intervals_file_name = "membership_intervals.pkl"
+interval_columns = ['member_id', 'Naam', 'commission_id', 'valid_from', 'valid_to']
+
+# Dates as days since 1970-01-01, shifted by day_offset into [0, day_span) so they can be packed into a single key
+# together with the commission (or the position of the (commission, member) pair). NaT bounds map to the extremes.
+day_span = 1 << 22
+day_offset = 1 << 21
+
+
+def to_days(dates):
+    """
+    Obtain int64 array of days (shifted by day_offset) of dates; NaT maps to -1
+    """
+    days = pd.to_datetime(pd.Series(dates).reset_index(drop=True)).to_numpy(dtype='datetime64[D]')
+    is_missing = np.isnat(days)
+    days = days.astype(np.int64) + day_offset
+    days[is_missing] = -1
+    return days
+
+
+def empty_intervals():
+    return pd.DataFrame({'member_id': pd.Series(dtype=np.int64), 'Naam': pd.Series(dtype=object),
+                         'commission_id': pd.Series(dtype=np.int64),
+                         'valid_from': pd.Series(dtype='datetime64[ns]'), 'valid_to': pd.Series(dtype='datetime64[ns]')})
+
+
+def resolve_member_ids(names, registry, attendance_members_df=None):
+    """
+    Obtain Series with the id of each name in names: looked up in registry (see member_registry.py), and else in the
+    members of the attendance (attendance_members_df, e.g. ministers no longer in parlementsleden.pkl). None if unknown.
+    """
+    member_ids = registry.map_ids(names)
+    if attendance_members_df is not None and member_ids.isna().any():
+        # Names are compared as in the member registry (normalized)
+        ids_by_name = dict(zip(attendance_members_df['Naam'].map(member_registry.normalize_name), attendance_members_df['member_id']))
+        unknown = member_ids.isna().to_numpy()
+        member_ids[unknown] = pd.Series(names, dtype=object)[unknown].map(member_registry.normalize_name).map(ids_by_name).to_numpy()
+    return member_ids.astype(object).where(member_ids.notna(), None)
+
+
+def composition_pairs(commissions_overview_df, registry, attendance_members_df=None):
+    """
+    Obtain the (member_id, Naam, commission_id) pairs of the permanent members of an overview of the commissions.
+    Members of which the id is unknown are left out (and printed).
+    """
+    pairs_df = (commissions_overview_df[['commissie.id', 'vaste leden']]
+                .assign(**{'vaste leden': commissions_overview_df['vaste leden'].map(
+                    lambda members: list(members) if isinstance(members, (list, tuple, set)) else [])})
+                .explode('vaste leden').dropna(subset=['vaste leden']))
+    pairs_df = pd.DataFrame({'member_id': resolve_member_ids(pairs_df['vaste leden'], registry, attendance_members_df).to_numpy(),
+                             'Naam': pairs_df['vaste leden'].to_numpy(dtype=object),
+                             'commission_id': pairs_df['commissie.id'].to_numpy(dtype=np.int64)})
+    unknown = pairs_df['member_id'].isna()
+    if unknown.any():
+        print(f"Permanent members without known id (left out of the membership intervals): {sorted(set(pairs_df.loc[unknown, 'Naam']))}")
+    pairs_df = pairs_df[~unknown].astype({'member_id': np.int64})
+    return pairs_df.drop_duplicates(subset=['member_id', 'commission_id'], ignore_index=True)
+
+
+def update_membership_intervals(intervals_df, commissions_overview_df, observed_on, registry, attendance_members_df=None):
+    """
+    Add the composition of commissions_overview_df, observed on date observed_on, to intervals_df: open intervals of
+    members no longer listed are closed on observed_on, members newly listed obtain an interval from observed_on on.
+    Members of a commission without any interval yet (e.g. a commission that appeared since the previous observation,
+    or all commissions if intervals_df is empty) obtain an interval from NaT on: as for the first observation, the
+    first known composition of a commission holds for all its earlier meetings. Observations are to be added in order of date.
+    """
+    observed_on = pd.Timestamp(observed_on)
+    intervals_df = empty_intervals() if intervals_df is None else intervals_df.reset_index(drop=True).copy()
+    pairs_df = composition_pairs(commissions_overview_df, registry, attendance_members_df)
+
+    is_open = intervals_df['valid_to'].isna()
+    open_keys = pd.MultiIndex.from_frame(intervals_df.loc[is_open, ['member_id', 'commission_id']])
+    current_keys = pd.MultiIndex.from_frame(pairs_df[['member_id', 'commission_id']])
+
+    # Members no longer listed: close their interval
+    is_closed = is_open.copy()
+    is_closed[is_open] = ~open_keys.isin(current_keys)
+    intervals_df.loc[is_closed, 'valid_to'] = observed_on
+
+    # Members newly listed: open an interval
+    new_pairs_df = pairs_df[~current_keys.isin(open_keys)]
+    is_new_commission = ~new_pairs_df['commission_id'].isin(intervals_df['commission_id']).to_numpy()
+    new_intervals_df = new_pairs_df.assign(valid_from=np.where(is_new_commission, pd.NaT, observed_on), valid_to=pd.NaT)
+    new_intervals_df = new_intervals_df.astype({'valid_from': 'datetime64[ns]', 'valid_to': 'datetime64[ns]'})
+    return pd.concat([intervals_df, new_intervals_df], ignore_index=True)[interval_columns]
+
+
+def build_membership_intervals(compositions, registry, attendance_members_df=None):
+    """
+    Build intervals out of compositions observed on several dates: {date: overview with 'commissie.id' and 'vaste leden'}
+    """
+    intervals_df = empty_intervals()
+    for observed_on, commissions_overview_df in sorted(compositions.items(), key=lambda item: pd.Timestamp(item[0])):
+        intervals_df = update_membership_intervals(intervals_df, commissions_overview_df, observed_on, registry, attendance_members_df)
+    return intervals_df
+
+
+def read_composition_snapshots(data_dir=attendance_facts.default_data_dir):
+    """
+    Read the dated overviews written by the extraction script (commissions_overview_df_<YYYY-MM-DD>.pkl, in data_dir
+    or in its folder old_data): {date: overview with 'commissie.id', 'commissie.titel' and 'vaste leden'}, sorted by date
+    """
+    snapshots = {}
+    for pattern in [os.path.join(data_dir, 'commissions_overview_df_*.pkl'),
+                    os.path.join(data_dir, 'old_data', 'commissions_overview_df_*.pkl')]:
+        for path in glob.glob(pattern):
+            try:
+                snapshot_date = pd.to_datetime(os.path.basename(path)[len('commissions_overview_df_'):-len('.pkl')]).date()
+            except ValueError:
+                continue
+            snapshots[snapshot_date] = pd.read_pickle(path)[['commissie.id', 'commissie.titel', 'vaste leden']]
+    return dict(sorted(snapshots.items()))
+
+
+def save_membership_intervals(intervals_df, data_dir=attendance_facts.default_data_dir, file_suffix=""):
+    """
+    Save intervals (file_suffix allows to add e.g. the extraction date to the file name)
+    """
+    intervals_df.to_pickle(os.path.join(data_dir, intervals_file_name.replace('.pkl', f'{file_suffix}.pkl')))
+
+
+def load_membership_intervals(data_dir=attendance_facts.default_data_dir):
+    """
+    Load the intervals of data_dir (None if not written yet)
+    """
+    path = os.path.join(data_dir, intervals_file_name)
+    return pd.read_pickle(path) if os.path.exists(path) else None
+
+
+class MembershipIntervals:
+    """
+    Index on the membership intervals (see module docstring)
+    """
+    def __init__(self, intervals_df):
+        member_ids = intervals_df['member_id'].to_numpy(dtype=np.int64)
+        commission_ids = intervals_df['commission_id'].to_numpy(dtype=np.int64)
+        starts = to_days(intervals_df['valid_from'])
+        ends = to_days(intervals_df['valid_to'])
+        # Open ended intervals: since always / up to now
+        starts[starts < 0] = 0
+        ends[ends < 0] = day_span - 1
+
+        # Sort by (commission, member, valid_from)
+        pair_keys = (commission_ids << 32) | member_ids
+        order = np.lexsort((starts, pair_keys))
+        self.member_ids = member_ids[order]
+        self.commission_ids = commission_ids[order]
+        self.names = intervals_df['Naam'].to_numpy(dtype=object)[order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+        # Index: position of the (commission, member) pair among the distinct pairs, and the key (pair, valid_from)
+        self.pair_keys, self.pair_positions = np.unique(pair_keys[order], return_inverse=True)
+        self.pair_positions = self.pair_positions.reshape(-1).astype(np.int64)
+        self.keys = self.pair_positions * day_span + self.starts
+
+    def __len__(self):
+        return len(self.starts)
+
+    def contains(self, commission_ids, member_ids, dates):
+        """
+        Obtain boolean array telling for each (commission_ids, member_ids, dates) triple whether the member was a
+        permanent member of the commission on that date
+        """
+        commission_ids = np.asarray(commission_ids, dtype=np.int64)
+        member_ids = np.asarray(member_ids, dtype=np.int64)
+        days = to_days(dates)
+        if not len(self):
+            return np.zeros(len(days), dtype=bool)
+        query_pair_keys = (commission_ids << 32) | member_ids
+        # Position of the pair among the distinct pairs
+        pair_positions = np.searchsorted(self.pair_keys, query_pair_keys)
+        is_found = np.zeros(len(query_pair_keys), dtype=bool)
+        in_range = pair_positions < len(self.pair_keys)
+        is_found[in_range] = self.pair_keys[pair_positions[in_range]] == query_pair_keys[in_range]
+        # Last interval of the pair starting on or before the date, which should not have ended yet
+        positions = np.searchsorted(self.keys, pair_positions * day_span + days, side='right') - 1
+        positions = np.maximum(positions, 0)
+        return (is_found & (days >= 0) & (self.pair_positions[positions] == pair_positions)
+                & (days < self.ends[positions]))
+
+    def relevant_meetings(self, meetings_df, commissions_overview_df):
+        """
+        Obtain Series (indexed by name, 'Member') with the amount of meetings (of meetings_df, with 'commissie.titel'
+        and 'Datum vergadering', e.g. the meetings of the selected dates) of the commissions of commissions_overview_df
+        held while each member was a permanent member of that commission
+        """
+        # Meetings sorted by key (commission, date)
+        title_to_id = dict(zip(commissions_overview_df['commissie.titel'], commissions_overview_df['commissie.id']))
+        meeting_commission_ids = meetings_df['commissie.titel'].astype(object).map(title_to_id)
+        is_relevant = meeting_commission_ids.notna().to_numpy()
+        meeting_keys = np.sort(meeting_commission_ids[is_relevant].to_numpy(dtype=np.int64) * day_span
+                               + to_days(meetings_df['Datum vergadering'][is_relevant]))
+        # Meetings within each interval (of the commissions of the overview): two binary searches
+        selected = np.isin(self.commission_ids, commissions_overview_df['commissie.id'].to_numpy(dtype=np.int64))
+        commission_keys = self.commission_ids[selected] * day_span
+        amounts = (np.searchsorted(meeting_keys, commission_keys + self.ends[selected])
+                   - np.searchsorted(meeting_keys, commission_keys + self.starts[selected]))
+        return pd.Series(amounts, index=pd.Index(self.names[selected], dtype=object, name='Member')).groupby(level=0, sort=False).sum()
+
+
+def tag_permanent_attendance(meetings_df, commission_ids, intervals):
+    """
+    Obtain the '_vast' columns of meetings_df (one column of lists of {'Naam', 'id', 'Fractie'} dicts per status):
+    the members of 'AANWEZIG', 'AFWEZIG' and 'VERONTSCHULDIGD' that were a permanent member of the commission of the
+    meeting (commission_ids, one per row) on the date of the meeting ('Datum vergadering'), see MembershipIntervals.
+    Rows without list obtain an empty list, statuses without column obtain None.
+    """
+    commission_ids = np.broadcast_to(np.asarray(commission_ids, dtype=np.int64), (len(meetings_df),))
+    dates = meetings_df['Datum vergadering'].reset_index(drop=True)
+    permanent_df = pd.DataFrame(index=meetings_df.index)
+    for status in attendance_facts.STATUSES:
+        if status not in meetings_df.columns:
+            permanent_df[f'{status}_vast'] = None
+            continue
+        exploded = meetings_df[status].reset_index(drop=True).explode()
+        exploded = exploded[exploded.map(lambda member: isinstance(member, dict))].astype(object)
+        positions = exploded.index.to_numpy()
+        is_permanent = intervals.contains(commission_ids[positions], exploded.str.get('id').to_numpy(dtype=np.int64),
+                                          dates.to_numpy()[positions])
+        members_per_meeting = exploded[is_permanent].groupby(level=0).agg(list)
+        permanent_df[f'{status}_vast'] = [members_per_meeting.get(position, []) for position in range(len(meetings_df))]
+    return permanent_df
+
+
+def retag_permanent_attendance(meetings_all_commissions_df, commissions_overview_df, intervals):
+    """
+    Obtain copy of meetings_all_commissions_df of which the '_vast' columns and their counts ('Aantal ... vaste leden')
+    are tagged again by the membership intervals (see tag_permanent_attendance()), e.g. meetings tagged by the composition
+    of the commissions at the time of extraction. Meetings of commissions that are not in commissions_overview_df
+    (i.e. without intervals) keep their tags.
+    """
+    title_to_id = dict(zip(commissions_overview_df['commissie.titel'], commissions_overview_df['commissie.id']))
+    commission_ids = meetings_all_commissions_df['commissie.titel'].astype(object).map(title_to_id)
+    is_known = commission_ids.notna().to_numpy()
+    known_meetings_df = meetings_all_commissions_df[is_known]
+    permanent_df = tag_permanent_attendance(known_meetings_df, commission_ids[is_known].to_numpy(dtype=np.int64), intervals)
+
+    retagged_df = meetings_all_commissions_df.copy()
+    for status in attendance_facts.STATUSES:
+        column_name = f'{status}_vast'
+        tags = list(retagged_df[column_name]) if column_name in retagged_df.columns else [None] * len(retagged_df)
+        # By position: the index of a meeting can occur for multiple commissions
+        for position, members in zip(np.flatnonzero(is_known), permanent_df[column_name]):
+            tags[position] = members
+        retagged_df[column_name] = pd.Series(tags, index=retagged_df.index, dtype=object)
+        count_column_name = f'Aantal {status.lower()} vaste leden'
+        if count_column_name in retagged_df.columns:
+            retagged_df[count_column_name] = retagged_df[column_name].map(
+                lambda members: len(members) if isinstance(members, list) else 0).astype(float)
+    return retagged_df
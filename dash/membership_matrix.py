@@ -0,0 +1,126 @@
+"""
+Member × commission matrix of the permanent members ('vaste leden') of the commissions.
+
+    membership[member, commission] = 1 if member is a permanent member of commission
+
+It is built out of the column 'vaste leden' of an overview of the commissions (e.g. the filtered overview a tab
+works on), with a row per member (in order of first occurrence in 'vaste leden') and a column per commission (in
+the order of the overview). The amount of commissions of each member, which used to be obtained by looping over
+every member × every commission, follows from a single sparse product:
+
+    commissions_per_member()           = membership @ 1
+
+The matrix holds a single composition (e.g. the current one). Statistics that depend on the composition on the date
+of each meeting (the relevant meetings of a member, the attendance as permanent member) use the membership
+intervals instead (see membership_intervals.py).
+
+A member listed more than once in the same commission counts once.
+
+membership_of() is the shared entry point of the tabs: it builds the matrix of an overview only once per composition
+(the commissions and their permanent members, which do not depend on the selected dates), and the products derived
+from it (e.g. commissions_per_member()) are evaluated lazily, on first request, and kept with the matrix.
+
+Historical compositions (snapshots of the overview at earlier extraction dates, see
+attendance_data.get_composition_snapshots()) are matrices like any other: snapshot_on() selects the snapshot
+in effect on a date.
+"""
+import bisect
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class MembershipMatrix:
+    """
+    Sparse member × commission matrix of the permanent members (see module docstring)
+    """
+    def __init__(self, permanent_members_per_commission, commission_ids=None):
+        permanent_members_per_commission = [members if isinstance(members, (list, tuple, set)) else []
+                                            for members in permanent_members_per_commission]
+        lengths = [len(members) for members in permanent_members_per_commission]
+        names = [name for members in permanent_members_per_commission for name in members]
+        codes, unique_names = pd.factorize(pd.Series(names, dtype=object))
+
+        self.member_names = pd.Index(unique_names, dtype=object, name='Member')
+        self.commission_ids = (np.arange(len(lengths)) if commission_ids is None
+                               else np.asarray(commission_ids))
+        commission_positions = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        matrix = sparse.csr_matrix((np.ones(len(codes), dtype=np.int64), (codes, commission_positions)),
+                                   shape=(len(self.member_names), len(lengths)))
+        # Count duplicate (member, commission) entries once
+        matrix.data[:] = 1
+        self.matrix = matrix
+        # Products evaluated on first request (see cached())
+        self._products = {}
+        self._lock = threading.RLock()
+
+    def cached(self, name, compute):
+        """
+        Obtain product name of this matrix, computed with compute() on first request only
+        """
+        if name not in self._products:
+            with self._lock:
+                if name not in self._products:
+                    self._products[name] = compute()
+        return self._products[name]
+
+    @classmethod
+    def from_overview(cls, commissions_overview_df):
+        """
+        Build matrix out of 'vaste leden' (and 'commissie.id') of an overview of the commissions
+        """
+        commission_ids = commissions_overview_df['commissie.id'] if 'commissie.id' in commissions_overview_df.columns else None
+        return cls(commissions_overview_df['vaste leden'], commission_ids)
+
+    def __len__(self):
+        return len(self.member_names)
+
+    def commissions_per_member(self):
+        """
+        Obtain Series (indexed by member name) with the amount of commissions each member is a permanent member of
+        """
+        return self.cached('commissions_per_member', lambda: pd.Series(
+            np.asarray(self.matrix.sum(axis=1)).ravel().astype(np.int64), index=self.member_names))
+
+
+# Matrices built by membership_of(), by composition (bounded: a handful of compositions per data version)
+_matrices = {}
+_matrices_lock = threading.Lock()
+max_matrices = 64
+
+
+def composition_key(commissions_overview_df):
+    """
+    Obtain hashable key of the composition of an overview: the id and the permanent members of each commission
+    """
+    commission_ids = (commissions_overview_df['commissie.id'].tolist() if 'commissie.id' in commissions_overview_df.columns
+                      else list(range(len(commissions_overview_df))))
+    return tuple(zip(commission_ids, (tuple(members) if isinstance(members, (list, tuple, set)) else ()
+                                      for members in commissions_overview_df['vaste leden'])))
+
+
+def membership_of(commissions_overview_df):
+    """
+    Obtain the MembershipMatrix of an overview of the commissions, built once per composition and shared by all callers
+    """
+    key = composition_key(commissions_overview_df)
+    membership = _matrices.get(key)
+    if membership is None:
+        membership = MembershipMatrix.from_overview(commissions_overview_df)
+        with _matrices_lock:
+            if len(_matrices) >= max_matrices:
+                _matrices.clear()
+            membership = _matrices.setdefault(key, membership)
+    return membership
+
+
+def snapshot_on(snapshots, snapshot_date):
+    """
+    Obtain the snapshot in effect on snapshot_date out of snapshots ({date: overview}, sorted by date): the most recent
+    one on or before snapshot_date (None if there is none)
+    """
+    dates = list(snapshots.keys())
+    position = bisect.bisect_right(dates, pd.Timestamp(snapshot_date).date())
+    return snapshots[dates[position - 1]] if position > 0 else None
@@ -0,0 +1,193 @@
+"""
+Memoization of the results of the dash callbacks (e.g. filter_data() of each tab).
+
+Most visitors select one of a handful of views (e.g. the default "Alle commissies" over the full period),
+so the same filtering and statistics are computed over and over again. memoize() stores the result of
+a function for each combination of (normalized) inputs in a bounded LRU cache:
+
+    * the key consists of the name of the function, its normalized inputs (e.g. dates as 'YYYY-MM-DD',
+      whatever the format sent by the date picker) and the version of the data (see attendance_data.data_version()).
+      When the update script rewrites the data, the version changes: old results are no longer used,
+      and are evicted as the least recently used ones.
+    * the version of the data is combined with the version of the application (see app_version), so results stored
+      in the shared cache by a previous deploy (e.g. with other tables or figures) are not served after a restart
+    * the amount of results kept is bounded (environment variable ATTENDANCE_RESULT_CACHE_SIZE, default 256)
+    * hits and misses are counted for each cache (see stats())
+    * optionally (shared=True), results are also stored in the cache shared by all workers (see shared_cache.py):
+      a result missing in the cache of this worker is looked up there before computing it
+"""
+import functools
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import shared_cache as shared_cache_module
+
+
+default_max_size = int(os.environ.get("ATTENDANCE_RESULT_CACHE_SIZE", 256))
+
+
+def compute_app_version():
+    """
+    Compute version of the application: environment variable ATTENDANCE_APP_VERSION if set,
+    otherwise hash of the source files (.py) of the dash folder
+    """
+    if os.environ.get("ATTENDANCE_APP_VERSION"):
+        return os.environ["ATTENDANCE_APP_VERSION"]
+    version = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        with open(path, "rb") as source_file:
+            version.update(os.path.basename(path).encode() + b":" + source_file.read())
+    return version.hexdigest()[:12]
+
+
+app_version = compute_app_version()
+
+
+def cache_version(data_version):
+    """
+    Version under which results are cached: version of the data combined with the version of the application
+    """
+    return f"{data_version}-{app_version}"
+
+# All caches created by memoize(), by name (e.g. to report their statistics)
+caches = {}
+
+# Cache shared by all workers (None if disabled), created on first use
+_shared = {}
+
+
+def get_shared_cache():
+    """
+    Return the cache shared by all workers (see shared_cache.py), or None if disabled
+    """
+    if "cache" not in _shared:
+        _shared["cache"] = shared_cache_module.create_shared_cache()
+        _shared["version"] = None
+    return _shared["cache"]
+
+
+class LRUCache:
+    """
+    Thread safe dict with a maximum amount of items: when full, the least recently used item is removed
+    """
+    def __init__(self, max_size=default_max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.items), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+def normalize_date(value):
+    """
+    Normalize date (e.g. '2023-01-05', '2023-01-05T00:00:00' or a date object) to 'YYYY-MM-DD'
+    """
+    return None if value is None else pd.to_datetime(value).date().isoformat()
+
+
+def normalize_value(value):
+    """
+    Normalize other inputs (e.g. values of dropdowns) into something hashable
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_value(item) for item in value)
+    return value
+
+
+def normalize_selection(start_date, end_date, *values):
+    """
+    Normalize the selection of a tab: date range of the date picker, followed by the values of other inputs
+    """
+    return (normalize_date(start_date), normalize_date(end_date)) + tuple(normalize_value(value) for value in values)
+
+
+def normalize_callback_selection(set_progress, value, start_date, end_date):
+    """
+    Normalize the inputs of update_display() of the attendance tabs (set_progress is not part of the selection)
+    """
+    return normalize_selection(start_date, end_date, value)
+
+
+def memoize(normalize=None, version=None, copy_result=None, max_size=default_max_size, shared=False):
+    """
+    Decorator storing the results of a function in an LRUCache.
+
+    normalize:   function(*args) returning the normalized inputs (default: normalize_value() of each argument)
+    version:     function returning the current version of the data (e.g. attendance_data.data_version)
+    copy_result: function applied to the result before returning it (e.g. to return a copy of a dataframe
+                 the caller modifies, so the cached result remains untouched)
+    shared:      also store results in the cache shared by all workers (results must be picklable)
+    """
+    def decorator(function):
+        cache = LRUCache(max_size)
+        name = f"{function.__module__}.{function.__qualname__}"
+        caches[name] = cache
+
+        @functools.wraps(function)
+        def memoized(*args):
+            inputs = normalize(*args) if normalize is not None else tuple(normalize_value(arg) for arg in args)
+            data_version = cache_version(version()) if version is not None else None
+            key = (name, inputs, data_version)
+            result = cache.get(key, _missing)
+            if result is _missing:
+                shared_cache = get_shared_cache() if shared else None
+                if shared_cache is not None:
+                    if data_version is not None and data_version != _shared["version"]:
+                        # Version not seen by this process yet: if it is the newest version, results of previous
+                        # versions are no longer needed (see SharedCache.discard_older_versions())
+                        shared_cache.discard_older_versions(data_version)
+                        _shared["version"] = data_version
+                    result = shared_cache.get(key, _missing)
+                if result is _missing:
+                    result = function(*args)
+                    if shared_cache is not None:
+                        shared_cache.set(key, result, data_version)
+                cache.set(key, result)
+            return copy_result(result) if copy_result is not None else result
+
+        memoized.cache = cache
+        return memoized
+    return decorator
+
+
+# Marker of a missing result (None can be a valid result)
+_missing = object()
+
+
+def stats():
+    """
+    Return statistics (size, hits, misses) of all caches
+    """
+    statistics = {name: cache.stats() for name, cache in caches.items()}
+    if _shared.get("cache") is not None:
+        statistics["shared"] = _shared["cache"].stats()
+    return statistics
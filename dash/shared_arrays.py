@@ -0,0 +1,195 @@
+"""
+Read-only data arrays shared by all gunicorn workers through memory-mapped files.
+
+Even when each dataset is loaded only once per process (see attendance_data.py), each of the 7 workers holds a
+private copy of it. Forking after loading (gunicorn --preload) does not help much: the reference counts of Python
+objects are updated on every access, which copies the memory pages they are on (copy-on-write).
+
+Here, the numeric arrays (e.g. the fact table and the prefix-sum index of the attendance) are written once per data
+version as .npy files, and every worker memory-maps them (np.load(..., mmap_mode='r')). The pages are then part
+of the page cache of the operating system, shared by all workers, and only loaded from disk when used. The memory
+maps are read-only: modifying them raises a ValueError.
+
+    <ATTENDANCE_SHARED_ARRAYS_DIR>/<data version>/<name>/<array>.npy
+
+The first worker to need a version writes it (in a temporary folder, renamed when complete), the others use the
+files written by that worker. When a new version is written, the folders of versions last modified before the data
+on disk was (i.e. of previous data) are removed. A worker that still sees a previous version (the data is checked at
+most every ATTENDANCE_DATA_CHECK_INTERVAL seconds) hence never removes the folder of the current version.
+
+memory_usage() and report() (python shared_arrays.py [pid ...]) show the memory of each worker that is unique
+to it and that is shared with other processes (from /proc/<pid>/smaps_rollup, Linux only).
+
+Enable / configure through environment variables:
+    ATTENDANCE_SHARED_ARRAYS=0              disable (each worker holds its own copy, default: 1)
+    ATTENDANCE_SHARED_ARRAYS_DIR=<folder>   location of the files (default: ../data/shared_arrays)
+"""
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+shared_arrays_enabled = os.environ.get("ATTENDANCE_SHARED_ARRAYS", "1") == "1"
+shared_arrays_dir = os.environ.get("ATTENDANCE_SHARED_ARRAYS_DIR", "../data/shared_arrays")
+
+
+def _file_name(key):
+    # Keys can contain "/" (e.g. '<commission id>/cumulative', see attendance_index.py)
+    return key.replace("/", "~") + ".npy"
+
+
+def _write_arrays(folder, arrays, meta):
+    """
+    Write arrays (and meta information) into folder, atomically: written to a temporary folder first, which
+    is renamed when complete. If another process wrote the folder in the meantime, its files are used.
+    """
+    temporary_folder = f"{folder}.tmp-{os.getpid()}"
+    os.makedirs(temporary_folder, exist_ok=True)
+    for key, array in arrays.items():
+        np.save(os.path.join(temporary_folder, _file_name(key)), np.ascontiguousarray(array), allow_pickle=False)
+    with open(os.path.join(temporary_folder, "meta.json"), "w") as file:
+        json.dump(dict(meta, keys=list(arrays.keys())), file)
+    try:
+        os.rename(temporary_folder, folder)
+    except OSError:
+        shutil.rmtree(temporary_folder, ignore_errors=True)
+        if not os.path.exists(os.path.join(folder, "meta.json")):
+            # Not written by another process either (e.g. the folder of the version was removed meanwhile)
+            raise
+        # Folder already written by another process
+
+
+def _remove_previous_versions(version, data_modified):
+    """
+    Remove the folders of other versions than version that were last modified before data_modified (seconds since
+    the epoch), i.e. written out of data that has been replaced since
+    """
+    for folder_name in os.listdir(shared_arrays_dir):
+        folder = os.path.join(shared_arrays_dir, folder_name)
+        try:
+            outdated = folder_name != str(version) and os.stat(folder).st_mtime < data_modified
+        except FileNotFoundError:
+            continue
+        if outdated:
+            # Workers still using the files keep their memory maps (the files are only removed once unmapped)
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+def load_or_create(name, version, build, data_modified=None):
+    """
+    Return the arrays of name (dict {key: array}) for data version as read-only memory maps.
+    If not written yet, build() is called to obtain them (dict {key: numpy array of a numeric, boolean or
+    datetime dtype}) and they are written first. Also returns the meta information stored with them.
+    data_modified: time (seconds since the epoch) the data on disk was last modified. When given, the folders of
+    versions written before it are removed once this version is created.
+    """
+    version_folder = os.path.join(shared_arrays_dir, str(version))
+    folder = os.path.join(version_folder, name)
+    if not os.path.exists(os.path.join(folder, "meta.json")):
+        if not os.path.exists(version_folder):
+            os.makedirs(version_folder, exist_ok=True)
+            if data_modified is not None:
+                _remove_previous_versions(version, data_modified)
+        arrays, meta = build()
+        _write_arrays(folder, arrays, meta)
+
+    with open(os.path.join(folder, "meta.json")) as file:
+        meta = json.load(file)
+    arrays = {key: np.load(os.path.join(folder, _file_name(key)), mmap_mode='r') for key in meta["keys"]}
+    return arrays, meta
+
+
+def frame_to_arrays(df):
+    """
+    Split df with numeric, boolean, datetime and categorical columns into arrays and meta information
+    (categorical columns are stored as codes, their categories as meta information)
+    """
+    arrays, columns = {}, []
+    for column_name in df.columns:
+        values = df[column_name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            arrays[column_name] = values.cat.codes.to_numpy()
+            columns.append({"name": column_name, "categories": values.cat.categories.tolist()})
+        else:
+            arrays[column_name] = values.to_numpy()
+            columns.append({"name": column_name})
+    return arrays, {"columns": columns}
+
+
+def frame_from_arrays(arrays, meta):
+    """
+    Rebuild dataframe out of frame_to_arrays(), using the (memory-mapped) arrays without copying them
+    """
+    columns = {}
+    for column in meta["columns"]:
+        values = arrays[column["name"]]
+        if "categories" in column:
+            values = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(column["categories"]))
+        columns[column["name"]] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+def shared_frame(name, version, load, data_modified=None):
+    """
+    Return dataframe name of data version, backed by memory-mapped arrays (load() returns the dataframe,
+    only called if not written yet). See load_or_create() for data_modified.
+    """
+    arrays, meta = load_or_create(name, version, lambda: frame_to_arrays(load()), data_modified)
+    return frame_from_arrays(arrays, meta)
+
+
+def memory_usage(pid=None):
+    """
+    Obtain memory (MB) of process pid (default: this process): resident ('Rss'), proportional share ('Pss'),
+    unique to the process ('Private') and shared with other processes ('Shared')
+    """
+    values = {}
+    with open(f"/proc/{pid or os.getpid()}/smaps_rollup") as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {"Rss": values.get("Rss", 0.0),
+            "Pss": values.get("Pss", 0.0),
+            "Private": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+            "Shared": values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0)}
+
+
+def find_worker_pids(application="attendance_integrated"):
+    """
+    Obtain pids of the processes running application (e.g. the gunicorn master and its workers)
+    """
+    pids = []
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as file:
+                cmdline = file.read().replace(b"\0", b" ").decode(errors="replace")
+        except OSError:
+            continue
+        if application in cmdline and int(pid) != os.getpid():
+            pids.append(int(pid))
+    return sorted(pids)
+
+
+def report(pids=None):
+    """
+    Print unique and shared memory of each worker (default: all processes running attendance_integrated)
+    """
+    pids = pids or find_worker_pids()
+    print(f"{'pid':>8}{'rss (MB)':>12}{'unique (MB)':>14}{'shared (MB)':>14}{'pss (MB)':>12}")
+    totals = {"Rss": 0.0, "Private": 0.0, "Shared": 0.0, "Pss": 0.0}
+    for pid in pids:
+        usage = memory_usage(pid)
+        for key in totals:
+            totals[key] += usage[key]
+        print(f"{pid:>8}{usage['Rss']:>12.1f}{usage['Private']:>14.1f}{usage['Shared']:>14.1f}{usage['Pss']:>12.1f}")
+    # The sum of the proportional shares (pss) is the actual memory used by all processes together
+    print(f"{'total':>8}{totals['Rss']:>12.1f}{totals['Private']:>14.1f}{totals['Shared']:>14.1f}{totals['Pss']:>12.1f}")
+
+
+if __name__ == '__main__':
+    report([int(pid) for pid in sys.argv[1:]])
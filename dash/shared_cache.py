@@ -0,0 +1,236 @@
+"""
+Result cache shared by all processes of the dash application (e.g. the 7 gunicorn workers).
+
+The in-process cache of result_cache.py is duplicated (and warmed) in each worker. SharedCache stores results
+in a single SQLite database on disk instead, which every worker reads from and writes to, so each result
+(e.g. the outputs of a callback: tables and figures) is computed once per data version for the whole server.
+No external service is needed: SQLite is part of the standard library.
+
+    * values are pickled and written in a single transaction, so other processes never read a partially
+      written value (the database runs in WAL mode: readers do not block the writer and vice versa)
+    * the total size of the stored values is bounded: when exceeded, the least recently used values are removed
+    * each version (of the data and the application) is registered with the time it was first seen; when a new
+      version is first seen, the values of versions first seen before it are removed. A process that still sees an
+      older version (e.g. a worker that did not notice the new data yet, or a worker of the previous deploy) does not
+      remove the values of newer versions.
+    * a task (e.g. the warm-up, see warm_up.py) can be claimed for a data version, so only one process performs it
+      while the others wait for it to be done (claim(), release(), is_done())
+    * each process can store a snapshot of its own metrics (see callback_metrics.py), so the metrics of all processes
+      can be aggregated by whichever process answers /metrics (put_worker_metrics(), worker_metrics())
+
+Configure through environment variables:
+    ATTENDANCE_SHARED_CACHE_PATH=<file>    location of the database (default: ../data/result_cache.sqlite,
+                                           empty to disable the shared cache)
+    ATTENDANCE_SHARED_CACHE_SIZE_MB=<MB>   maximum total size of the stored values (default: 256)
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+
+shared_cache_path = os.environ.get("ATTENDANCE_SHARED_CACHE_PATH", "../data/result_cache.sqlite")
+shared_cache_size = int(float(os.environ.get("ATTENDANCE_SHARED_CACHE_SIZE_MB", 256)) * 1024 * 1024)
+
+
+class SharedCache:
+    """
+    Process safe key-value store in a SQLite database, with size-based eviction of the least recently used values
+    """
+    def __init__(self, path=shared_cache_path, max_size=shared_cache_size):
+        self.path = path
+        self.max_size = max_size
+        self.local = threading.local()  # one connection per thread (and per process, see connection())
+        self.hits = 0
+        self.misses = 0
+        with self.connection() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                                      key TEXT PRIMARY KEY,
+                                      version TEXT,
+                                      value BLOB,
+                                      size INTEGER,
+                                      accessed REAL)""")
+            connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            connection.execute("""CREATE TABLE IF NOT EXISTS versions (
+                                      version TEXT PRIMARY KEY,
+                                      created REAL)""")
+            connection.execute("""CREATE TABLE IF NOT EXISTS claims (
+                                      name TEXT PRIMARY KEY,
+                                      version TEXT,
+                                      pid INTEGER,
+                                      claimed REAL,
+                                      done INTEGER)""")
+            connection.execute("""CREATE TABLE IF NOT EXISTS worker_metrics (
+                                      pid INTEGER PRIMARY KEY,
+                                      updated REAL,
+                                      value BLOB)""")
+
+    def connection(self):
+        """
+        Obtain connection of current thread (a new one after a fork, connections can not be shared between processes)
+        """
+        if getattr(self.local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    @staticmethod
+    def hash_key(key):
+        """
+        Turn key (e.g. tuple of function name, normalized inputs and data version) into a fixed length string
+        """
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def get(self, key, default=None):
+        key = self.hash_key(key)
+        connection = self.connection()
+        row = connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        connection.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value, version=None):
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(value) > self.max_size:
+            return
+        connection = self.connection()
+        # Write and evict in one transaction
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("INSERT OR REPLACE INTO results (key, version, value, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                               (self.hash_key(key), None if version is None else str(version), value, len(value), time.time()))
+            self.evict(connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def evict(self, connection):
+        """
+        Remove least recently used values until the total size is below max_size
+        """
+        total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        removed_size = 0
+        keys = []
+        for key, size in connection.execute("SELECT key, size FROM results ORDER BY accessed"):
+            if total_size - removed_size <= self.max_size:
+                break
+            keys.append(key)
+            removed_size += size
+        connection.executemany("DELETE FROM results WHERE key = ?", [(key,) for key in keys])
+
+    def discard_older_versions(self, version):
+        """
+        Register version (if not registered yet) and, if it is the newest registered version, remove the values of the
+        versions registered before it (e.g. after the data has been updated). Values of unregistered versions are removed too.
+        Registered versions are kept (one small row per version), so a version seen again later is never taken for a new one.
+        """
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("INSERT OR IGNORE INTO versions (version, created) VALUES (?, ?)", (str(version), time.time()))
+            newest = connection.execute("SELECT version FROM versions ORDER BY created DESC LIMIT 1").fetchone()[0]
+            if newest == str(version):
+                connection.execute("DELETE FROM results WHERE version IS NOT NULL AND version != ?", (newest,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def claim(self, name, version, stale_after=600):
+        """
+        Claim task name (e.g. "warm_up") for data version. Returns True if this process obtained the claim, i.e. the task
+        was not claimed yet for this version, or its claim is stale (not done after stale_after seconds, e.g. the
+        process that claimed it died). Claims of other versions are replaced.
+        """
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM claims WHERE name = ? AND (version != ? OR (done = 0 AND claimed < ?))",
+                               (name, str(version), time.time() - stale_after))
+            cursor = connection.execute("INSERT OR IGNORE INTO claims (name, version, pid, claimed, done) VALUES (?, ?, ?, ?, 0)",
+                                        (name, str(version), os.getpid(), time.time()))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def release(self, name, version, done=True):
+        """
+        Mark the claimed task name for data version as done (or, if not done, remove the claim so another process can claim it)
+        """
+        if done:
+            self.connection().execute("UPDATE claims SET done = 1 WHERE name = ? AND version = ?", (name, str(version)))
+        else:
+            self.connection().execute("DELETE FROM claims WHERE name = ? AND version = ? AND pid = ?", (name, str(version), os.getpid()))
+
+    def is_done(self, name, version):
+        row = self.connection().execute("SELECT done FROM claims WHERE name = ? AND version = ?", (name, str(version))).fetchone()
+        return row is not None and row[0] == 1
+
+    def put_worker_metrics(self, value, pid=None):
+        """
+        Store (replace) the metrics snapshot of process pid (default: this process)
+        """
+        self.connection().execute("INSERT OR REPLACE INTO worker_metrics (pid, updated, value) VALUES (?, ?, ?)",
+                                  (pid or os.getpid(), time.time(),
+                                   pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def worker_metrics(self):
+        """
+        Obtain the stored metrics snapshots: {pid: snapshot}
+        """
+        return {pid: pickle.loads(value)
+                for pid, value in self.connection().execute("SELECT pid, value FROM worker_metrics")}
+
+    def retire_worker_metrics(self, is_alive, merge, retired_pid=0):
+        """
+        Merge the snapshots of processes that stopped (is_alive(pid) is False) into the snapshot of retired_pid,
+        with merge(snapshots), in a single transaction (so their counts are kept, and added only once)
+        """
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            snapshots = {pid: pickle.loads(value)
+                         for pid, value in connection.execute("SELECT pid, value FROM worker_metrics")}
+            stopped = [pid for pid in snapshots if pid != retired_pid and not is_alive(pid)]
+            if stopped:
+                retired = merge([snapshots[pid] for pid in stopped + [retired_pid] if pid in snapshots])
+                connection.executemany("DELETE FROM worker_metrics WHERE pid = ?", [(pid,) for pid in stopped])
+                connection.execute("INSERT OR REPLACE INTO worker_metrics (pid, updated, value) VALUES (?, ?, ?)",
+                                   (retired_pid, time.time(), pickle.dumps(retired, protocol=pickle.HIGHEST_PROTOCOL)))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        self.connection().execute("DELETE FROM results")
+
+    def stats(self):
+        amount, size = self.connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"size": amount, "bytes": size, "max_bytes": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+def create_shared_cache():
+    """
+    Create the shared cache, or return None if disabled (or if the database can not be opened)
+    """
+    if not shared_cache_path:
+        return None
+    try:
+        return SharedCache(shared_cache_path, shared_cache_size)
+    except sqlite3.Error as error:
+        print(f"Shared result cache not available ({error}). Using in-process cache only.")
+        return None
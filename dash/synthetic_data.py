@@ -0,0 +1,310 @@
+"""
+Generator of synthetic parliament data, to test how the dash application behaves with more data than the single
+legislature that is shipped (e.g. 5 legislatures, 50 commissions or 10x more meetings).
+
+generate_synthetic_data() produces the same datasets as the extraction scripts (see code folder), with the exact
+same schemas:
+
+    parlementsleden_all_dict          {id: [name, party]}                                       (parlementsleden.pkl)
+    fracties_dict                     {party: [[name, id], ...]}                                (fracties.pkl)
+    commissions_overview_df           a row per commission, lists of members per function       (commissions_overview_df.pkl)
+    meetings_all_commissions_df       a row per meeting ('Vergadering <id>'), lists of          (meetings_all_commissions_df.pkl)
+                                      {'Naam', 'id', 'Fractie'} dicts per attendance status
+    details_questions_term_df         a row per written question                                (details_questions_term_df.pkl)
+    membership_intervals              periods in which members are permanent members of each    (membership_intervals.pkl)
+                                      commission (the composition of the overview, throughout)
+
+The data is parameterized by the amount of members, parties, commissions, meetings per week, years and the
+attendance rates, and is reproducible: the same seed gives the same data. save_synthetic_data() writes it (with the
+fact table, the monthly cube and the Parquet files, as the update script does) to a folder the dash application
+can use through ATTENDANCE_DATA_DIR:
+
+    python synthetic_data.py <folder> [--members 124] [--parties 8] [--commissions 24] [--meetings-per-week 6]
+                                      [--years 5] [--present 0.7] [--absent 0.15] [--seed 0] ...
+    cd dash && ATTENDANCE_DATA_DIR=<folder> python attendance_integrated.py
+"""
+import argparse
+import datetime
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+import attendance_cube
+import attendance_facts
+import columnar_data
+import member_registry
+import membership_intervals
+
+
+first_names = ['Jan', 'Els', 'Koen', 'An', 'Bart', 'Inge', 'Peter', 'Sofie', 'Wim', 'Katrien', 'Tom', 'Griet', 'Kris',
+               'Liesbeth', 'Dirk', 'Nathalie', 'Stijn', 'Veerle', 'Joris', 'Hilde', 'Pieter', 'Annick', 'Jos', 'Freya',
+               'Maarten', 'Tinne', 'Filip', 'Mieke', 'Wouter', 'Katia', 'Robrecht', 'Loes', 'Arnout', 'Karin', 'Andries',
+               'Lies', 'Hannes', 'Ilse', 'Chris', 'Manuela', 'Axel', 'Nadia', 'Björn', 'Elke', 'Steven', 'Vera']
+last_names = ['Peeters', 'Janssens', 'Maes', 'Jacobs', 'Mertens', 'Willems', 'Claes', 'Goossens', 'Wouters', 'De Smet',
+              'Dubois', 'Hermans', 'Aerts', 'Pauwels', 'Vermeulen', 'Van Damme', 'Verhoeven', 'Coppens', 'De Clercq',
+              'Vandenberghe', 'Michiels', 'Van Dijck', 'Lambrechts', 'Daniëls', 'De Coninck', 'Segers', 'Rombouts',
+              'Van de Velde', 'Stevens', "D'Haese", 'Vandaele', 'Moerenhout', 'De Roo', 'Bothuyne', 'Vanlouwe',
+              'Sminate', 'Gryffroy', 'Van Rompuy', 'Tommelein', 'Vanhecke', 'De Ridder', 'Robeyns']
+party_names = ['N-VA', 'Vlaams Belang', 'cd&v', 'Open Vld', 'Vooruit', 'Groen', 'PVDA', 'Onafhankelijke']
+commission_topics = ['Algemeen Beleid, Financiën en Begroting', 'Binnenlands Bestuur en Gelijke Kansen', 'Brussel en de Vlaamse Rand',
+                     'Buitenlands Beleid en Europese Aangelegenheden', 'Cultuur, Jeugd, Sport en Media',
+                     'Economie, Werk en Innovatie', 'Landbouw, Visserij en Plattelandsbeleid', 'Leefmilieu en Natuur',
+                     'Mobiliteit en Openbare Werken', 'Onderwijs', 'Welzijn, Volksgezondheid en Gezin',
+                     'Wonen en Onroerend Erfgoed', 'Reglement en Samenwerking', 'Justitie', 'Energie en Klimaat',
+                     'Dierenwelzijn', 'Toerisme', 'Ruimtelijke Ordening', 'Armoedebestrijding', 'Inburgering']
+ministers = ['Jan Jambon', 'Hilde Crevits', 'Bart Somers', 'Ben Weyts', 'Zuhal Demir', 'Wouter Beke',
+             'Matthias Diependaele', 'Lydia Peeters', 'Benjamin Dalle', 'Jo Brouns', 'Gwendolyn Rutten']
+themes = ['Onderwijs en Vorming', 'Cultuur', 'Wonen', 'Werk', 'Mobiliteit en Openbare Werken', 'Welzijn', 'Gezondheid',
+          'Energie', 'Leefmilieu', 'Economie', 'Binnenlandse Aangelegenheden', 'Media', 'Sport', 'Justitie']
+
+
+def generate_members(random_generator, amount_members=124, amount_parties=8, first_member_id=1000):
+    """
+    Obtain members of parliament and their party: (parlementsleden_all_dict, fracties_dict).
+    Parties have different sizes (the first parties are the largest).
+    """
+    parties = [party_names[i] if i < len(party_names) else f'Partij {i + 1}' for i in range(amount_parties)]
+    party_sizes = np.sort(random_generator.gamma(2.0, size=amount_parties))[::-1] + 0.2
+    member_parties = random_generator.choice(amount_parties, size=amount_members, p=party_sizes / party_sizes.sum())
+
+    names = [f'{first_name} {last_name}' for last_name in last_names for first_name in first_names]
+    random_generator.shuffle(names)
+    # More members than combinations of names: add a number
+    names = [names[i % len(names)] + (f' {i // len(names) + 1}' if i >= len(names) else '') for i in range(amount_members)]
+
+    member_ids = first_member_id + np.sort(random_generator.choice(amount_members * 40, size=amount_members, replace=False))
+    parlementsleden_all_dict = {int(member_id): [name, parties[party]]
+                                for member_id, name, party in zip(member_ids, names, member_parties)}
+    # Members of each party sorted by name (as on the website of the parliament)
+    fracties_dict = {party: sorted([[name, member_id] for member_id, (name, member_party) in parlementsleden_all_dict.items()
+                                    if member_party == party]) for party in parties}
+    return parlementsleden_all_dict, fracties_dict
+
+
+def generate_commissions(random_generator, parlementsleden_all_dict, amount_commissions=24, commission_size=16,
+                         first_commission_id=1330000):
+    """
+    Obtain overview of the commissions (in the format of commissions_overview_df, 'aantal vergaderingen' still 0).
+    Permanent members are drawn proportional to the size of their party.
+    """
+    names = [values[0] for values in parlementsleden_all_dict.values()]
+    commission_ids = first_commission_id + np.sort(random_generator.choice(amount_commissions * 50, size=amount_commissions, replace=False))
+    rows = []
+    for i, commission_id in enumerate(commission_ids.tolist()):
+        topic = commission_topics[i % len(commission_topics)]
+        title = f'Commissie voor {topic}' + (f' {i // len(commission_topics) + 1}' if i >= len(commission_topics) else '')
+        size = min(commission_size, len(names))
+        permanent_members = random_generator.choice(names, size=size, replace=False).tolist()
+        others = [name for name in names if name not in set(permanent_members)]
+        substitutes = random_generator.choice(others, size=min(size - 1, len(others)), replace=False).tolist() if others else []
+        added_members = [name for name in others if name not in set(substitutes)][:int(random_generator.integers(0, 2))]
+        rows.append({
+            'commissie.id': commission_id,
+            'commissie.titel': title,
+            'commissie.link': [{'href': f'https://ws.vlpar.be/e/opendata/comm/{commission_id}{{?datum}}', 'rel': 'self',
+                                'templated': True, 'variableNames': ['datum'],
+                                'variables': [{'description': '', 'name': 'datum', 'type': 'REQUEST_PARAM'}]}],
+            'voorzitter': permanent_members[:1],
+            'eerste ondervoorzitter': permanent_members[1:2],
+            'tweede ondervoorzitter': permanent_members[2:3],
+            'derde ondervoorzitter': [],
+            'vierde ondervoorzitter': None,
+            'vaste leden': permanent_members,
+            'plaatsvervangende leden': substitutes or None,
+            'toegevoegde leden': added_members or None,
+            'aantal vergaderingen': 0,
+        })
+    commissions_overview_df = pd.DataFrame(rows)
+    # Counters and averages are filled by the dash application (see attendance_statistics.py)
+    for column_name in ['aanwezig_count_alle', 'afwezig_count_alle', 'verontschuldigd_count_alle',
+                        'aanwezig_count_vaste', 'afwezig_count_vaste', 'verontschuldigd_count_vaste']:
+        commissions_overview_df[column_name] = ''
+    for column_name in ['Gemiddelde aantal aanwezig alle leden', 'Gemiddelde aantal afwezig alle leden',
+                        'Gemiddelde aantal verontschuldigd alle leden', 'Gemiddelde aantal aanwezig vaste leden',
+                        'Gemiddelde aantal afwezig vaste leden', 'Gemiddelde aantal verontschuldigd vaste leden']:
+        commissions_overview_df[column_name] = np.nan
+    return commissions_overview_df
+
+
+def meeting_dates(random_generator, start_date, years, meetings_per_week):
+    """
+    Obtain sorted dates of the meetings: Poisson amount of meetings each week (mostly on Tuesday up to Thursday),
+    no meetings during the summer recess (mid July up to August) and the Christmas holidays
+    """
+    weekday_weights = np.array([0.03, 0.3, 0.23, 0.4, 0.04])
+    dates = []
+    week_start = start_date - datetime.timedelta(days=start_date.weekday())
+    end_date = start_date + datetime.timedelta(days=int(365.25 * years))
+    while week_start < end_date:
+        recess = (week_start.month == 7 and week_start.day > 14) or week_start.month == 8 or \
+                 (week_start.month == 12 and week_start.day > 22)
+        if not recess:
+            weekdays = random_generator.choice(5, size=random_generator.poisson(meetings_per_week), p=weekday_weights)
+            dates += [week_start + datetime.timedelta(days=int(weekday)) for weekday in weekdays]
+        week_start += datetime.timedelta(days=7)
+    return sorted(date for date in dates if start_date <= date < end_date)
+
+
+def generate_meetings(random_generator, commissions_overview_df, parlementsleden_all_dict, start_date, years=5,
+                      meetings_per_week=6.0, present_rate=0.7, absent_rate=0.15, substitute_rate=0.3,
+                      first_meeting_id=1600000):
+    """
+    Obtain meetings (in the format of meetings_all_commissions_df) and set 'aantal vergaderingen' of the overview.
+
+    Each permanent member of the commission is present, absent or excused (with a rate varying per member around
+    present_rate / absent_rate, the remainder is excused). For each permanent member not present, a substitute
+    (or added member) is present with probability substitute_rate.
+    """
+    name_to_member = {values[0]: {'Naam': values[0], 'id': member_id, 'Fractie': values[1]}
+                      for member_id, values in parlementsleden_all_dict.items()}
+    # Attendance rates of each member: (present, absent, excused)
+    member_rates = {}
+    for name in name_to_member:
+        present = float(np.clip(random_generator.normal(present_rate, 0.1), 0.05, 0.99))
+        absent = (1 - present) * absent_rate / max(1 - present_rate, 1e-9)
+        member_rates[name] = np.clip([present, absent, 1 - present - absent], 0, None)
+    # Some commissions meet (much) more often than others
+    commission_weights = random_generator.gamma(1.0, size=len(commissions_overview_df))
+
+    dates = meeting_dates(random_generator, start_date, years, meetings_per_week)
+    commissions = random_generator.choice(len(commissions_overview_df), size=len(dates), p=commission_weights / commission_weights.sum())
+    meeting_ids = first_meeting_id + np.cumsum(random_generator.integers(1, 40, size=len(dates)))
+
+    rows, index = [], []
+    for meeting_id, date, commission in zip(meeting_ids.tolist(), dates, commissions.tolist()):
+        overview_row = commissions_overview_df.iloc[commission]
+        attendance = {status: [] for status in attendance_facts.STATUSES}
+        for name in overview_row['vaste leden']:
+            rates = member_rates[name]
+            status = attendance_facts.STATUSES[random_generator.choice(3, p=rates / rates.sum())]
+            attendance[status].append(name_to_member[name])
+        # Substitutes for the permanent members that are not present
+        candidates = (overview_row['plaatsvervangende leden'] or []) + (overview_row['toegevoegde leden'] or [])
+        amount_not_present = len(overview_row['vaste leden']) - len(attendance['AANWEZIG'])
+        amount_substitutes = min(random_generator.binomial(amount_not_present, substitute_rate), len(candidates))
+        if amount_substitutes:
+            for name in random_generator.choice(candidates, size=amount_substitutes, replace=False).tolist():
+                attendance['AANWEZIG'].append(name_to_member[name])
+        attendance['AANWEZIG'].sort(key=lambda member: member['Naam'])
+        # As in the data of the scripts, the permanent members are the (ordered) subsequence of the permanent members of each list
+        permanent_names = set(overview_row['vaste leden'])
+        attendance_permanent = {status: [member for member in members if member['Naam'] in permanent_names]
+                                for status, members in attendance.items()}
+
+        row = {'Datum vergadering': date}
+        # Empty lists of all members are missing values (NaN), as in the data of the API
+        row.update({status: members if members or status == 'AANWEZIG' else np.nan for status, members in attendance.items()})
+        row.update({f'{status}_vast': members for status, members in attendance_permanent.items()})
+        row['commissie.titel'] = overview_row['commissie.titel']
+        for status, members in attendance.items():
+            row[f'Aantal {status.lower()} alle leden'] = float(len(members))
+        for status, members in attendance_permanent.items():
+            row[f'Aantal {status.lower()} vaste leden'] = float(len(members))
+        rows.append(row)
+        index.append(f'Vergadering {meeting_id}')
+
+    meetings_all_commissions_df = pd.DataFrame(rows, index=index)
+    counts = meetings_all_commissions_df['commissie.titel'].value_counts()
+    commissions_overview_df['aantal vergaderingen'] = commissions_overview_df['commissie.titel'].map(counts).fillna(0).astype(int).astype(object)
+    return meetings_all_commissions_df
+
+
+def generate_written_questions(random_generator, parlementsleden_all_dict, start_date, years=5,
+                               questions_per_member_per_year=40, first_question_id=1000000):
+    """
+    Obtain written questions (in the format of details_questions_term_df). The amount of questions differs
+    (strongly) per member, the answer takes mostly a few weeks.
+    """
+    members = list(parlementsleden_all_dict.values())
+    member_weights = random_generator.pareto(1.5, size=len(members)) + 0.1
+    amount_questions = int(questions_per_member_per_year * len(members) * years)
+    askers = random_generator.choice(len(members), size=amount_questions, p=member_weights / member_weights.sum())
+    asked = pd.Timestamp(start_date) + pd.to_timedelta(random_generator.integers(0, int(365.25 * years), size=amount_questions), unit='D')
+    answered = asked + pd.to_timedelta(random_generator.gamma(3.0, 8.0, size=amount_questions).astype(int) + 1, unit='D')
+    question_ids = first_question_id + np.arange(amount_questions)
+
+    details_questions_term_df = pd.DataFrame({
+        'id': question_ids.astype(str),
+        'datum gesteld': asked.date,
+        'datum beantwoord': answered.date,
+        'minister': random_generator.choice(ministers, size=amount_questions),
+        'onderwerp': [f'[Vraag {question_id}](https://www.vlaamsparlement.be/nl/parlementair-werk/schriftelijke-vragen/{question_id})'
+                      for question_id in question_ids.tolist()],
+        'documenttype': 'Schriftelijke vraag',
+        'thema': random_generator.choice(themes, size=amount_questions),
+        'vraagsteller': [members[asker][0] for asker in askers.tolist()],
+        'vraagsteller_partij': [members[asker][1] for asker in askers.tolist()],
+        'termijn antwoord': (answered - asked).days.to_numpy(),
+    })
+    return details_questions_term_df.sort_values('datum gesteld', kind='stable', ignore_index=True)
+
+
+def generate_synthetic_data(members=124, parties=8, commissions=24, commission_size=16, meetings_per_week=6.0, years=5,
+                            present_rate=0.7, absent_rate=0.15, substitute_rate=0.3, questions_per_member_per_year=40,
+                            start_date=datetime.date(2019, 10, 1), seed=0):
+    """
+    Generate all datasets (see module docstring): {name: dataset}. The same seed gives the same data.
+    """
+    random_generator = np.random.default_rng(seed)
+    parlementsleden_all_dict, fracties_dict = generate_members(random_generator, members, parties)
+    commissions_overview_df = generate_commissions(random_generator, parlementsleden_all_dict, commissions, commission_size)
+    meetings_all_commissions_df = generate_meetings(random_generator, commissions_overview_df, parlementsleden_all_dict,
+                                                    start_date, years, meetings_per_week, present_rate, absent_rate,
+                                                    substitute_rate)
+    details_questions_term_df = generate_written_questions(random_generator, parlementsleden_all_dict, start_date, years,
+                                                           questions_per_member_per_year)
+    # The composition of the commissions does not change: a single observation, holding for all meetings
+    membership_intervals_df = membership_intervals.update_membership_intervals(
+        None, commissions_overview_df, meetings_all_commissions_df['Datum vergadering'].max(),
+        member_registry.MemberRegistry(parlementsleden_all_dict, fracties_dict))
+    return {'parlementsleden': parlementsleden_all_dict,
+            'fracties': fracties_dict,
+            'commissions_overview_df': commissions_overview_df,
+            'meetings_all_commissions_df': meetings_all_commissions_df,
+            'details_questions_term_df': details_questions_term_df,
+            'membership_intervals': membership_intervals_df}
+
+
+def save_synthetic_data(datasets, data_dir):
+    """
+    Write datasets of generate_synthetic_data() to data_dir, with the derived data of the update script
+    (fact table, monthly cube and Parquet files)
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    for name, dataset in datasets.items():
+        with open(os.path.join(data_dir, f'{name}.pkl'), 'wb') as file:
+            pickle.dump(dataset, file)
+    attendance_facts_df, attendance_members_df = attendance_facts.build_attendance_facts(
+        datasets['meetings_all_commissions_df'], datasets['commissions_overview_df'])
+    attendance_facts.save_attendance_facts(attendance_facts_df, attendance_members_df, data_dir)
+    attendance_cube.save_attendance_cube(attendance_cube.build_attendance_cube(attendance_facts_df), data_dir)
+    columnar_data.save_columnar_data(datasets['meetings_all_commissions_df'], datasets['commissions_overview_df'],
+                                     attendance_facts_df, attendance_members_df, data_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic parliament data (see synthetic_data.py).")
+    parser.add_argument("data_dir", help="folder to write the data to")
+    parser.add_argument("--members", type=int, default=124)
+    parser.add_argument("--parties", type=int, default=8)
+    parser.add_argument("--commissions", type=int, default=24)
+    parser.add_argument("--commission-size", type=int, default=16, help="amount of permanent members per commission")
+    parser.add_argument("--meetings-per-week", type=float, default=6.0)
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--present", type=float, default=0.7, help="average rate of permanent members present")
+    parser.add_argument("--absent", type=float, default=0.15, help="average rate of permanent members absent (remainder: excused)")
+    parser.add_argument("--substitutes", type=float, default=0.3, help="probability that a substitute replaces a member not present")
+    parser.add_argument("--questions", type=float, default=40, help="written questions per member per year")
+    parser.add_argument("--start-date", type=datetime.date.fromisoformat, default=datetime.date(2019, 10, 1))
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    datasets = generate_synthetic_data(arguments.members, arguments.parties, arguments.commissions, arguments.commission_size,
+                                       arguments.meetings_per_week, arguments.years, arguments.present, arguments.absent,
+                                       arguments.substitutes, arguments.questions, arguments.start_date, arguments.seed)
+    save_synthetic_data(datasets, arguments.data_dir)
+    print(f"{len(datasets['meetings_all_commissions_df'])} meetings of {len(datasets['commissions_overview_df'])} commissions, "
+          f"{len(datasets['parlementsleden'])} members and {len(datasets['details_questions_term_df'])} written questions "
+          f"written to {arguments.data_dir}")
@@ -0,0 +1,104 @@
+"""
+Warm up the result caches (see result_cache.py and shared_cache.py) right after the data has been loaded.
+
+Without warm-up, the first visitors after a deploy (or after the weekly data update) pay the full cost of
+filter_data() and the statistics of the default views. warm_up() computes the outputs of the attendance tabs for:
+    * the default selection of each tab (all commissions / all parties, over the full period)
+    * each individual commission (tabs per commission and per party), over the full period
+    * each party (tab per member), over the full period
+
+attendance_integrated.py starts the warm-up in a background thread once the application is loaded, so a gunicorn
+worker boots (and accepts requests) right away, well within the boot timeout of gunicorn, whatever the duration of
+the warm-up. When the data changes while running, the warm-up is repeated in a background thread as well.
+When the shared cache is used, the warm-up of a data version is claimed in it (see shared_cache.py): only the worker
+that obtained the claim computes the outputs (stored in the shared cache), the other workers skip the warm-up and
+read the outputs from the shared cache once they are stored. A claim that is not done after ATTENDANCE_WARM_UP_TIMEOUT
+seconds (default 600, e.g. because its worker died) is taken over by the next worker that starts a warm-up. The claim
+is keyed on the version of the data and of the application (see result_cache.cache_version()), so after a deploy the
+warm-up is repeated, whatever the claims kept in the shared cache.
+The written questions tab is not cached, and hence not warmed up.
+
+Disable through the environment variable ATTENDANCE_WARM_UP=0.
+"""
+import os
+import threading
+import time
+
+import attendance_data
+import attendance_permanent_members_per_comm_integrated
+import attendance_per_party_integrated
+import attendance_per_member_integrated
+import background_callbacks
+import result_cache
+
+
+warm_up_enabled = os.environ.get("ATTENDANCE_WARM_UP", "1") == "1"
+warm_up_timeout = float(os.environ.get("ATTENDANCE_WARM_UP_TIMEOUT", 600))
+
+# Outcome of the most recent warm-up
+warm_up_status = {"ready": False, "version": None, "selections": 0, "duration": None}
+_lock = threading.Lock()
+
+
+def warm_up_selections():
+    """
+    Obtain the selections to warm up: list of (update_display function, dropdown value, start date, end date)
+    """
+    meetings_all_commissions_df = attendance_data.get_meetings()
+    start_date = meetings_all_commissions_df["Datum vergadering"].min()
+    end_date = meetings_all_commissions_df["Datum vergadering"].max()
+    commissions = sorted(set(meetings_all_commissions_df["commissie.titel"]))
+    parties = list(attendance_data.get_fracties().keys())
+
+    selections = []
+    for tab in [attendance_permanent_members_per_comm_integrated, attendance_per_party_integrated]:
+        selections += [(tab.update_display, commission, start_date, end_date) for commission in ["Alle commissies"] + commissions]
+    selections += [(attendance_per_member_integrated.update_display, party, start_date, end_date) for party in ["Alle partijen"] + parties]
+    return selections
+
+
+def warm_up():
+    """
+    Compute (or obtain from the shared cache) the outputs of all warm-up selections, and log the duration
+    """
+    if not warm_up_enabled:
+        warm_up_status["ready"] = True
+        return warm_up_status
+    with _lock:
+        start = time.perf_counter()
+        version = attendance_data.data_version()
+        claim_version = result_cache.cache_version(version)
+        shared_cache = result_cache.get_shared_cache()
+        # Only one worker warms up a data version (of this application version): the others skip it
+        if shared_cache is not None and not shared_cache.claim("warm_up", claim_version, stale_after=warm_up_timeout):
+            is_done = shared_cache.is_done("warm_up", claim_version)
+            warm_up_status.update(ready=is_done, version=version, selections=0, duration=None)
+            print(f"Warm-up of data version {version} {'done' if is_done else 'in progress'} in another worker: "
+                  f"skipped (process {os.getpid()})")
+            return warm_up_status
+
+        try:
+            selections = warm_up_selections()
+            for update_display, value, start_date, end_date in selections:
+                update_display(background_callbacks.no_progress, value, start_date, end_date)
+        except BaseException:
+            if shared_cache is not None:
+                shared_cache.release("warm_up", claim_version, done=False)
+            raise
+        if shared_cache is not None:
+            shared_cache.release("warm_up", claim_version)
+        warm_up_status.update(ready=True, version=version, selections=len(selections),
+                              duration=time.perf_counter() - start)
+        print(f"Warm-up of {len(selections)} selections (data version {warm_up_status['version']}) "
+              f"done in {warm_up_status['duration']:.1f} s (process {os.getpid()})")
+    return warm_up_status
+
+
+def warm_up_in_background(version=None):
+    """
+    Run the warm-up in a background thread (used once the application is loaded, and when the data changed while running)
+    """
+    threading.Thread(target=warm_up, name=f"warm-up-{version}", daemon=True).start()
+
+
+attendance_data.data_change_listeners.append(warm_up_in_background)
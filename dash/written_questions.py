@@ -10,22 +10,19 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
-import pickle
-
-from attendance_statistics import get_party
+import attendance_data # shared data access layer
+from attendance_statistics import map_parties
 
 # =============================================================================
 # Reading in relevant support data
 # =============================================================================
 # Load df with written questions and information about parties
-written_questions_df = pd.read_pickle('../data/details_questions_term_df.pkl')
+# (loaded once per process and shared, see attendance_data.py). Only used to build the layout: the callback obtains
+# the questions and the parties from attendance_data, so it serves the new data after an update.
+written_questions_df = attendance_data.get_written_questions()
 # Create a default value for amount_meetings, i.e. relevant meetings
 amount_questions = len(written_questions_df)  # Set amount of all meetings as default, it will be updated in the callback
 
-# Load information about parties
-with open('../data/fracties.pkl', 'rb') as file:
-    fracties_dict = pickle.load(file)
-
 
 
 # Dictionary mapping parties to colors
@@ -404,9 +401,8 @@ def update_chart(selected_axis, written_questions_df_input):
         grouped_data = written_questions_df_input['vraagsteller'].value_counts().reset_index()
         grouped_data.columns = ['Parlementslid', 'Aantal vragen']
 
-        # Apply function to create a new column 'Partij' based on fracties_dict
-        grouped_data['Partij'] = grouped_data.apply(get_party, axis=1,
-                                                    facties_dict_input=fracties_dict)
+        # Create a new column 'Partij' based on the fracties dict (all members looked up at once in the member registry)
+        grouped_data['Partij'] = map_parties(grouped_data['Parlementslid'], attendance_data.get_fracties()).tolist()
 
         fig = px.bar(grouped_data,
                       # x='Parlementslid',
@@ -569,6 +565,38 @@ def update_chart(selected_axis, written_questions_df_input):
 
 
 
+def update_display(start_date, end_date, theme_filter, minister_filter, 
+                   selected_axis, selected_member):
+    # Check the version of the data first, so the questions are reloaded after an update of the data
+    attendance_data.data_version()
+    # Filter data based on user input
+    written_questions_filtered_df = filter_data(start_date, end_date,
+                                                theme_filter, minister_filter,
+                                                attendance_data.get_written_questions())
+    
+    # Create graph using user selected axis and filtered df
+    written_questions_graph = update_chart(selected_axis, 
+                                           written_questions_filtered_df)
+      
+    # # Create graph for answering term
+    # duration_answer_graph = answer_term_bar_chart(written_questions_filtered_df)
+    
+    # Check if the selected axis is 'vraagsteller' to update DataTable
+    if selected_axis == 'vraagsteller' and selected_member:
+        # Filter data for the selected member
+        selected_member_data = written_questions_filtered_df[written_questions_filtered_df['vraagsteller'] == selected_member][['datum gesteld', 'minister', 'onderwerp']]
+
+    else:
+        # If the selected axis is not 'vraagsteller', provide an empty DataFrame
+        selected_member_data = pd.DataFrame()
+     
+    return [f"Deze selectie resulteert in {len(written_questions_filtered_df)} relevante schriftelijke vragen.", # Use text formatting to allow easier build of layout
+            written_questions_graph,
+            # duration_answer_graph,
+            selected_member_data.to_dict('records'),
+            f"Dit parlementslid stelde {len(selected_member_data)} vragen."]
+
+
 #Create function to load app in integrated appraoch
 def register_callbacks(app):
     @app.callback(
@@ -584,34 +612,10 @@ def register_callbacks(app):
          Input('x-axis-dropdown', 'value'),
          Input('member-dropdown', 'value')]
         )
-    def update_display(start_date, end_date, theme_filter, minister_filter, 
-                       selected_axis, selected_member):
-        # Filter data based on user input
-        written_questions_filtered_df = filter_data(start_date, end_date,
-                                                    theme_filter, minister_filter,
-                                                    written_questions_df)
-        
-        # Create graph using user selected axis and filtered df
-        written_questions_graph = update_chart(selected_axis, 
-                                               written_questions_filtered_df)
-          
-        # # Create graph for answering term
-        # duration_answer_graph = answer_term_bar_chart(written_questions_filtered_df)
-        
-        # Check if the selected axis is 'vraagsteller' to update DataTable
-        if selected_axis == 'vraagsteller' and selected_member:
-            # Filter data for the selected member
-            selected_member_data = written_questions_filtered_df[written_questions_filtered_df['vraagsteller'] == selected_member][['datum gesteld', 'minister', 'onderwerp']]
-
-        else:
-            # If the selected axis is not 'vraagsteller', provide an empty DataFrame
-            selected_member_data = pd.DataFrame()
-         
-        return [f"Deze selectie resulteert in {len(written_questions_filtered_df)} relevante schriftelijke vragen.", # Use text formatting to allow easier build of layout
-                written_questions_graph,
-                # duration_answer_graph,
-                selected_member_data.to_dict('records'),
-                f"Dit parlementslid stelde {len(selected_member_data)} vragen."]
+    def update_display_callback(start_date, end_date, theme_filter, minister_filter, 
+                                selected_axis, selected_member):
+        return update_display(start_date, end_date, theme_filter, minister_filter, 
+                              selected_axis, selected_member)
 
 
 # =============================================================================